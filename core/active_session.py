@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from functools import wraps
+
+from .models import StudySession
+
+# Cached in place of None, which cannot be told apart from a cache miss
+NO_SESSION = False
+
+
+def _marker_key(user_id):
+  return f'active-study-session:{user_id}'
+
+
+def session_marker(session):
+  """Cacheable snapshot of an active session"""
+  return {
+    'id': session.id,
+    'subject': session.subject,
+    'color': session.color,
+    'start_time': session.start_time,
+  }
+
+
+def active_study_session(user_id):
+  """The user's active session marker or None; the partial index serves cache misses"""
+  if not settings.RESPONSE_CACHE_ENABLED:
+    session = StudySession.objects.filter(user_id=user_id, active=True).first()
+    return session_marker(session) if session else None
+
+  marker = cache.get(_marker_key(user_id))
+  if marker is None:
+    session = StudySession.objects.filter(user_id=user_id, active=True).first()
+    marker = session_marker(session) if session else NO_SESSION
+    cache.set(_marker_key(user_id), marker, settings.RESPONSE_CACHE_TIMEOUT)
+  return marker or None
+
+
+def remember_active_session(session):
+  """Cache a just started session once its transaction commits"""
+  transaction.on_commit(
+    lambda: cache.set(_marker_key(session.user_id), session_marker(session), settings.RESPONSE_CACHE_TIMEOUT)
+  )
+
+
+def forget_active_session(user_id):
+  """Drop the marker now and again after commit, like bump_generation"""
+  cache.delete(_marker_key(user_id))
+  transaction.on_commit(lambda: cache.delete(_marker_key(user_id)))
+
+
+def with_active_study_session(view):
+  """Set request.active_study_session (marker dict or None) before running the view"""
+  @wraps(view)
+  def wrapper(request, *args, **kwargs):
+    request.active_study_session = active_study_session(request.user.id)
+    return view(request, *args, **kwargs)
+  return wrapper
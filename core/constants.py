@@ -32,3 +32,6 @@ BACKGROUND_COLORS = {
   },
 }
 
+
+# Tags every user can pick from; seeded by migration 0016
+DEFAULT_TAGS = ["Work", "Health", "Creativity", "Study", "Exercise", "Hobby", "Chores"]
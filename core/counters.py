@@ -0,0 +1,56 @@
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import UserProfile, HabitLog, TaskLog, StudySession
+
+
+def adjust_counters(user, tasks_completed=0, habits_completed=0, hours_studied=0.0):
+  """Atomically adjust the all-time counters on the user's profile.
+
+  Uses F-expressions so concurrent requests cannot lose updates; counters
+  never drop below zero. Call inside the transaction that writes the log row.
+  """
+  updates = {}
+  if tasks_completed:
+    updates['all_time_tasks_completed'] = Greatest(F('all_time_tasks_completed') + tasks_completed, 0)
+  if habits_completed:
+    updates['all_time_habits_completed'] = Greatest(F('all_time_habits_completed') + habits_completed, 0)
+  if hours_studied:
+    updates['all_time_hours_studied'] = Greatest(F('all_time_hours_studied') + hours_studied, 0.0)
+  if updates:
+    UserProfile.objects.filter(user=user).update(**updates)
+
+
+def with_recounted_counters(profiles):
+  """Annotate profiles with the counters recomputed from full history"""
+  def scalar(queryset, user_path, aggregate):
+    return Coalesce(
+      Subquery(queryset.order_by().values(user_path).annotate(total=aggregate).values('total')[:1]),
+      0,
+    )
+
+  return profiles.annotate(
+    recount_tasks_completed=scalar(
+      TaskLog.objects.filter(user=OuterRef('user')), 'user', Count('id')
+    ),
+    recount_habits_completed=scalar(
+      HabitLog.objects.filter(user=OuterRef('user'), positive=True), 'user', Count('id')
+    ),
+    recount_study_minutes=scalar(
+      StudySession.objects.filter(user=OuterRef('user'), active=False), 'user', Sum('duration_minutes')
+    ),
+  )
+
+
+def counter_drift(profile):
+  """Fields whose stored value differs from an annotated recount: name -> correct value"""
+  drift = {}
+  if profile.all_time_tasks_completed != profile.recount_tasks_completed:
+    drift['all_time_tasks_completed'] = profile.recount_tasks_completed
+  if profile.all_time_habits_completed != profile.recount_habits_completed:
+    drift['all_time_habits_completed'] = profile.recount_habits_completed
+  hours = profile.recount_study_minutes / 60.0
+  # Float accumulation is fine as long as the displayed value is correct
+  if round(profile.all_time_hours_studied, 1) != round(hours, 1):
+    drift['all_time_hours_studied'] = hours
+  return drift
@@ -0,0 +1,105 @@
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from datetime import datetime, time, timezone as dt_timezone
+
+
+def _utc_day(expression):
+  return TruncDate(expression, tzinfo=dt_timezone.utc)
+
+
+def _in_range(queryset, field, start, end):
+  """Restrict to start <= date(field) < end (UTC days); None means unbounded"""
+  if start is not None:
+    queryset = queryset.filter(**{f'{field}__gte': datetime.combine(start, time.min, tzinfo=dt_timezone.utc)})
+  if end is not None:
+    queryset = queryset.filter(**{f'{field}__lt': datetime.combine(end, time.min, tzinfo=dt_timezone.utc)})
+  return queryset
+
+
+def study_minutes_by_day(sessions):
+  """Finished-session totals grouped in SQL: rows of day, subject, minutes, xp, coins"""
+  return sessions.filter(active=False).annotate(day=_utc_day('start_time')).values('day', 'subject').annotate(
+    minutes=Sum('duration_minutes'), xp=Sum('xp_earned'), coins=Sum('coins_earned')
+  ).order_by()
+
+
+def compute_daily_stats(user_id, start=None, end=None, apps=global_apps):
+  """DailyUserStats field values per day, recomputed from the logs: date -> fields"""
+  TaskLog = apps.get_model('core', 'TaskLog')
+  HabitLog = apps.get_model('core', 'HabitLog')
+  StudySession = apps.get_model('core', 'StudySession')
+  LevelLog = apps.get_model('core', 'LevelLog')
+
+  days = {}
+
+  def day_row(day):
+    return days.setdefault(day, {
+      'tasks_completed': 0,
+      'habits_positive': 0,
+      'habits_negative': 0,
+      'study_minutes': 0,
+      'subject_minutes': {},
+      'xp_earned': 0,
+      'coins_earned': 0,
+      'level_ups': 0,
+    })
+
+  task_days = _in_range(TaskLog.objects.filter(user_id=user_id), 'created_at', start, end).annotate(
+    day=_utc_day('created_at')
+  ).values('day').annotate(count=Count('id'), xp=Sum('xp_earned'), coins=Sum('coins_earned')).order_by()
+  for entry in task_days:
+    row = day_row(entry['day'])
+    row['tasks_completed'] += entry['count']
+    row['xp_earned'] += entry['xp'] or 0
+    row['coins_earned'] += entry['coins'] or 0
+
+  habit_days = _in_range(HabitLog.objects.filter(user_id=user_id), 'created_at', start, end).annotate(
+    day=_utc_day('created_at')
+  ).values('day', 'positive').annotate(count=Count('id'), xp=Sum('xp_earned'), coins=Sum('coins_earned')).order_by()
+  for entry in habit_days:
+    row = day_row(entry['day'])
+    row['habits_positive' if entry['positive'] else 'habits_negative'] += entry['count']
+    row['xp_earned'] += entry['xp'] or 0
+    row['coins_earned'] += entry['coins'] or 0
+
+  study_days = study_minutes_by_day(
+    _in_range(StudySession.objects.filter(user_id=user_id), 'start_time', start, end)
+  )
+  for entry in study_days:
+    row = day_row(entry['day'])
+    minutes = entry['minutes'] or 0
+    row['study_minutes'] += minutes
+    row['subject_minutes'][entry['subject']] = minutes
+    row['xp_earned'] += entry['xp'] or 0
+    row['coins_earned'] += entry['coins'] or 0
+
+  level_days = _in_range(LevelLog.objects.filter(user_id=user_id), 'created_at', start, end).annotate(
+    day=_utc_day('created_at')
+  ).values('day').annotate(count=Count('id')).order_by()
+  for entry in level_days:
+    row = day_row(entry['day'])
+    row['level_ups'] += entry['count']
+    # Every level up pays 10 coins
+    row['coins_earned'] += 10 * entry['count']
+
+  return days
+
+
+def rebuild_daily_stats(user_id, start=None, end=None, apps=global_apps):
+  """Replace a user's DailyUserStats rows (start <= date < end) with recomputed ones"""
+  DailyUserStats = apps.get_model('core', 'DailyUserStats')
+  days = compute_daily_stats(user_id, start, end, apps)
+
+  with transaction.atomic():
+    rows = DailyUserStats.objects.filter(user_id=user_id)
+    if start is not None:
+      rows = rows.filter(date__gte=start)
+    if end is not None:
+      rows = rows.filter(date__lt=end)
+    rows.delete()
+    DailyUserStats.objects.bulk_create(
+      DailyUserStats(user_id=user_id, date=day, **fields) for day, fields in days.items()
+    )
+  return len(days)
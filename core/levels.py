@@ -0,0 +1,42 @@
+"""Level/XP math.
+
+Reaching level L + 1 from level L costs (2L - 1) * 20 XP, so the total XP
+needed to reach level L from level 1 is 20 * (L - 1)^2. Every conversion
+below is O(1) no matter how many levels a grant spans.
+"""
+from math import isqrt
+
+XP_STEP = 20
+
+
+def xp_for_level(level):
+  """XP needed to go from `level` to the next level"""
+  return (2 * level - 1) * XP_STEP
+
+
+def total_xp(level, xp):
+  """Total XP earned since level 1 for a level and in-level xp"""
+  return XP_STEP * (level - 1) ** 2 + xp
+
+
+def level_for_total_xp(total):
+  """(level, in-level xp) for a total XP amount (negative totals count as 0)"""
+  total = max(0, total)
+  level = isqrt(total // XP_STEP) + 1
+  return level, total - XP_STEP * (level - 1) ** 2
+
+
+def normalize(level, xp):
+  """Carry xp overflow into levels; level is at least 1 and xp at least 0"""
+  return level_for_total_xp(total_xp(max(1, level), max(0, xp)))
+
+
+def add_xp(level, xp, amount):
+  """Apply an XP grant: in-level xp floors at 0, overflow levels up"""
+  return normalize(level, max(0, xp + amount))
+
+
+def remove_xp(level, xp, amount):
+  """Take XP away again: in-level xp floors at 0 and the level never drops,
+  since the level-up rewards are kept"""
+  return max(1, level), max(0, xp - amount)
@@ -0,0 +1,269 @@
+import json
+import time
+import tracemalloc
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from datetime import timedelta
+
+from ...models import (
+    Habit,
+    Task,
+    Tag,
+    HabitLog,
+    TaskLog,
+    StudySession,
+    StatSlot,
+    SubjectColor,
+)
+from ...daily_stats import rebuild_daily_stats, study_minutes_by_day
+
+
+def bench_username(prefix):
+  """A username that cannot clash with a real account (the run is rolled back anyway)"""
+  return f'{prefix}_{uuid.uuid4().hex[:12]}'
+
+
+def make_synthetic_user(username=None, habits=30, tasks=60, days=60):
+  """Create a user with a realistic amount of history"""
+  user = User.objects.create_user(username=username or bench_username('bench_user'), password='bench')
+  tags = [Tag.objects.get_or_create(name=name)[0] for name in ["Work", "Health", "Study"]]
+  now = timezone.now()
+
+  for i in range(habits):
+    habit = Habit.objects.create(user=user, title=f'Habit {i}', pos_count=i, neg_count=i % 4)
+    habit.tags.set(tags[:i % 3 + 1])
+    HabitLog.objects.bulk_create(HabitLog(user=user, habit=habit, positive=True) for _ in range(5))
+
+  for i in range(tasks):
+    task = Task.objects.create(
+      user=user,
+      title=f'Task {i}',
+      task_type='daily' if i % 3 == 0 else 'scheduled',
+      due=now + timedelta(days=i % 10 - 5),
+      streak=i % 12,
+    )
+    task.tags.set(tags[:i % 3 + 1])
+    TaskLog.objects.bulk_create(TaskLog(user=user, task=task, xp_earned=5) for _ in range(3))
+
+  sessions = []
+  for day in range(days):
+    for n in range(3):
+      sessions.append(StudySession(
+        user=user,
+        subject=f'Subject {n}',
+        duration_minutes=45,
+        end_time=now,
+        active=False,
+      ))
+  StudySession.objects.bulk_create(sessions)
+  # auto_now_add ignores explicit values, so spread start times afterwards
+  for index, session in enumerate(StudySession.objects.filter(user=user).order_by('id')):
+    StudySession.objects.filter(pk=session.pk).update(start_time=now - timedelta(days=index // 3, hours=index % 3))
+
+  StatSlot.objects.create(user=user, slot_number=1, stat_type='hours_studied')
+  StatSlot.objects.create(user=user, slot_number=2, stat_type='tasks_completed')
+  rebuild_daily_stats(user.id)
+  return user
+
+
+def measure_call(func, repeat):
+  """Average wall time (ms), query count and peak traced memory (KiB) of func()"""
+  tracemalloc.start()
+  try:
+    with CaptureQueriesContext(connection) as ctx:
+      func()
+    peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+  finally:
+    tracemalloc.stop()
+  queries = len(ctx.captured_queries)
+
+  start = time.perf_counter()
+  for _ in range(repeat):
+    func()
+  elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+  return elapsed_ms, queries, peak_kib
+
+
+def measure(client, urls, repeat):
+  """measure_call for fetching all urls once"""
+  def fetch():
+    for url in urls:
+      client.get(url)
+  return measure_call(fetch, repeat)
+
+
+# Uncached on both sides; otherwise repeats of the fan-out are cache hits
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+def bench_bootstrap(repeat):
+  """Dashboard load: /api/bootstrap/ vs the individual endpoints"""
+  user = make_synthetic_user()
+  client = Client()
+  client.force_login(user)
+
+  fan_out = [
+    '/api/profile/',
+    '/api/habits/',
+    '/api/tasks/',
+    '/api/tags/',
+    '/api/dailies/check',
+    '/api/habits/study/stop/',
+    '/api/recap/',
+    '/api/stats/slots/',
+    '/api/stats/value/?type=hours_studied',
+    '/api/stats/value/?type=tasks_completed',
+  ]
+  rows = [
+    (f'fan-out ({len(fan_out)} requests)', *measure(client, fan_out, repeat)),
+    ('bootstrap (1 request)', *measure(client, ['/api/bootstrap/'], repeat)),
+  ]
+  return rows
+
+
+def make_heavy_studier(username=None, sessions_per_day=20):
+  """A user with sessions_per_day finished study sessions on every day of last month"""
+  user = User.objects.create_user(username=username or bench_username('bench_studier'), password='bench')
+  month_start = (timezone.now().replace(day=1) - timedelta(days=1)).replace(
+    day=1, hour=6, minute=0, second=0, microsecond=0
+  )
+  days = ((month_start + timedelta(days=32)).replace(day=1) - month_start).days
+
+  StudySession.objects.bulk_create(
+    StudySession(user=user, subject=f'Subject {n % 6}', duration_minutes=25, end_time=month_start, active=False)
+    for _ in range(days)
+    for n in range(sessions_per_day)
+  )
+  # auto_now_add ignores explicit values, so spread start times afterwards
+  for index, pk in enumerate(StudySession.objects.filter(user=user).order_by('id').values_list('pk', flat=True)):
+    StudySession.objects.filter(pk=pk).update(
+      start_time=month_start + timedelta(days=index // sessions_per_day, minutes=30 * (index % sessions_per_day))
+    )
+  rebuild_daily_stats(user.id)
+  return user, month_start
+
+
+def bench_study_stats(repeat):
+  """Monthly study stats for 20 sessions/day: per-session rows vs grouped SQL vs rollup"""
+  user, month_start = make_heavy_studier()
+  month_end = (month_start + timedelta(days=32)).replace(day=1)
+  sessions = StudySession.objects.filter(
+    user=user, start_time__gte=month_start.replace(hour=0), start_time__lt=month_end.replace(hour=0), active=False
+  )
+
+  def per_session_rows():
+    # What the monthly view used to do: hydrate every session and sum in Python
+    by_day = {}
+    for session in sessions.all():
+      day = by_day.setdefault(session.start_time.date().isoformat(), {})
+      day[session.subject] = day.get(session.subject, 0) + (session.duration_minutes or 0) / 60.0
+    return by_day
+
+  def grouped_rows():
+    by_day = {}
+    for row in study_minutes_by_day(sessions):
+      by_day.setdefault(row['day'].isoformat(), {})[row['subject']] = (row['minutes'] or 0) / 60.0
+    return by_day
+
+  client = Client()
+  client.force_login(user)
+  return [
+    (f'per-session rows ({sessions.count()})', *measure_call(per_session_rows, repeat)),
+    ('TruncDate + Sum grouped rows', *measure_call(grouped_rows, repeat)),
+    ('endpoint (daily rollup rows)', *measure(client, ['/api/study/stats/?type=monthly&month_offset=-1'], repeat)),
+  ]
+
+
+def bench_subject_colors(repeat, subjects=30, renamed=10):
+  """Legend save with 30 subjects and 10 renames: per-row loop vs api_subject_colors"""
+  user = User.objects.create_user(username=bench_username('bench_painter'), password='bench')
+  now = timezone.now()
+  StudySession.objects.bulk_create(
+    StudySession(user=user, subject=f'A{n % subjects}', duration_minutes=25, end_time=now, active=False)
+    for n in range(subjects * 10)
+  )
+  SubjectColor.objects.bulk_create(
+    SubjectColor(user=user, subject=f'A{n}', color=f'#0000{n:02x}', year=now.year, month=now.month)
+    for n in range(subjects)
+  )
+
+  def toggled_payload(state):
+    # Rename the first subjects back and forth so every call has work to do
+    old, new = ('A', 'B') if state['flip'] else ('B', 'A')
+    state['flip'] = not state['flip']
+    names = {n: (f'{new}{n}' if n < renamed else f'A{n}') for n in range(subjects)}
+    return (
+      {names[n]: f'#0000{n:02x}' for n in range(subjects)},
+      {f'{new}{n}': f'{old}{n}' for n in range(renamed)},
+    )
+
+  legacy_state = {'flip': True}
+
+  def per_row_loop():
+    # What the POST branch used to do: two UPDATEs per rename, one upsert per subject
+    legend, renames = toggled_payload(legacy_state)
+    for new_name, old_name in renames.items():
+      StudySession.objects.filter(
+        user=user, subject=old_name, start_time__year=now.year, start_time__month=now.month
+      ).update(subject=new_name)
+      SubjectColor.objects.filter(user=user, subject=old_name, year=now.year, month=now.month).update(subject=new_name)
+    for subject, color in legend.items():
+      SubjectColor.objects.update_or_create(
+        user=user, subject=subject, year=now.year, month=now.month, defaults={'color': color}
+      )
+    SubjectColor.objects.filter(user=user, year=now.year, month=now.month).exclude(subject__in=set(legend)).delete()
+
+  client = Client()
+  client.force_login(user)
+  endpoint_state = {'flip': True}
+
+  def endpoint():
+    legend, renames = toggled_payload(endpoint_state)
+    client.post(
+      '/api/study/colors',
+      json.dumps({'color_legend': legend, 'subject_renames': renames}),
+      content_type='application/json',
+    )
+
+  rows = [(f'per-row loop ({subjects} subjects)', *measure_call(per_row_loop, repeat))]
+  # Start the endpoint from the same names
+  if not legacy_state['flip']:
+    per_row_loop()
+  rows.append(('endpoint (CASE update + upsert)', *measure_call(endpoint, repeat)))
+  return rows
+
+
+BENCHMARKS = {
+  'bootstrap': bench_bootstrap,
+  'study_stats': bench_study_stats,
+  'subject_colors': bench_subject_colors,
+}
+
+
+class Command(BaseCommand):
+  help = 'Benchmark hot API paths against a synthetic user (all data is rolled back)'
+
+  def add_arguments(self, parser):
+    parser.add_argument('benchmarks', nargs='*', help=f'Benchmarks to run: {", ".join(sorted(BENCHMARKS))} (default: all)')
+    parser.add_argument('--repeat', type=int, default=20, help='Iterations per measurement')
+
+  def handle(self, *args, **options):
+    names = options['benchmarks'] or sorted(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+      raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+    setup_test_environment()
+    try:
+      for name in names:
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {BENCHMARKS[name].__doc__}'))
+        with transaction.atomic():
+          rows = BENCHMARKS[name](options['repeat'])
+          transaction.set_rollback(True)
+        for label, elapsed_ms, queries, peak_kib in rows:
+          self.stdout.write(f'  {label:<32} {elapsed_ms:9.2f} ms  {queries:5d} queries  {peak_kib:9.1f} KiB peak')
+    finally:
+      teardown_test_environment()
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...daily_stats import rebuild_daily_stats
+from ...models import WeeklyRecap
+
+
+class Command(BaseCommand):
+  help = 'Rebuild the DailyUserStats rollup from the activity logs'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--user', help='Only rebuild this username')
+    parser.add_argument('--batch-size', type=int, default=500, help='Users per batch')
+
+  def handle(self, *args, **options):
+    users = User.objects.order_by('pk')
+    if options['user']:
+      users = users.filter(username=options['user'])
+      if not users.exists():
+        raise CommandError(f"Unknown user {options['user']}")
+
+    user_count = day_count = 0
+    last_pk = 0
+    while True:
+      batch = list(users.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['batch_size']])
+      if not batch:
+        break
+      last_pk = batch[-1]
+      for user_id in batch:
+        day_count += rebuild_daily_stats(user_id)
+        # Recap snapshots were computed from the old rows
+        WeeklyRecap.objects.filter(user_id=user_id).delete()
+        user_count += 1
+
+    self.stdout.write(self.style.SUCCESS(f'Rebuilt {day_count} days of stats for {user_count} users'))
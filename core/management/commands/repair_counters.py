@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...counters import counter_drift, with_recounted_counters
+from ...models import UserProfile
+
+
+class Command(BaseCommand):
+  help = 'Verify the all-time profile counters against the logs and repair any drift'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--check', action='store_true', help='Only report drift, do not write')
+    parser.add_argument('--batch-size', type=int, default=500, help='Profiles per batch')
+
+  def handle(self, *args, **options):
+    batch_size = options['batch_size']
+    profiles = with_recounted_counters(UserProfile.objects.select_related('user').order_by('pk'))
+
+    checked = drifted = 0
+    last_pk = 0
+    while True:
+      batch = list(profiles.filter(pk__gt=last_pk)[:batch_size])
+      if not batch:
+        break
+      last_pk = batch[-1].pk
+
+      with transaction.atomic():
+        for profile in batch:
+          checked += 1
+          drift = counter_drift(profile)
+          if not drift:
+            continue
+          drifted += 1
+          self.stdout.write(f'{profile.user.username}: ' + ', '.join(
+            f'{field} {getattr(profile, field)} -> {value}' for field, value in drift.items()
+          ))
+          if not options['check']:
+            UserProfile.objects.filter(pk=profile.pk).update(**drift)
+
+    action = 'found' if options['check'] else 'repaired'
+    self.stdout.write(self.style.SUCCESS(f'Checked {checked} profiles, {action} drift on {drifted}'))
@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from ...rollover import roll_over_dailies
+
+
+def roll_over_range(first_id, last_id, batch_size, now):
+  """Roll over every not yet processed user with first_id <= id <= last_id"""
+  users = User.objects.filter(pk__gte=first_id, pk__lte=last_id).exclude(
+    userprofile__rolled_over_through__gte=now.date()
+  ).only('id').order_by('pk')
+
+  processed = missed_total = overdue_total = 0
+  last_pk = first_id - 1
+  while True:
+    batch = list(users.filter(pk__gt=last_pk)[:batch_size])
+    if not batch:
+      break
+    last_pk = batch[-1].pk
+    for user in batch:
+      missed, overdue = roll_over_dailies(user, now)
+      processed += 1
+      missed_total += missed
+      overdue_total += overdue
+  return processed, missed_total, overdue_total
+
+
+def split_range(first_id, last_id, parts):
+  """Split [first_id, last_id] into at most `parts` contiguous id ranges"""
+  size = max(1, -(-(last_id - first_id + 1) // parts))
+  return [(start, min(start + size - 1, last_id)) for start in range(first_id, last_id + 1, size)]
+
+
+class Command(BaseCommand):
+  help = 'Apply the daily rollover (penalties, daily and habit resets) for every user'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--batch-size', type=int, default=500, help='Users per batch')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes, each taking a user-id range')
+
+  def handle(self, *args, **options):
+    batch_size = options['batch_size']
+    workers = options['workers']
+    if batch_size < 1 or workers < 1:
+      raise CommandError('--batch-size and --workers must be at least 1')
+
+    now = timezone.now()
+    bounds = User.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+      self.stdout.write('No users to roll over')
+      return
+
+    if workers == 1:
+      results = [roll_over_range(bounds['first'], bounds['last'], batch_size, now)]
+    else:
+      # Forked workers must not share the parent's database connections
+      connections.close_all()
+      ranges = split_range(bounds['first'], bounds['last'], workers)
+      with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(roll_over_range, first, last, batch_size, now) for first, last in ranges]
+        results = [future.result() for future in futures]
+
+    processed, missed, overdue = (sum(column) for column in zip(*results))
+    self.stdout.write(self.style.SUCCESS(
+      f'Rolled over {processed} users for {now.date()} '
+      f'({missed} missed dailies, {overdue} overdue tasks)'
+    ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_shopitem_created_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="habits_next_reset_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
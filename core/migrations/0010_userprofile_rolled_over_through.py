@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_userprofile_habits_next_reset_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="rolled_over_through",
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
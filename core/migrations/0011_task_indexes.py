@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_userprofile_rolled_over_through"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(fields=["user", "task_type", "last_completed"], name="core_task_user_id_9612a3_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(fields=["user", "task_type", "completed", "due"], name="core_task_user_id_408b56_idx"),
+        ),
+    ]
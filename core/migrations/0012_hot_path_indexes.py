@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_task_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="habitlog",
+            index=models.Index(fields=["habit", "created_at"], name="core_habitl_habit_i_615a88_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="levellog",
+            index=models.Index(fields=["user", "created_at"], name="core_levell_user_id_c2b572_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="shopitem",
+            index=models.Index(fields=["item_type", "active"], name="core_shopit_item_ty_d68b42_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="studysession",
+            index=models.Index(fields=["user", "active"], name="core_studys_user_id_55a655_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="studysession",
+            index=models.Index(fields=["user", "start_time"], name="core_studys_user_id_8d9b09_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="studysession",
+            index=models.Index(condition=models.Q(("active", True)), fields=["user"], name="core_session_active_user_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="tasklog",
+            index=models.Index(fields=["task", "created_at"], name="core_tasklo_task_id_4588d5_idx"),
+        ),
+    ]
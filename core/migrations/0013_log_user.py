@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_log_users(apps, schema_editor):
+    Habit = apps.get_model("core", "Habit")
+    Task = apps.get_model("core", "Task")
+    HabitLog = apps.get_model("core", "HabitLog")
+    TaskLog = apps.get_model("core", "TaskLog")
+    HabitLog.objects.filter(user__isnull=True).update(
+        user=Subquery(Habit.objects.filter(pk=OuterRef("habit")).values("user")[:1])
+    )
+    TaskLog.objects.filter(user__isnull=True).update(
+        user=Subquery(Task.objects.filter(pk=OuterRef("task")).values("user")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_hot_path_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="habitlog",
+            name="user",
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name="tasklog",
+            name="user",
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_log_users, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="habitlog",
+            name="user",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name="tasklog",
+            name="user",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name="habitlog",
+            name="habit",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to="core.habit"),
+        ),
+        migrations.AlterField(
+            model_name="tasklog",
+            name="task",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to="core.task"),
+        ),
+        migrations.AddIndex(
+            model_name="habitlog",
+            index=models.Index(fields=["user", "created_at"], name="core_habitl_user_id_330e2f_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="tasklog",
+            index=models.Index(fields=["user", "created_at"], name="core_tasklo_user_id_5cd7b9_idx"),
+        ),
+    ]
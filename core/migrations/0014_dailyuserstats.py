@@ -0,0 +1,128 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:17
+
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def utc_day(field):
+    return TruncDate(field, tzinfo=dt_timezone.utc)
+
+
+def build_daily_stats(apps, schema_editor):
+    """Backfill DailyUserStats from the logs (frozen copy of core.daily_stats)"""
+    TaskLog = apps.get_model("core", "TaskLog")
+    HabitLog = apps.get_model("core", "HabitLog")
+    StudySession = apps.get_model("core", "StudySession")
+    LevelLog = apps.get_model("core", "LevelLog")
+    DailyUserStats = apps.get_model("core", "DailyUserStats")
+
+    days = {}
+
+    def day_row(user_id, day):
+        return days.setdefault((user_id, day), {
+            "tasks_completed": 0,
+            "habits_positive": 0,
+            "habits_negative": 0,
+            "study_minutes": 0,
+            "subject_minutes": {},
+            "xp_earned": 0,
+            "coins_earned": 0,
+            "level_ups": 0,
+        })
+
+    task_days = TaskLog.objects.annotate(day=utc_day("created_at")).values("user_id", "day").annotate(
+        count=Count("id"), xp=Sum("xp_earned"), coins=Sum("coins_earned")
+    ).order_by()
+    for entry in task_days:
+        row = day_row(entry["user_id"], entry["day"])
+        row["tasks_completed"] += entry["count"]
+        row["xp_earned"] += entry["xp"] or 0
+        row["coins_earned"] += entry["coins"] or 0
+
+    habit_days = HabitLog.objects.annotate(day=utc_day("created_at")).values("user_id", "day", "positive").annotate(
+        count=Count("id"), xp=Sum("xp_earned"), coins=Sum("coins_earned")
+    ).order_by()
+    for entry in habit_days:
+        row = day_row(entry["user_id"], entry["day"])
+        row["habits_positive" if entry["positive"] else "habits_negative"] += entry["count"]
+        row["xp_earned"] += entry["xp"] or 0
+        row["coins_earned"] += entry["coins"] or 0
+
+    study_days = StudySession.objects.filter(active=False).annotate(day=utc_day("start_time")).values(
+        "user_id", "day", "subject"
+    ).annotate(minutes=Sum("duration_minutes"), xp=Sum("xp_earned"), coins=Sum("coins_earned")).order_by()
+    for entry in study_days:
+        row = day_row(entry["user_id"], entry["day"])
+        minutes = entry["minutes"] or 0
+        row["study_minutes"] += minutes
+        row["subject_minutes"][entry["subject"]] = minutes
+        row["xp_earned"] += entry["xp"] or 0
+        row["coins_earned"] += entry["coins"] or 0
+
+    level_days = LevelLog.objects.annotate(day=utc_day("created_at")).values("user_id", "day").annotate(
+        count=Count("id")
+    ).order_by()
+    for entry in level_days:
+        row = day_row(entry["user_id"], entry["day"])
+        row["level_ups"] += entry["count"]
+        row["coins_earned"] += 10 * entry["count"]
+
+    DailyUserStats.objects.bulk_create(
+        DailyUserStats(user_id=user_id, date=day, **fields) for (user_id, day), fields in days.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_log_user"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="habitlog",
+            name="coins_earned",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="habitlog",
+            name="xp_earned",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="studysession",
+            name="coins_earned",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="studysession",
+            name="xp_earned",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="DailyUserStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField()),
+                ("tasks_completed", models.IntegerField(default=0)),
+                ("habits_positive", models.IntegerField(default=0)),
+                ("habits_negative", models.IntegerField(default=0)),
+                ("study_minutes", models.IntegerField(default=0)),
+                ("subject_minutes", models.JSONField(default=dict)),
+                ("xp_earned", models.IntegerField(default=0)),
+                ("coins_earned", models.IntegerField(default=0)),
+                ("level_ups", models.IntegerField(default=0)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "unique_together": {("user", "date")},
+            },
+        ),
+        migrations.RunPython(build_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:05
+
+from django.db import migrations
+
+DEFAULT_TAGS = ["Work", "Health", "Creativity", "Study", "Exercise", "Hobby", "Chores"]
+
+
+def seed_default_tags(apps, schema_editor):
+    Tag = apps.get_model("core", "Tag")
+    Tag.objects.bulk_create([Tag(name=name) for name in DEFAULT_TAGS], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_weeklyrecap"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_default_tags, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 
 # Create your models here.
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone as dt_timezone
 import json
 
+from . import levels
+
 class UserProfile(models.Model):
   """User profile with stats"""
   user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -37,37 +39,59 @@ class UserProfile(models.Model):
   all_time_coins_earned = models.IntegerField(default=0)
   highest_level_ever = models.IntegerField(default=1)
 
+  # Earliest moment any habit counter is due for a reset (None = recompute)
+  habits_next_reset_at = models.DateTimeField(null=True, blank=True)
+  # Last day the daily rollover (penalties and resets) was applied for
+  rolled_over_through = models.DateField(null=True, blank=True)
+
+  def save(self, *args, **kwargs):
+    pending_level_logs = getattr(self, '_pending_level_logs', None)
+    if not pending_level_logs:
+      super().save(*args, **kwargs)
+      return
+
+    # Level-up logs queued by add_xp are written with the profile, in one INSERT
+    with transaction.atomic():
+      super().save(*args, **kwargs)
+      LevelLog.objects.bulk_create(pending_level_logs)
+    self._pending_level_logs = []
+
+  @property
+  def pending_level_ups(self):
+    """Level ups queued by add_xp that the next save() will log"""
+    return len(getattr(self, '_pending_level_logs', ()))
+
 
   def calculate_xp_for_lvl(self):
     """Calculate xp needed for next level"""
-    return int(((self.level - 1) + self.level) * 20)
+    return levels.xp_for_level(self.level)
   
   def add_xp(self, amount):
     """Add xp and check for lvl up"""
-    self.xp = max(0, self.xp + amount)
-    leveled_up = False
-    xp_needed = self.calculate_xp_for_lvl()
-    self.max_xp = xp_needed
+    previous_level = self.level
+    self.level, self.xp = levels.add_xp(self.level, self.xp, amount)
+    self.max_xp = self.calculate_xp_for_lvl()
 
     # Handle multiple level-ups when large XP is awarded.
-    while self.xp >= xp_needed:
-      self.level += 1
-      self.xp -= xp_needed
-      xp_needed = self.calculate_xp_for_lvl()
-      self.max_xp = xp_needed
-
-      self.hp = self.max_hp
-      self.coins += 10
-      self.all_time_coins_earned += 10
-
-      if self.level > self.highest_level_ever:
-        self.highest_level_ever = self.level
-
-      # Log each level up
-      LevelLog.objects.create(user=self.user, level=self.level)
-      leveled_up = True
-
-    return leveled_up
+    levels_gained = self.level - previous_level
+    if levels_gained <= 0:
+      return False
+
+    self.hp = self.max_hp
+    self.coins += 10 * levels_gained
+    self.all_time_coins_earned += 10 * levels_gained
+
+    if self.level > self.highest_level_ever:
+      self.highest_level_ever = self.level
+
+    # Queue one log per level up; save() writes them in a single bulk_create
+    if not hasattr(self, '_pending_level_logs'):
+      self._pending_level_logs = []
+    self._pending_level_logs.extend(
+      LevelLog(user=self.user, level=level)
+      for level in range(previous_level + 1, self.level + 1)
+    )
+    return True
   
   def lose_health(self, amount):
     """Lose health, check for lvl loss"""
@@ -94,6 +118,106 @@ class Tag(models.Model):
   def __str__(self):
     return self.name
   
+# Red: rgb (180, 40, 40), Blue: rgb (35, 150, 180)
+# Use HSL interpolation for smoother gradient
+def _rgb_to_hsl(r, g, b):
+  """Convert RGB to HSL"""
+  r, g, b = r / 255.0, g / 255.0, b / 255.0
+  max_val = max(r, g, b)
+  min_val = min(r, g, b)
+  diff = max_val - min_val
+  l = (max_val + min_val) / 2.0
+
+  if diff == 0:
+    h = s = 0
+  else:
+    s = diff / (2.0 - max_val - min_val) if l > 0.5 else diff / (max_val + min_val)
+
+    if max_val == r:
+      h = ((g - b) / diff + (6 if g < b else 0)) / 6.0
+    elif max_val == g:
+      h = ((b - r) / diff + 2) / 6.0
+    else:
+      h = ((r - g) /diff + 4) / 6.0
+
+  return h, s, l
+
+def _hue_to_rgb(p, q, t):
+  if t < 0: t += 1
+  if t > 1: t -= 1
+  if t < 1/6: return p + (q - p) * 6 * t
+  if t < 1/2: return q
+  if t < 2/3: return p + (q - p) * (2/3 - t) * 6
+  return p
+
+def _hsl_to_rgb(h, s, l):
+  """Convert HSL to RGB"""
+  if s == 0:
+    r = g= b = 1
+  else:
+    q = l * (1 + s) if l < 0.5 else l + s - l * s
+    p = 2 * l - q
+    r = _hue_to_rgb(p, q, h + 1/3)
+    g = _hue_to_rgb(p, q, h)
+    b = _hue_to_rgb(p, q, h - 1/3)
+
+  return int(r * 255), int(g * 255), int(b * 255)
+
+def _interpolate_hsl(color1, color2, t):
+  """Interpolate between two hex colors in HSL space"""
+  r1, g1, b1 = int(color1[1:3], 16), int(color1[3:5], 16), int(color1[5:7], 16)
+  r2, g2, b2 = int(color2[1:3], 16), int(color2[3:5], 16), int(color2[5:7], 16)
+
+  h1, s1, l1 = _rgb_to_hsl(r1, g1, b1)
+  h2, s2, l2 = _rgb_to_hsl(r2, g2, b2)
+
+  # Handle hue wrap-around
+  if abs(h2 - h1) > 0.5:
+    if h1 > h2:
+      h2 += 1.0
+    else:
+      h1 += 1.0
+
+  h = (h1 + (h2 - h1) * t) % 1.0
+  s = s1 + (s2 - s1) * t
+  l = l1 + (l2 - l1) * t
+
+  r, g, b = _hsl_to_rgb(h, s, l)
+  return f'#{r:02x}{g:02x}{b:02x}'
+
+def habit_gradient_color(ratio):
+  """Exact habit color for a positive ratio in [0, 1]"""
+  #Map ratio to gradient segments
+  if ratio <= 0.33:
+    # Red to Orange (0.0 to 0.33)
+    t = ratio / 0.33
+    return _interpolate_hsl('#b42828', '#d2642d', t)
+  elif ratio <= 0.50:
+    # Orange to Cyan
+    t = (ratio - 0.33) / 0.17
+    return _interpolate_hsl('#d2642d', '#44b8c7', t)
+  else:
+    # Cyan to Blue
+    t = (ratio - 0.50) / 0.50
+    return _interpolate_hsl('#44b8c7', '#2396b4', t)
+
+# Habit colors precomputed once per quantized ratio step
+HABIT_COLOR_STEPS = 1000
+HABIT_COLOR_TABLE = tuple(
+  habit_gradient_color(i / HABIT_COLOR_STEPS) for i in range(HABIT_COLOR_STEPS + 1)
+)
+
+class HabitQuerySet(models.QuerySet):
+  """Database-side versions of Habit.strong() / Habit.weak()"""
+
+  # With non-negative counters the zero cases fold into the comparisons:
+  # neg_count == 0 -> strong iff pos_count > 0, pos_count == 0 -> weak iff neg_count > 0
+  def strong(self):
+    return self.filter(pos_count__gt=models.F('neg_count') * 3)
+
+  def weak(self):
+    return self.filter(neg_count__gt=models.F('pos_count'))
+
 class Habit(models.Model):
   """Habits (tracked negative/postive/both)"""
   DIFF_CHOICES = [
@@ -110,6 +234,13 @@ class Habit(models.Model):
     ('never', 'Never'),
   ]
 
+  # Days after last_reset at which counters are reset
+  RESET_PERIOD_DAYS = {
+    'daily': 1,
+    'weekly': 7,
+    'monthly': 30,
+  }
+
   user = models.ForeignKey(User, on_delete=models.CASCADE)
   title = models.CharField(max_length=100)
   details = models.TextField(blank=True)
@@ -125,94 +256,15 @@ class Habit(models.Model):
   last_reset = models.DateTimeField(auto_now_add=True)
   created_at = models.DateTimeField(auto_now_add=True)
 
+  objects = HabitQuerySet.as_manager()
+
   def get_color(self):
     """Color based on pos/neg ratio (red-blue)"""
     total = self.pos_count + self.neg_count
     if total == 0:
       return '#d2642d' # Color for no activity
-    
-    ratio = self.pos_count / total if total > 0 else 0
-
-    # Red: rgb (180, 40, 40), Blue: rgb (35, 150, 180)
-    #Use HSL interpolation for smoother gradient
-    def rgb_to_hsl(r, g, b):
-      """Convert RGB to HSL"""
-      r, g, b = r / 255.0, g / 255.0, b / 255.0
-      max_val = max(r, g, b)
-      min_val = min(r, g, b)
-      diff = max_val - min_val
-      l = (max_val + min_val) / 2.0
-
-      if diff == 0:
-        h = s = 0
-      else:
-        s = diff / (2.0 - max_val - min_val) if l > 0.5 else diff / (max_val + min_val)
-
-        if max_val == r:
-          h = ((g - b) / diff + (6 if g < b else 0)) / 6.0
-        elif max_val == g:
-          h = ((b - r) / diff + 2) / 6.0
-        else:
-          h = ((r - g) /diff + 4) / 6.0
 
-      return h, s, l
-    
-    def hsl_to_rgb(h, s, l):
-      """Convert HSL to RGB"""
-      if s == 0:
-        r = g= b = 1
-      else:
-        def hue_to_rgb(p, q, t):
-          if t < 0: t += 1
-          if t > 1: t -= 1
-          if t < 1/6: return p + (q - p) * 6 * t
-          if t < 1/2: return q
-          if t < 2/3: return p + (q - p) * (2/3 - t) * 6
-          return p
-
-        q = l * (1 + s) if l < 0.5 else l + s - l * s
-        p = 2 * l - q
-        r = hue_to_rgb(p, q, h + 1/3)
-        g = hue_to_rgb(p, q, h)
-        b = hue_to_rgb(p, q, h - 1/3)
-
-      return int(r * 255), int(g * 255), int(b * 255)
-
-    def interpolate_hsl(color1, color2, t):
-      """Interpolate between two hex colors in HSL space"""
-      r1, g1, b1 = int(color1[1:3], 16), int(color1[3:5], 16), int(color1[5:7], 16)
-      r2, g2, b2 = int(color2[1:3], 16), int(color2[3:5], 16), int(color2[5:7], 16)
-
-      h1, s1, l1 = rgb_to_hsl(r1, g1, b1)
-      h2, s2, l2 = rgb_to_hsl(r2, g2, b2)
-
-      # Handle hue wrap-around
-      if abs(h2 - h1) > 0.5:
-        if h1 > h2:
-          h2 += 1.0
-        else:
-          h1 += 1.0
-
-      h = (h1 + (h2 - h1) * t) % 1.0
-      s = s1 + (s2 - s1) * t
-      l = l1 + (l2 - l1) * t
-
-      r, g, b = hsl_to_rgb(h, s, l)
-      return f'#{r:02x}{g:02x}{b:02x}'
-
-    #Map ratio to gradient segments
-    if ratio <= 0.33:
-      # Red to Orange (0.0 to 0.33)
-      t = ratio / 0.33
-      return interpolate_hsl('#b42828', '#d2642d', t)
-    elif ratio <= 0.50:
-      # Orange to Cyan
-      t = (ratio - 0.33) / 0.17
-      return interpolate_hsl('#d2642d', '#44b8c7', t)
-    else:
-      # Cyan to Blue
-      t = (ratio - 0.50) / 0.50
-      return interpolate_hsl('#44b8c7', '#2396b4', t)
+    return HABIT_COLOR_TABLE[round(self.pos_count / total * HABIT_COLOR_STEPS)]
     
   def strong(self):
     """Check if habit is strong (pos_count / neg_count > 3)"""
@@ -228,25 +280,22 @@ class Habit(models.Model):
   
   def incr_neg(self):
     """Increment negative counter"""
-    self.neg_count += 1
-    self.save()
+    Habit.objects.filter(pk=self.pk).update(neg_count=models.F('neg_count') + 1)
+    self.refresh_from_db(fields=['neg_count'])
 
   def incr_pos(self):
     """Increment positive counter"""
-    self.pos_count += 1
-    self.save()
+    Habit.objects.filter(pk=self.pk).update(pos_count=models.F('pos_count') + 1)
+    self.refresh_from_db(fields=['pos_count'])
 
   def reset_counters(self):
     """Reset counters on set frequency"""
     now = timezone.now()
     reset = False
 
-    if self.reset_freq == 'daily':
-      reset = (now - self.last_reset).days >= 1
-    elif self.reset_freq == 'weekly':
-      reset = (now - self.last_reset).days >= 7
-    elif self.reset_freq == 'monthly':
-      reset = (now - self.last_reset).days >= 30
+    period_days = self.RESET_PERIOD_DAYS.get(self.reset_freq)
+    if period_days is not None:
+      reset = (now - self.last_reset).days >= period_days
     
     if reset:
       self.pos_count = 0
@@ -344,7 +393,18 @@ class Task(models.Model):
     if self.task_type == 'scheduled' and self.due:
       return timezone.now() > self.due and not self.completed
     return False
+
+  class Meta:
+    indexes = [
+      # Pending dailies (by last completion) and yesterday's overdue tasks
+      models.Index(fields=['user', 'task_type', 'last_completed']),
+      models.Index(fields=['user', 'task_type', 'completed', 'due']),
+    ]
   
+def previous_month(year, month):
+  """(year, month) of the month before"""
+  return (year, month - 1) if month > 1 else (year - 1, 12)
+
 class SubjectColor(models.Model):
   """Monthly color assignments for subjects"""
   user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -359,6 +419,26 @@ class SubjectColor(models.Model):
     indexes = [
       models.Index(fields=['user', 'year', 'month']),]
 
+  @classmethod
+  def legend_for(cls, user, year, month):
+    """The month's subject -> color legend, in creation order"""
+    return dict(cls.objects.filter(
+      user=user, year=year, month=month
+    ).order_by('id').values_list('subject', 'color'))
+
+  @classmethod
+  def carry_over(cls, user, year, month, legend, previous):
+    """Copy `previous` subjects missing from this month's `legend` with one INSERT.
+
+    Returns the merged legend and the number of subjects carried over.
+    """
+    carried = {subject: color for subject, color in previous.items() if subject not in legend}
+    cls.objects.bulk_create([
+      cls(user=user, subject=subject, color=color, year=year, month=month)
+      for subject, color in carried.items()
+    ], ignore_conflicts=True)
+    return {**legend, **carried}, len(carried)
+
 class StudySession(models.Model):
   """Study sessions with subject and duration tracking"""
   MAX_DURATION_MINUTES = 12 * 60
@@ -369,6 +449,8 @@ class StudySession(models.Model):
   end_time = models.DateTimeField(null=True, blank=True)
   duration_minutes = models.IntegerField(null=True, blank=True)
   active = models.BooleanField(default=True)
+  xp_earned = models.IntegerField(default=0)
+  coins_earned = models.IntegerField(default=0)
 
   def stop(self):
     """Stop the study session and calculate duration"""
@@ -380,30 +462,145 @@ class StudySession(models.Model):
       duration_minutes = max(0, min(duration_minutes, self.MAX_DURATION_MINUTES))
       self.duration_minutes = duration_minutes
       self.active = False
-      self.save()
+      self.save(update_fields=['end_time', 'duration_minutes', 'active'])
       return self.duration_minutes
     return 0
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['user', 'active']),
+      models.Index(fields=['user', 'start_time']),
+      # At most one active session per user, so this stays tiny
+      models.Index(fields=['user'], condition=models.Q(active=True), name='core_session_active_user_idx'),
+    ]
   
 
 class HabitLog(models.Model):
   """Log entries for habit completions"""
-  habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
+  # Owner stored directly so per-user counts need no join; the log outlives its habit
+  user = models.ForeignKey(User, on_delete=models.CASCADE)
+  habit = models.ForeignKey(Habit, on_delete=models.SET_NULL, null=True, blank=True)
   positive = models.BooleanField()
   created_at = models.DateTimeField(auto_now_add=True)
+  xp_earned = models.IntegerField(default=0)
+  coins_earned = models.IntegerField(default=0)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['habit', 'created_at']),
+      models.Index(fields=['user', 'created_at']),
+    ]
 
 class TaskLog(models.Model):
   """Log entries for task completions"""
-  task = models.ForeignKey(Task, on_delete=models.CASCADE)
+  # Owner stored directly so per-user counts need no join; the log outlives its task
+  user = models.ForeignKey(User, on_delete=models.CASCADE)
+  task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True)
   created_at = models.DateTimeField(auto_now_add=True)
   xp_earned = models.IntegerField(default=0)
   coins_earned = models.IntegerField(default=0)
 
+  class Meta:
+    indexes = [
+      models.Index(fields=['task', 'created_at']),
+      models.Index(fields=['user', 'created_at']),
+    ]
+
 class LevelLog(models.Model):
   """Log entries for level ups"""
   user = models.ForeignKey(User, on_delete=models.CASCADE)
   level = models.IntegerField()
   created_at = models.DateTimeField(auto_now_add=True)
 
+  class Meta:
+    indexes = [models.Index(fields=['user', 'created_at'])]
+
+class DailyUserStats(models.Model):
+  """Per-user activity totals for one (UTC) day, updated on every write.
+
+  Rebuildable from the logs with `manage.py rebuild_daily_stats`.
+  """
+  user = models.ForeignKey(User, on_delete=models.CASCADE)
+  date = models.DateField()
+  tasks_completed = models.IntegerField(default=0)
+  habits_positive = models.IntegerField(default=0)
+  habits_negative = models.IntegerField(default=0)
+  study_minutes = models.IntegerField(default=0)
+  # subject -> minutes, for sessions started on this day
+  subject_minutes = models.JSONField(default=dict)
+  xp_earned = models.IntegerField(default=0)
+  coins_earned = models.IntegerField(default=0)
+  level_ups = models.IntegerField(default=0)
+
+  class Meta:
+    unique_together = ['user', 'date']
+
+  @classmethod
+  def record(cls, user, when=None, subject_minutes=None, **deltas):
+    """Add activity to the user's row for the day of `when` (default now)"""
+    day = timezone.localdate(when, timezone=dt_timezone.utc)
+    updates = {field: models.F(field) + amount for field, amount in deltas.items() if amount}
+    if not updates and subject_minutes is None:
+      return
+
+    with transaction.atomic():
+      cls.objects.bulk_create([cls(user=user, date=day)], ignore_conflicts=True)
+      rows = cls.objects.filter(user=user, date=day)
+      if subject_minutes is not None:
+        merged = rows.select_for_update().values_list('subject_minutes', flat=True).get()
+        for subject, minutes in subject_minutes.items():
+          merged[subject] = merged.get(subject, 0) + minutes
+        updates['subject_minutes'] = merged
+        updates['study_minutes'] = models.F('study_minutes') + sum(subject_minutes.values())
+      rows.update(**updates)
+      WeeklyRecap.invalidate_if_past(user, day)
+
+  @classmethod
+  def study_minutes_on(cls, user, when=None):
+    """Minutes already recorded for the day of `when`, locking the row until the transaction ends"""
+    day = timezone.localdate(when, timezone=dt_timezone.utc)
+    return cls.objects.select_for_update().filter(user=user, date=day).values_list(
+      'study_minutes', flat=True
+    ).first() or 0
+
+  @classmethod
+  def rename_subjects(cls, user, renames, start, end):
+    """Move minutes between subjects (renames maps old -> new name) for start <= date < end"""
+    if not renames:
+      return
+    with transaction.atomic():
+      rows = list(cls.objects.select_for_update().filter(
+        user=user, date__gte=start, date__lt=end, subject_minutes__has_any_keys=list(renames)
+      ))
+      for row in rows:
+        merged = {}
+        for subject, minutes in row.subject_minutes.items():
+          subject = renames.get(subject, subject)
+          merged[subject] = merged.get(subject, 0) + minutes
+        row.subject_minutes = merged
+      cls.objects.bulk_update(rows, ['subject_minutes'])
+      for week_start in {row.date - timedelta(days=row.date.weekday()) for row in rows}:
+        WeeklyRecap.invalidate_if_past(user, week_start)
+
+class WeeklyRecap(models.Model):
+  """Snapshot of the recap for a finished ISO week, computed on first access"""
+  user = models.ForeignKey(User, on_delete=models.CASCADE)
+  iso_year = models.IntegerField()
+  iso_week = models.IntegerField()
+  data = models.JSONField()
+  created_at = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    unique_together = ['user', 'iso_year', 'iso_week']
+
+  @classmethod
+  def invalidate_if_past(cls, user, day):
+    """Drop the snapshot of day's week after its history changed (current week has none)"""
+    today = timezone.now().date()
+    if day < today - timedelta(days=today.weekday()):
+      iso_year, iso_week, _ = day.isocalendar()
+      cls.objects.filter(user=user, iso_year=iso_year, iso_week=iso_week).delete()
+
 class StatSlot(models.Model):
   """User custom stat display slots"""
   STAT_CHOICES = [
@@ -439,6 +636,12 @@ class ShopItem(models.Model):
   active = models.BooleanField(default=True)
   created_at = models.DateTimeField(auto_now_add=True)
 
+  class Meta:
+    indexes = [
+      # Shared customization catalog (user is NULL)
+      models.Index(fields=['item_type', 'active']),
+    ]
+
 class UserPurchase(models.Model):
   """User purchases from shop"""
   user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from functools import wraps
+import hashlib
+import uuid
+
+# Cached read responses are keyed by the user's generation token and the
+# global one; any write replaces a token, so old entries are never read again.
+# The key also holds the UTC day, so day and month dependent fields roll over.
+GLOBAL = 'global'
+
+
+def _generation_key(scope):
+  return f'response-cache:generation:{scope}'
+
+
+def _generations(user_id):
+  """Current (user, global) generation tokens, created on first use"""
+  keys = [_generation_key(user_id), _generation_key(GLOBAL)]
+  tokens = cache.get_many(keys)
+  for key in keys:
+    if key not in tokens:
+      cache.add(key, uuid.uuid4().hex, timeout=None)
+      tokens[key] = cache.get(key)
+  return tokens[keys[0]], tokens[keys[1]]
+
+
+def _set_generation(scope):
+  cache.set(_generation_key(scope), uuid.uuid4().hex, timeout=None)
+
+
+def bump_generation(scope):
+  """Invalidate every cached response of a user id (or GLOBAL for all users).
+
+  Bumped now and again once the transaction commits, so a reader racing the
+  write cannot store pre-commit data under the new generation.
+  """
+  _set_generation(scope)
+  transaction.on_commit(lambda: _set_generation(scope))
+
+
+def _count(name):
+  key = f'response-cache:{name}'
+  if not cache.add(key, 1, timeout=None):
+    try:
+      cache.incr(key)
+    except ValueError:
+      cache.set(key, 1, timeout=None)
+
+
+def response_cache_stats():
+  """Hit/miss counters of this cache backend"""
+  return {
+    name: cache.get(f'response-cache:{name}', 0)
+    for name in ('hits', 'misses')
+  }
+
+
+def cached_per_user(view):
+  """Cache a view's successful GET responses per user until the user's data changes.
+
+  Other methods are passed through and invalidate the user's cache.
+  Does nothing unless settings.RESPONSE_CACHE_ENABLED.
+  """
+  @wraps(view)
+  def wrapper(request, *args, **kwargs):
+    if not settings.RESPONSE_CACHE_ENABLED:
+      return view(request, *args, **kwargs)
+
+    if request.method != 'GET':
+      response = view(request, *args, **kwargs)
+      bump_generation(request.user.id)
+      return response
+
+    user_generation, global_generation = _generations(request.user.id)
+    day = timezone.now().date().isoformat()
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'response-cache:{request.user.id}:{user_generation}:{global_generation}:{day}:{view.__name__}:{path_hash}'
+
+    cached = cache.get(key)
+    if cached is not None:
+      _count('hits')
+      content_type, content = cached
+      response = HttpResponse(content, content_type=content_type)
+      response['X-Cache'] = 'HIT'
+      return response
+
+    _count('misses')
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200:
+      cache.set(key, (response['Content-Type'], response.content), settings.RESPONSE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
+  return wrapper
+
+
+def invalidates_user_cache(view):
+  """Mutation views: drop the user's cached read responses after a non-GET request"""
+  @wraps(view)
+  def wrapper(request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if request.method != 'GET':
+      bump_generation(request.user.id)
+    return response
+  return wrapper
@@ -0,0 +1,313 @@
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from functools import wraps
+import random
+
+from .models import UserProfile, Habit, Task, HabitLog, TaskLog, DailyUserStats
+from .counters import adjust_counters
+from . import levels
+
+# Profile columns touched by rewards/penalties; saved with update_fields so
+# a completion never rewrites unrelated columns
+PROGRESS_FIELDS = [
+  'level',
+  'xp',
+  'max_xp',
+  'hp',
+  'coins',
+  'all_time_coins_earned',
+  'highest_level_ever',
+  'longest_daily_streak',
+  'avatar_state',
+]
+
+
+def reward_transaction(func):
+  """transaction.atomic for read-modify-write reward paths.
+
+  select_for_update is a no-op on SQLite, where a deferred transaction that
+  read first fails instead of waiting when another one holds the write lock;
+  so on SQLite the outermost block starts with BEGIN IMMEDIATE.
+  """
+  @wraps(func)
+  def wrapper(*args, **kwargs):
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+      with transaction.atomic():
+        return func(*args, **kwargs)
+
+    connection.ensure_connection()
+    transaction_mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+      with transaction.atomic():
+        # BEGIN has run; any later transaction uses the configured mode
+        connection.transaction_mode = transaction_mode
+        return func(*args, **kwargs)
+    finally:
+      connection.transaction_mode = transaction_mode
+  return wrapper
+
+
+def save_progress(profile):
+  """Save the progress columns and add queued level ups to the daily rollup"""
+  level_ups = profile.pending_level_ups
+  profile.save(update_fields=PROGRESS_FIELDS)
+  if level_ups:
+    # Every level up pays 10 coins
+    DailyUserStats.record(profile.user, level_ups=level_ups, coins_earned=10 * level_ups)
+
+
+def locked_profile(user):
+  """Get the user's profile with its row locked until the transaction ends"""
+  profile, _ = UserProfile.objects.select_for_update().get_or_create(user=user)
+  return profile
+
+
+@reward_transaction
+def complete_habit(user, habit_id, positive):
+  """Apply a positive/negative habit completion with its rewards or penalty.
+
+  Raises Habit.DoesNotExist for unknown habits.
+  """
+  habit = Habit.objects.get(id=habit_id, user=user)
+
+  if positive and habit.allow_pos:
+    habit.incr_pos()
+
+    profile = locked_profile(user)
+
+    # Base XP : 3-5
+    base_min = 3
+    base_max = 5
+
+    # Add diff bonus : +2xp per diff
+    diff_bonus = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[habit.diff]
+    xp = random.randint(base_min + diff_bonus, base_max + diff_bonus)
+
+    level_up = profile.add_xp(xp)
+    if level_up:
+      profile.avatar_state = 'celebrating'
+    elif profile.avatar_state == 'hurt':
+      profile.avatar_state = 'idle'
+
+    # Coins : easy = 1-2, medium = 2-4, hard = 4-6
+    coins = 0
+    if habit.diff == 'easy':
+      coins = random.randint(1,2)
+    elif habit.diff == 'medium':
+      coins = random.randint(2,4)
+    elif habit.diff == 'hard':
+      coins = random.randint(4,6)
+
+    if coins > 0:
+      profile.add_coins(coins)
+      if profile.avatar_state != 'celebrating':
+        profile.avatar_state = 'celebrating'
+
+    if xp > 0 and not level_up:
+      if profile.avatar_state != 'celebrating':
+        profile.avatar_state = 'celebrating'
+    save_progress(profile)
+    adjust_counters(user, habits_completed=1)
+    HabitLog.objects.create(user=user, habit=habit, positive=True, xp_earned=xp, coins_earned=coins)
+    DailyUserStats.record(user, habits_positive=1, xp_earned=xp, coins_earned=coins)
+
+  elif not positive and habit.allow_neg:
+    habit.incr_neg()
+    HabitLog.objects.create(user=user, habit=habit, positive=False)
+    DailyUserStats.record(user, habits_negative=1)
+
+    profile = locked_profile(user)
+
+    # Negative habits : same value as XP gain
+    base_min = 3
+    base_max = 5
+    diff_penalty = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[habit.diff]
+    hp_loss = random.randint(base_min + diff_penalty, base_max + diff_penalty)
+    profile.lose_health(hp_loss)
+    profile.avatar_state = 'hurt'
+
+    save_progress(profile)
+
+  return {'success': True}
+
+
+@reward_transaction
+def set_task_completion(user, task_id, completed):
+  """Complete or uncomplete a task, applying or reverting its rewards.
+
+  The task and profile rows are locked for the whole transaction, so
+  concurrent requests cannot double-reward or lose updates.
+  Raises Task.DoesNotExist for unknown tasks.
+  """
+  task = Task.objects.select_for_update().get(id=task_id, user=user)
+
+  #If uncompleting
+  if not completed and task.completed:
+    profile = locked_profile(user)
+    xp_deduct = 0
+    coins_deduct = 0
+
+    #Find the most recent TaskLog for task
+    try:
+      with transaction.atomic():
+        task_log = TaskLog.objects.filter(task=task).order_by('-created_at').first()
+        if task_log:
+          xp_deduct = task_log.xp_earned
+          coins_deduct = task_log.coins_earned
+
+          # Remove XP within the current level; levels (and their coins) are kept
+          profile.level, profile.xp = levels.remove_xp(profile.level, profile.xp, xp_deduct)
+          profile.max_xp = profile.calculate_xp_for_lvl()
+
+          #Remove coins
+          profile.coins = max(0, profile.coins - coins_deduct)
+
+          # Decrement all_time_tasks_completed
+          adjust_counters(user, tasks_completed=-1)
+
+          # Reverse streak if incremented
+          if task.task_type == 'daily' and task.last_completed:
+            from datetime import date
+            today = date.today()
+            last_completed_date = task.last_completed.date() if hasattr(task.last_completed, 'date') else task.last_completed
+            if last_completed_date == today and task.streak > 0:
+              task.streak = max(0, task.streak - 1)
+
+          #Update longest streak if needed
+          if task.task_type == 'daily' and task.streak < profile.longest_daily_streak:
+            max_streak = Task.objects.filter(user=user, task_type='daily').aggregate(Max('streak'))['streak__max'] or 0
+            profile.longest_daily_streak = max_streak
+
+          if profile.avatar_state == 'celebrating':
+            profile.avatar_state = 'idle'
+
+          save_progress(profile)
+
+          #Delete task log entry
+          task_log.delete()
+          DailyUserStats.record(
+            user,
+            when=task_log.created_at,
+            tasks_completed=-1,
+            xp_earned=-xp_deduct,
+            coins_earned=-coins_deduct,
+          )
+
+    except Exception as e:
+      pass
+
+    task.completed = False
+    task.completed_at = None
+
+    if task.task_type == 'scheduled' and task.due and task.due < timezone.now():
+      hp_loss = 2
+      diff_penalty = {'trivial': 0, 'easy': 1, 'medium': 2, 'hard': 3}[task.diff]
+      hp_loss += diff_penalty
+
+      days_overdue = (timezone.now() - task.due).days
+      weeks_overdue = days_overdue // 7
+      if weeks_overdue > 0:
+        hp_loss = hp_loss * (2 * weeks_overdue)
+
+      profile.lose_health(hp_loss)
+      profile.avatar_state = 'hurt'
+      save_progress(profile)
+
+    task.save()
+    return {
+      'success': True,
+      'level_up': False,
+      'xp_earned': -xp_deduct,
+      'coins_earned': -coins_deduct,
+    }
+
+  if completed and not task.completed:
+    task.complete()
+
+    profile = locked_profile(user)
+
+    xp = 0
+    coins = 0
+
+    if task.task_type == 'daily':
+      # Daily rewards scale with streak
+      base_min = 5
+      base_max = 7
+
+      # Add diff bonus : +2xp per diff
+      diff_bonus = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[task.diff]
+
+      # Weekly streak bonus: +5xp per week
+      weeks_streak = task.streak // 7
+      weekly_bonus = weeks_streak * 5
+
+      xp = random.randint(base_min + diff_bonus, base_max + diff_bonus) + weekly_bonus
+      level_up = profile.add_xp(xp)
+
+      # Daily coins: easy = 1-3, medium = 3-5, hard = 5-7
+      if task.diff == 'easy':
+        coins = random.randint(1, 3)
+      elif task.diff == 'medium':
+        coins = random.randint(3, 5)
+      elif task.diff == 'hard':
+        coins = random.randint(5, 7)
+
+      # Weekly streak bonus: +5 coins per week
+      coins += weeks_streak * 5
+
+      if coins > 0:
+        profile.add_coins(coins)
+    else:
+      # Regular task rewards
+      base_min = 5
+      base_max = 10
+
+      diff_bonus = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[task.diff]
+      xp = random.randint(base_min + diff_bonus, base_max + diff_bonus)
+      level_up = profile.add_xp(xp)
+
+      if task.diff == 'medium':
+        coins = random.randint(1,3)
+      elif task.diff == 'hard':
+        coins = random.randint(3,5)
+
+      if coins > 0:
+        profile.add_coins(coins)
+
+    if level_up:
+      profile.avatar_state = 'celebrating'
+    elif xp > 0 and not level_up:
+      if profile.avatar_state != 'celebrating':
+        profile.avatar_state = 'celebrating'
+    elif profile.avatar_state == 'hurt':
+      profile.avatar_state = 'idle'
+
+    adjust_counters(user, tasks_completed=1)
+
+    # Update longest streak
+    if task.task_type == 'daily':
+      max_streak = Task.objects.filter(user=user, task_type='daily').aggregate(
+        max_streak=Max('streak')
+      )['max_streak'] or 0
+      if max_streak > profile.longest_daily_streak:
+        profile.longest_daily_streak = max_streak
+    save_progress(profile)
+
+    TaskLog.objects.create(user=user, task=task, xp_earned=xp, coins_earned=coins)
+    DailyUserStats.record(user, tasks_completed=1, xp_earned=xp, coins_earned=coins)
+
+    return {
+      'success': True,
+      'level_up': level_up,
+      'xp_earned': xp,
+      'coins_earned': coins,
+    }
+
+  return {
+    'success': True,
+    'level_up': False,
+    'xp_earned': 0,
+    'coins_earned': 0,
+  }
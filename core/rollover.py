@@ -0,0 +1,190 @@
+from django.db import transaction
+from django.db.models import Case, F, Max, Min, Q, Value, When
+from django.utils import timezone
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from .models import UserProfile, Habit, Task
+from .rewards import locked_profile, reward_transaction, PROGRESS_FIELDS
+from .response_cache import bump_generation
+
+# Extra HP lost per missed daily/overdue task on top of the base 2
+DIFF_PENALTY = {'trivial': 0, 'easy': 1, 'medium': 2, 'hard': 3}
+
+
+def reset_due_habits(user, now=None):
+  """Reset habit counters that are due, with one UPDATE per reset frequency.
+
+  The profile stores the earliest moment any habit becomes due, so until
+  then this is a single indexed read and no rows are written.
+  Returns the number of habits that were reset.
+  """
+  now = now or timezone.now()
+  next_reset_at = UserProfile.objects.filter(user=user).values_list(
+    'habits_next_reset_at', flat=True
+  ).first()
+  if next_reset_at is not None and now < next_reset_at:
+    return 0
+
+  reset_count = 0
+  with transaction.atomic():
+    for freq, period_days in Habit.RESET_PERIOD_DAYS.items():
+      reset_count += Habit.objects.filter(
+        user=user,
+        reset_freq=freq,
+        last_reset__lte=now - timedelta(days=period_days),
+      ).update(pos_count=0, neg_count=0, last_reset=now)
+
+    # Work out when the next habit becomes due
+    oldest = Habit.objects.filter(user=user).aggregate(**{
+      freq: Min('last_reset', filter=Q(reset_freq=freq))
+      for freq in Habit.RESET_PERIOD_DAYS
+    })
+    due_times = [
+      oldest[freq] + timedelta(days=period_days)
+      for freq, period_days in Habit.RESET_PERIOD_DAYS.items()
+      if oldest[freq] is not None
+    ]
+    # Without resettable habits, check again tomorrow at the latest
+    next_reset_at = min(due_times, default=now + timedelta(days=1))
+
+    UserProfile.objects.filter(user=user).update(habits_next_reset_at=next_reset_at)
+
+  if reset_count:
+    bump_generation(user.id)
+  return reset_count
+
+
+def invalidate_habit_reset(user):
+  """Force the next reset_due_habits call to recompute the watermark"""
+  UserProfile.objects.filter(user=user).update(habits_next_reset_at=None)
+
+
+def _day_start(day):
+  """Midnight UTC, matching the .date() of stored (UTC) datetimes"""
+  return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def missed_dailies_q(now):
+  """Dailies older than today that were not completed yesterday or today"""
+  today = now.date()
+  yesterday_start = _day_start(today - timedelta(days=1))
+  today_start = _day_start(today)
+  tomorrow_start = _day_start(today + timedelta(days=1))
+
+  created_today = Q(created_at__gte=today_start, created_at__lt=tomorrow_start)
+  completed_recently = (
+    Q(last_completed__gte=yesterday_start, last_completed__lt=tomorrow_start)
+    | Q(last_completed__isnull=True, completed=True, completed_at__isnull=True)
+    | Q(last_completed__isnull=True, completed=True,
+        completed_at__gte=yesterday_start, completed_at__lt=tomorrow_start)
+  )
+  return Q(task_type='daily') & ~created_today & ~completed_recently
+
+
+def reset_stale_dailies(user, now=None):
+  """Un-complete dailies (created before today) last completed before today.
+
+  One conditional UPDATE; writes nothing once the dailies are current.
+  """
+  now = now or timezone.now()
+  today_start = _day_start(now.date())
+  reset_count = Task.objects.filter(
+    Q(last_completed__lt=today_start) | Q(last_completed__isnull=True),
+    user=user,
+    task_type='daily',
+    completed=True,
+    created_at__lt=today_start,
+  ).update(completed=False, completed_at=None)
+  if reset_count:
+    bump_generation(user.id)
+  return reset_count
+
+
+def pending_dailies_q(now):
+  """Dailies older than today that were not completed yesterday"""
+  yesterday = now.date() - timedelta(days=1)
+  today_start = _day_start(now.date())
+  return Q(task_type='daily', created_at__lt=today_start) & ~Q(
+    last_completed__gte=_day_start(yesterday), last_completed__lt=today_start
+  )
+
+
+def overdue_tasks_q(now):
+  """Uncompleted scheduled tasks that were due yesterday (local time)"""
+  yesterday = now.date() - timedelta(days=1)
+  return Q(
+    task_type='scheduled',
+    completed=False,
+    due__gte=timezone.make_aware(datetime.combine(yesterday, datetime.min.time())),
+    due__lte=timezone.make_aware(datetime.combine(yesterday, datetime.max.time())),
+  )
+
+
+def overdue_penalty(diff, due, now):
+  """HP lost for an overdue task; doubles per full week overdue"""
+  hp_loss = 2 + DIFF_PENALTY[diff]
+  weeks_overdue = (now - due).days // 7
+  if weeks_overdue > 0:
+    hp_loss = hp_loss * (2 * weeks_overdue)
+  return hp_loss
+
+
+@reward_transaction
+def roll_over_dailies(user, now=None):
+  """Apply the new-day rollover: penalties, daily/streak resets and habit resets.
+
+  Missed dailies and overdue tasks are each read with one query, the HP
+  penalties are applied to the profile in memory and everything is written
+  back with set-based UPDATEs and a single profile save.
+  A user is rolled over at most once per day (see rolled_over_through), so
+  repeated calls are cheap no-ops.
+  Returns (missed dailies, overdue tasks).
+  """
+  now = now or timezone.now()
+  profile = locked_profile(user)
+  if profile.rolled_over_through is not None and profile.rolled_over_through >= now.date():
+    return 0, 0
+
+  tasks = Task.objects.filter(user=user).order_by('id')
+  missed = missed_dailies_q(now)
+
+  missed_diffs = list(tasks.filter(missed).values_list('diff', flat=True))
+  overdue = list(tasks.filter(overdue_tasks_q(now)).values_list('diff', 'due'))
+
+  # lose_health resets HP on a level loss, so penalties are applied in order
+  for diff in missed_diffs:
+    profile.lose_health(2 + DIFF_PENALTY[diff])
+  if missed_diffs and profile.avatar_state != 'celebrating':
+    profile.avatar_state = 'hurt'
+  for diff, due in overdue:
+    profile.lose_health(overdue_penalty(diff, due, now))
+  if overdue and profile.avatar_state not in ['celebrating', 'celebrate']:
+    profile.avatar_state = 'hurt'
+
+  # Missed dailies and dailies never completed lose their streak
+  tasks.filter(task_type='daily').update(
+    completed=False,
+    completed_at=None,
+    streak=Case(
+      When(missed | Q(last_completed__isnull=True), then=Value(0)),
+      default=F('streak'),
+    ),
+  )
+
+  reset_due_habits(user, now)
+
+  max_streak = tasks.filter(task_type='daily').aggregate(Max('streak'))['streak__max'] or 0
+  if max_streak > profile.longest_daily_streak:
+    profile.longest_daily_streak = max_streak
+
+  profile.rolled_over_through = now.date()
+  profile.save(update_fields=PROGRESS_FIELDS + ['rolled_over_through'])
+  return len(missed_diffs), len(overdue)
+
+
+def rolled_over_today(user, now=None):
+  """Whether the daily rollover already ran for the user today"""
+  now = now or timezone.now()
+  return UserProfile.objects.filter(
+    user=user, rolled_over_through__gte=now.date()
+  ).exists()
@@ -0,0 +1,56 @@
+from django.db.models import Prefetch
+
+from .models import Tag
+
+
+def with_tags(queryset):
+  """Prefetch tag names so serializing a list costs one extra query in total"""
+  return queryset.prefetch_related(
+    Prefetch('tags', queryset=Tag.objects.only('id', 'name'))
+  )
+
+
+def serialize_habit(habit):
+  """Build the JSON payload for a single habit (tags must be prefetched)"""
+  return {
+    'id': habit.id,
+    'title': habit.title,
+    'details': habit.details,
+    'tags': [tag.name for tag in habit.tags.all()],
+    'diff': habit.diff,
+    'allow_pos': habit.allow_pos,
+    'allow_neg': habit.allow_neg,
+    'reset_freq': habit.reset_freq,
+    'pos_count': habit.pos_count,
+    'neg_count': habit.neg_count,
+    'color': habit.get_color(),
+    'strong': habit.strong(),
+  }
+
+
+def serialize_task(task):
+  """Build the JSON payload for a single task (tags must be prefetched)"""
+  return {
+    'id': task.id,
+    'title': task.title,
+    'details': task.details,
+    'tags': [tag.name for tag in task.tags.all()],
+    'diff': task.diff,
+    'task_type': task.task_type,
+    'due': task.due,
+    'completed': task.completed,
+    'completed_at': task.completed_at.isoformat() if task.completed_at else None,
+    'streak': task.streak,
+    'color': task.get_color(),
+    'overdue': task.overdue(),
+  }
+
+
+def serialize_habits(habits):
+  """Serialize a habit queryset with all tags fetched in one batched query"""
+  return [serialize_habit(habit) for habit in with_tags(habits)]
+
+
+def serialize_tasks(tasks):
+  """Serialize a task queryset with all tags fetched in one batched query"""
+  return [serialize_task(task) for task in with_tags(tasks)]
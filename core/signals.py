@@ -1,17 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile, Habit, Task, Tag, ShopItem
+from .models import UserProfile, Habit, Task, Tag, ShopItem, SubjectColor, UserPurchase, StudySession
+from .response_cache import bump_generation, GLOBAL
+from .active_session import forget_active_session
+from .tags import invalidate_tag_registry
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
   """Create UserProfile and examples when a new user is created"""
   if created:
-    # Ensure default tags exist
-    default_tags = ["Work", "Health", "Creativity", "Study", "Exercise", "Hobby", "Chores"]
-    for tag_name in default_tags:
-      Tag.objects.get_or_create(name=tag_name)
-      
     profile = UserProfile.objects.create(user=instance)
     habit = Habit.objects.create(
       user=instance,
@@ -38,4 +36,50 @@ def create_user_profile(sender, instance, created, **kwargs):
       item_type='character',
       price=10,
       active=True
-    )
\ No newline at end of file
+    )
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=SubjectColor)
+@receiver(post_delete, sender=SubjectColor)
+@receiver(post_save, sender=UserPurchase)
+@receiver(post_delete, sender=UserPurchase)
+def invalidate_owner_responses(sender, instance, **kwargs):
+  """Drop the owner's cached read responses when one of their rows changes"""
+  bump_generation(instance.user_id)
+
+
+@receiver(post_save, sender=ShopItem)
+@receiver(post_delete, sender=ShopItem)
+def invalidate_shop_responses(sender, instance, **kwargs):
+  """Custom rewards belong to one user; catalog items are shared by everyone"""
+  bump_generation(instance.user_id if instance.user_id else GLOBAL)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_responses(sender, instance, **kwargs):
+  """Tags are shared by every user"""
+  bump_generation(GLOBAL)
+  invalidate_tag_registry()
+
+
+@receiver(m2m_changed, sender=Habit.tags.through)
+@receiver(m2m_changed, sender=Task.tags.through)
+def invalidate_tagged_responses(sender, instance, action, **kwargs):
+  """Re-tagging changes the owner's lists and tag names"""
+  if action.startswith('post_'):
+    # Changed from the Tag side, the owners are unknown
+    bump_generation(instance.user_id if isinstance(instance, (Habit, Task)) else GLOBAL)
+
+
+@receiver(post_save, sender=StudySession)
+@receiver(post_delete, sender=StudySession)
+def invalidate_active_session(sender, instance, **kwargs):
+  """Starting or stopping a session changes the cached active-session marker"""
+  forget_active_session(instance.user_id)
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+import uuid
+
+from .models import Habit, Task, Tag
+
+VERSION_KEY = 'tag-registry:version'
+
+# Process-wide name -> id map of every tag, valid while its version matches the cached one
+_registry = {'version': None, 'ids': {}}
+
+
+def _set_version():
+  cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_tag_registry():
+  """Make every process reload its tag map (now and again after commit)"""
+  _set_version()
+  transaction.on_commit(_set_version)
+
+
+def _registry_ids():
+  """The in-memory name -> id map, reloaded when its version changed.
+
+  None when the registry is off (see RESPONSE_CACHE_ENABLED) or a reload
+  could not be kept, so callers fall back to per-name lookups.
+  """
+  if not settings.RESPONSE_CACHE_ENABLED:
+    return None
+
+  version = cache.get(VERSION_KEY)
+  if version is None:
+    cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    version = cache.get(VERSION_KEY)
+  if _registry['version'] == version:
+    return _registry['ids']
+
+  # A map read inside a transaction may hold tags that are rolled back later
+  if connection.in_atomic_block:
+    return None
+  ids = dict(Tag.objects.values_list('name', 'id'))
+  _registry.update(version=version, ids=ids)
+  return ids
+
+
+def tag_ids():
+  """name -> id of every tag, read from the database only when the registry changed"""
+  ids = _registry_ids()
+  if ids is None:
+    ids = dict(Tag.objects.values_list('name', 'id'))
+  return ids
+
+
+def tag_ids_for(names):
+  """Ids of the named tags, creating the unknown ones"""
+  names = list(dict.fromkeys(names))
+  if not names:
+    return []
+
+  known = _registry_ids()
+  if known is None:
+    known = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+  ids = []
+  for name in names:
+    if name not in known:
+      tag, _ = Tag.objects.get_or_create(name=name)
+      known = {**known, name: tag.id}
+    ids.append(known[name])
+  return ids
+
+
+def user_tag_names(user):
+  """Names of the tags on the user's habits and tasks, one UNION query over the through tables"""
+  habit_tags = Habit.tags.through.objects.filter(habit__user=user).values_list('tag__name', flat=True)
+  task_tags = Task.tags.through.objects.filter(task__user=user).values_list('tag__name', flat=True)
+  return set(habit_tags.union(task_tags))
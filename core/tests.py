@@ -1,3 +1,1223 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import datetime, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+import random
+import threading
 
-# Create your tests here.
+from .models import (
+  UserProfile,
+  Habit,
+  Task,
+  Tag,
+  StatSlot,
+  HabitLog,
+  TaskLog,
+  StudySession,
+  SubjectColor,
+  LevelLog,
+  DailyUserStats,
+  WeeklyRecap,
+  HABIT_COLOR_STEPS,
+  habit_gradient_color,
+)
+from . import levels
+from .rollover import reset_due_habits, roll_over_dailies
+from .views.shop_stats_views import stat_values
+from .rewards import complete_habit, set_task_completion, PROGRESS_FIELDS
+from .views.game_views import stop_study_session
+from .daily_stats import rebuild_daily_stats
+from .response_cache import response_cache_stats
+from .tags import tag_ids, tag_ids_for, invalidate_tag_registry
+from .constants import DEFAULT_TAGS
+
+
+class ListQueryCountTests(TestCase):
+  """api_habits/api_tasks must not issue one tag query per row"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='alice', password='pw')
+    self.client.force_login(self.user)
+    self.tags = [Tag.objects.get_or_create(name=name)[0] for name in ['Work', 'Health', 'Study']]
+
+  def add_rows(self, count):
+    for i in range(count):
+      habit = Habit.objects.create(user=self.user, title=f'Habit {i}')
+      habit.tags.set(self.tags[:i % 3 + 1])
+      task = Task.objects.create(user=self.user, title=f'Task {i}')
+      task.tags.set(self.tags[:i % 3 + 1])
+
+  def count_queries(self, url):
+    with CaptureQueriesContext(connection) as ctx:
+      response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+    return len(ctx.captured_queries), response.json()
+
+  def test_habits_query_count_is_constant(self):
+    self.add_rows(2)
+    # First read of the day settles the habit reset watermark
+    reset_due_habits(self.user)
+    small, _ = self.count_queries('/api/habits/')
+    self.add_rows(40)
+    large, data = self.count_queries('/api/habits/')
+    self.assertEqual(small, large)
+    # session + user + reset watermark + habits + tags
+    self.assertEqual(large, 5)
+    self.assertEqual(len(data['habits']), 43)
+    by_title = {h['title']: h for h in data['habits']}
+    self.assertEqual(sorted(by_title['Habit 2']['tags']), ['Health', 'Study', 'Work'])
+
+  def test_tasks_query_count_is_constant(self):
+    self.add_rows(2)
+    small, _ = self.count_queries('/api/tasks/')
+    self.add_rows(40)
+    large, data = self.count_queries('/api/tasks/')
+    self.assertEqual(small, large)
+    self.assertEqual(large, 4)
+    self.assertEqual(len(data['tasks']), 43)
+    by_title = {t['title']: t for t in data['tasks']}
+    self.assertEqual(by_title['Task 0']['tags'], ['Work'])
+
+
+class HabitResetTests(TestCase):
+  """Set-based habit counter resets driven by the profile watermark"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='bob', password='pw')
+    self.client.force_login(self.user)
+    Habit.objects.filter(user=self.user).delete()
+
+  def make_habit(self, freq, days_ago):
+    habit = Habit.objects.create(user=self.user, title=freq, reset_freq=freq, pos_count=4, neg_count=2)
+    Habit.objects.filter(pk=habit.pk).update(last_reset=timezone.now() - timedelta(days=days_ago, minutes=1))
+    return habit
+
+  def test_resets_only_due_habits(self):
+    due = [self.make_habit('daily', 1), self.make_habit('weekly', 7), self.make_habit('monthly', 30)]
+    fresh = [self.make_habit('daily', 0), self.make_habit('weekly', 6), self.make_habit('never', 400)]
+
+    self.assertEqual(reset_due_habits(self.user), 3)
+
+    for habit in due:
+      habit.refresh_from_db()
+      self.assertEqual((habit.pos_count, habit.neg_count), (0, 0))
+    for habit in fresh:
+      habit.refresh_from_db()
+      self.assertEqual((habit.pos_count, habit.neg_count), (4, 2))
+
+  def test_watermark_skips_work_until_next_due(self):
+    self.make_habit('daily', 0)
+    reset_due_habits(self.user)
+    next_reset_at = UserProfile.objects.get(user=self.user).habits_next_reset_at
+    self.assertIsNotNone(next_reset_at)
+
+    with CaptureQueriesContext(connection) as ctx:
+      self.assertEqual(reset_due_habits(self.user), 0)
+    self.assertEqual(len(ctx.captured_queries), 1)
+
+    self.assertEqual(reset_due_habits(self.user, now=next_reset_at + timedelta(seconds=1)), 1)
+
+  def test_habits_get_does_not_write(self):
+    self.make_habit('weekly', 1)
+    self.client.get('/api/habits/')
+    with CaptureQueriesContext(connection) as ctx:
+      self.client.get('/api/habits/')
+    writes = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')]
+    self.assertEqual(writes, [])
+
+  def test_creating_habit_invalidates_watermark(self):
+    self.make_habit('monthly', 0)
+    reset_due_habits(self.user)
+    self.client.post('/api/habits/create/', {'title': 'Stretch', 'reset_freq': 'daily'}, content_type='application/json')
+    self.assertIsNone(UserProfile.objects.get(user=self.user).habits_next_reset_at)
+
+
+class HabitStrengthFilterTests(TestCase):
+  """HabitQuerySet.strong()/weak() must agree with the instance methods"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='carol', password='pw')
+    self.client.force_login(self.user)
+    Habit.objects.filter(user=self.user).delete()
+    for pos in range(6):
+      for neg in range(6):
+        Habit.objects.create(user=self.user, title=f'{pos}/{neg}', pos_count=pos, neg_count=neg)
+
+  def test_queryset_matches_instance_methods(self):
+    habits = list(Habit.objects.filter(user=self.user))
+    self.assertEqual(
+      set(Habit.objects.filter(user=self.user).strong().values_list('id', flat=True)),
+      {h.id for h in habits if h.strong()},
+    )
+    self.assertEqual(
+      set(Habit.objects.filter(user=self.user).weak().values_list('id', flat=True)),
+      {h.id for h in habits if h.weak()},
+    )
+
+  def test_filter_param_only_returns_matching_rows(self):
+    data = self.client.get('/api/habits/?filter=strong').json()
+    self.assertTrue(data['habits'])
+    self.assertTrue(all(h['strong'] for h in data['habits']))
+    data = self.client.get('/api/habits/?filter=weak').json()
+    self.assertTrue(all(h['neg_count'] > h['pos_count'] for h in data['habits']))
+
+
+class HabitColorTableTests(TestCase):
+  """Precomputed habit gradient must match the exact HSL interpolation"""
+
+  @staticmethod
+  def channels(color):
+    return [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+
+  def test_table_matches_gradient_at_every_step(self):
+    for i in range(HABIT_COLOR_STEPS + 1):
+      habit = Habit(pos_count=i, neg_count=HABIT_COLOR_STEPS - i)
+      expected = self.channels(habit_gradient_color(i / HABIT_COLOR_STEPS))
+      actual = self.channels(habit.get_color())
+      for a, e in zip(actual, expected):
+        self.assertLessEqual(abs(a - e), 1, f'ratio step {i}')
+
+  def test_no_activity_color(self):
+    self.assertEqual(Habit(pos_count=0, neg_count=0).get_color(), '#d2642d')
+
+
+class BootstrapTests(TestCase):
+  """/api/bootstrap/ returns the same data as the individual endpoints"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='dave', password='pw')
+    self.client.force_login(self.user)
+    StatSlot.objects.create(user=self.user, slot_number=1, stat_type='tasks_completed')
+    StatSlot.objects.create(user=self.user, slot_number=2, stat_type='coins_earned')
+
+  def test_sections_match_individual_endpoints(self):
+    data = self.client.get('/api/bootstrap/').json()
+    self.assertEqual(data['profile'], self.client.get('/api/profile/').json())
+    self.assertEqual(data['habits'], self.client.get('/api/habits/').json()['habits'])
+    self.assertEqual(data['tasks'], self.client.get('/api/tasks/').json()['tasks'])
+    self.assertEqual(data['tags'], self.client.get('/api/tags/').json()['tags'])
+    self.assertEqual(data['dailies'], self.client.get('/api/dailies/check').json())
+    self.assertEqual(data['study_session'], self.client.get('/api/habits/study/stop/').json())
+    self.assertEqual(data['recap'], self.client.get('/api/recap/').json())
+    self.assertEqual(data['stat_slots']['slots'], self.client.get('/api/stats/slots/').json()['slots'])
+    for stat_type in ['tasks_completed', 'coins_earned']:
+      self.assertEqual(
+        data['stat_slots']['values'][stat_type],
+        self.client.get(f'/api/stats/value/?type={stat_type}').json()['value'],
+      )
+
+  def test_include_limits_sections(self):
+    data = self.client.get('/api/bootstrap/?include=profile,tasks').json()
+    self.assertEqual(set(data), {'profile', 'tasks'})
+
+  def test_tasks_reflect_stale_daily_reset(self):
+    old = timezone.now() - timedelta(days=3)
+    daily = Task.objects.create(user=self.user, title='Stale', task_type='daily', completed=True, last_completed=old)
+    Task.objects.filter(pk=daily.pk).update(created_at=old)
+    data = self.client.get('/api/bootstrap/').json()
+    self.assertIn(daily.id, [item['id'] for item in data['dailies']['pending_dailies']])
+    self.assertFalse(next(task for task in data['tasks'] if task['id'] == daily.id)['completed'])
+
+
+class BatchedStatValueTests(TestCase):
+  """Several stat types computed in one pass"""
+
+  STAT_TYPES = ['hours_studied', 'tasks_completed', 'habits_completed', 'current_streak', 'longest_streak', 'coins_earned', 'level']
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='erin', password='pw')
+    self.client.force_login(self.user)
+    habit = Habit.objects.get(user=self.user)
+    HabitLog.objects.create(user=self.user, habit=habit, positive=True)
+    HabitLog.objects.create(user=self.user, habit=habit, positive=False)
+    daily = Task.objects.create(user=self.user, title='Read', task_type='daily', streak=4)
+    TaskLog.objects.create(user=self.user, task=daily)
+    StudySession.objects.create(user=self.user, subject='Math', duration_minutes=90, active=False)
+    StatSlot.objects.create(user=self.user, slot_number=1, stat_type='hours_studied')
+    StatSlot.objects.create(user=self.user, slot_number=2, stat_type='longest_streak')
+    # Rows above bypassed the write paths, so bring the counters in line
+    call_command('repair_counters', stdout=StringIO())
+
+  def test_batched_values_match_single_requests(self):
+    single = {
+      stat_type: self.client.get(f'/api/stats/value/?type={stat_type}').json()['value']
+      for stat_type in self.STAT_TYPES
+    }
+    self.assertEqual(single['hours_studied'], 1.5)
+    self.assertEqual(single['tasks_completed'], 1)
+    self.assertEqual(single['habits_completed'], 1)
+    self.assertEqual(single['longest_streak'], 4)
+
+    query = '&'.join(f'type={stat_type}' for stat_type in self.STAT_TYPES)
+    self.assertEqual(self.client.get(f'/api/stats/value/?{query}').json()['values'], single)
+    self.assertEqual(self.client.get(f'/api/stats/value/?type={",".join(self.STAT_TYPES)}').json()['values'], single)
+
+  def test_aggregates_share_one_query(self):
+    profile = UserProfile.objects.get(user=self.user)
+    stat_values(self.user, profile, self.STAT_TYPES)
+    with self.assertNumQueries(1):
+      stat_values(self.user, profile, self.STAT_TYPES)
+
+  def test_slots_all(self):
+    data = self.client.get('/api/stats/value/?slots=all').json()
+    self.assertEqual(data['values'], {'hours_studied': 1.5, 'longest_streak': 4})
+
+
+class CounterMaintenanceTests(TestCase):
+  """All-time counters are maintained on write and repaired offline"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='frank', password='pw')
+    self.client.force_login(self.user)
+    self.habit = Habit.objects.get(user=self.user)
+    self.task = Task.objects.get(user=self.user)
+
+  def profile(self):
+    return UserProfile.objects.get(user=self.user)
+
+  def test_completions_update_counters(self):
+    self.client.post(f'/api/habits/{self.habit.id}/complete/', {'positive': True}, content_type='application/json')
+    self.client.post(f'/api/tasks/{self.task.id}/complete/', {'completed': True}, content_type='application/json')
+    profile = self.profile()
+    self.assertEqual(profile.all_time_habits_completed, 1)
+    self.assertEqual(profile.all_time_tasks_completed, 1)
+
+    self.client.post(f'/api/tasks/{self.task.id}/complete/', {'completed': False}, content_type='application/json')
+    self.assertEqual(self.profile().all_time_tasks_completed, 0)
+
+  def test_profile_writes_do_not_overwrite_counters(self):
+    stale = self.profile()
+    self.client.post(f'/api/habits/{self.habit.id}/complete/', {'positive': True}, content_type='application/json')
+    stale.avatar_state = 'idle'
+    stale.save(update_fields=PROGRESS_FIELDS)
+    self.client.post('/api/profile/', {'avatar_shirt': 'red'}, content_type='application/json')
+    self.assertEqual(self.profile().all_time_habits_completed, 1)
+
+  def test_background_charge_keeps_concurrent_reward(self):
+    UserProfile.objects.filter(user=self.user).update(coins=100)
+
+    def reward_commits_meanwhile(profile):
+      UserProfile.objects.filter(pk=profile.pk).update(coins=F('coins') + 7)
+
+    with mock.patch('core.views.game_views.normalize_profile', side_effect=reward_commits_meanwhile):
+      data = self.client.post('/api/profile/', {'avatar_background_color': '#000000'}, content_type='application/json').json()
+    self.assertEqual(self.profile().coins, 57)
+    self.assertEqual(data['coins'], 57)
+
+    UserProfile.objects.filter(user=self.user).update(coins=30)
+    self.client.post('/api/profile/', {'avatar_background_color': '#ffffff'}, content_type='application/json')
+    self.assertEqual(self.profile().coins, 30)
+
+  def test_plain_save_writes_counters(self):
+    profile = self.profile()
+    profile.all_time_tasks_completed = 4
+    profile.save()
+    self.assertEqual(self.profile().all_time_tasks_completed, 4)
+
+  def test_stat_read_does_not_recount(self):
+    UserProfile.objects.filter(user=self.user).update(all_time_tasks_completed=7)
+    self.assertEqual(self.client.get('/api/stats/value/?type=tasks_completed').json()['value'], 7)
+
+  def test_logs_survive_deletion(self):
+    self.client.post(f'/api/habits/{self.habit.id}/complete/', {'positive': True}, content_type='application/json')
+    self.client.post(f'/api/tasks/{self.task.id}/complete/', {'completed': True}, content_type='application/json')
+    self.habit.delete()
+    self.task.delete()
+    self.assertEqual(HabitLog.objects.filter(user=self.user, habit__isnull=True).count(), 1)
+    self.assertEqual(TaskLog.objects.filter(user=self.user, task__isnull=True).count(), 1)
+
+    out = StringIO()
+    call_command('repair_counters', '--check', stdout=out)
+    self.assertIn('found drift on 0', out.getvalue())
+
+  def test_repair_command_fixes_drift(self):
+    HabitLog.objects.create(user=self.user, habit=self.habit, positive=True)
+    TaskLog.objects.create(user=self.user, task=self.task)
+    StudySession.objects.create(user=self.user, subject='Math', duration_minutes=30, active=False)
+
+    out = StringIO()
+    call_command('repair_counters', '--check', stdout=out)
+    self.assertIn('found drift on 1', out.getvalue())
+    self.assertEqual(self.profile().all_time_tasks_completed, 0)
+
+    call_command('repair_counters', stdout=StringIO())
+    profile = self.profile()
+    self.assertEqual(profile.all_time_tasks_completed, 1)
+    self.assertEqual(profile.all_time_habits_completed, 1)
+    self.assertEqual(profile.all_time_hours_studied, 0.5)
+
+
+class ConcurrentRewardTests(TransactionTestCase):
+  """Parallel completions against one user must not lose updates"""
+
+  WORKERS = 8
+  ROUNDS = 5
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='grace', password='pw')
+    self.habit = Habit.objects.get(user=self.user)
+    Habit.objects.filter(pk=self.habit.pk).update(diff='hard')
+
+  def run_in_threads(self, target):
+    barrier = threading.Barrier(self.WORKERS)
+    errors = []
+
+    def worker(index):
+      try:
+        barrier.wait()
+        target(index)
+      except Exception as error:
+        errors.append(error)
+      finally:
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.WORKERS)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(errors, [])
+
+  def test_parallel_habit_completions(self):
+    def target(index):
+      for _ in range(self.ROUNDS):
+        complete_habit(self.user, self.habit.id, True)
+
+    self.run_in_threads(target)
+
+    total = self.WORKERS * self.ROUNDS
+    habit = Habit.objects.get(pk=self.habit.pk)
+    profile = UserProfile.objects.get(user=self.user)
+    self.assertEqual(habit.pos_count, total)
+    self.assertEqual(HabitLog.objects.filter(habit=habit).count(), total)
+    self.assertEqual(profile.all_time_habits_completed, total)
+    # Hard habits pay 4-6 coins each, plus 10 per level up
+    level_coins = 10 * LevelLog.objects.filter(user=self.user).count()
+    self.assertEqual(profile.all_time_coins_earned, profile.coins)
+    self.assertTrue(total * 4 <= profile.coins - level_coins <= total * 6)
+
+  def test_only_reward_transactions_begin_immediate(self):
+    with CaptureQueriesContext(connection) as ctx:
+      complete_habit(self.user, self.habit.id, True)
+      with transaction.atomic():
+        Habit.objects.filter(pk=self.habit.pk).update(title='Read')
+    begins = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('BEGIN')]
+    self.assertEqual(begins, ['BEGIN IMMEDIATE', 'BEGIN'])
+
+  def test_parallel_completion_of_one_task_rewards_once(self):
+    task = Task.objects.create(user=self.user, title='Once', diff='hard')
+
+    def target(index):
+      set_task_completion(self.user, task.id, True)
+
+    self.run_in_threads(target)
+
+    profile = UserProfile.objects.get(user=self.user)
+    self.assertEqual(TaskLog.objects.filter(task=task).count(), 1)
+    self.assertEqual(profile.all_time_tasks_completed, 1)
+    log = TaskLog.objects.get(task=task)
+    self.assertEqual(profile.coins, log.coins_earned + 10 * LevelLog.objects.filter(user=self.user).count())
+
+  def test_parallel_stops_credit_the_session_once(self):
+    session = StudySession.objects.create(user=self.user, subject='Math')
+    StudySession.objects.filter(pk=session.pk).update(start_time=timezone.now() - timedelta(minutes=90))
+    request = SimpleNamespace(user=self.user)
+    responses = []
+
+    def target(index):
+      responses.append(stop_study_session(request).status_code)
+
+    self.run_in_threads(target)
+
+    self.assertEqual(sorted(responses), [200] + [400] * (self.WORKERS - 1))
+    profile = UserProfile.objects.get(user=self.user)
+    self.assertEqual(profile.all_time_hours_studied, 1.5)
+    self.assertEqual(DailyUserStats.objects.get(user=self.user).study_minutes, 90)
+
+  def test_parallel_stops_pay_each_hour_block_once(self):
+    # 50 minutes already studied today, so a 20 minute session completes the first hour
+    DailyUserStats.record(self.user, subject_minutes={'Math': 50})
+    session = StudySession.objects.create(user=self.user, subject='Math')
+    StudySession.objects.filter(pk=session.pk).update(start_time=timezone.now() - timedelta(minutes=20))
+    coins = UserProfile.objects.get(user=self.user).coins
+    request = SimpleNamespace(user=self.user)
+
+    self.run_in_threads(lambda index: stop_study_session(request))
+
+    self.assertEqual(StudySession.objects.get(pk=session.pk).coins_earned, 1)
+    self.assertEqual(UserProfile.objects.get(user=self.user).coins, coins + 1)
+    day = DailyUserStats.objects.get(user=self.user)
+    self.assertEqual((day.study_minutes, day.coins_earned), (70, 1))
+
+
+def loop_add_xp(level, xp, amount):
+  """The original one-level-at-a-time add_xp loop, kept as a reference"""
+  xp = max(0, xp + amount)
+  xp_needed = ((level - 1) + level) * 20
+  while xp >= xp_needed:
+    level += 1
+    xp -= xp_needed
+    xp_needed = ((level - 1) + level) * 20
+  return level, xp
+
+
+class LevelMathTests(TestCase):
+  """Closed-form level math must match the per-level loop it replaced"""
+
+  def test_add_xp_matches_loop(self):
+    rng = random.Random(2024)
+    for _ in range(2000):
+      level = rng.randint(1, 300)
+      xp = rng.randint(0, levels.xp_for_level(level) - 1)
+      amount = rng.choice([rng.randint(-50, 50), rng.randint(0, 10 ** 6)])
+      self.assertEqual(levels.add_xp(level, xp, amount), loop_add_xp(level, xp, amount))
+
+  def test_huge_grant(self):
+    level, xp = levels.add_xp(1, 0, 10 ** 12)
+    self.assertEqual(levels.total_xp(level, xp), 10 ** 12)
+    self.assertTrue(0 <= xp < levels.xp_for_level(level))
+
+  def test_remove_xp_never_drops_a_level(self):
+    rng = random.Random(7)
+    for _ in range(2000):
+      level = rng.randint(1, 300)
+      xp = rng.randint(0, levels.xp_for_level(level) - 1)
+      amount = rng.randint(0, 10 ** 6)
+      gained_level, gained_xp = levels.add_xp(level, xp, amount)
+      expected = (level, xp) if gained_level == level else (gained_level, max(0, gained_xp - amount))
+      self.assertEqual(levels.remove_xp(gained_level, gained_xp, amount), expected)
+    self.assertEqual(levels.remove_xp(3, 5, 10 ** 6), (3, 0))
+
+  def test_profile_add_xp_rewards_each_level(self):
+    user = User.objects.create_user(username='leveler', password='pw')
+    profile = UserProfile.objects.get(user=user)
+    coins = profile.coins
+    level_up = profile.add_xp(levels.total_xp(6, 3))
+    self.assertTrue(level_up)
+    self.assertFalse(LevelLog.objects.filter(user=user).exists())
+    with CaptureQueriesContext(connection) as ctx:
+      profile.save()
+    inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_levellog"')]
+    self.assertEqual(len(inserts), 1)
+    self.assertEqual((profile.level, profile.xp, profile.max_xp), (6, 3, levels.xp_for_level(6)))
+    self.assertEqual(profile.coins, coins + 50)
+    self.assertEqual(profile.highest_level_ever, 6)
+    self.assertEqual(
+      list(LevelLog.objects.filter(user=user).order_by('level').values_list('level', flat=True)),
+      [2, 3, 4, 5, 6],
+    )
+
+  def test_uncomplete_keeps_level(self):
+    user = User.objects.create_user(username='undo', password='pw')
+    task = Task.objects.create(user=user, title='Big', diff='hard')
+    set_task_completion(user, task.id, True)
+    log = TaskLog.objects.get(task=task)
+    UserProfile.objects.filter(user=user).update(level=2, xp=log.xp_earned - 1)
+    set_task_completion(user, task.id, False)
+    profile = UserProfile.objects.get(user=user)
+    self.assertEqual((profile.level, profile.xp, profile.max_xp), (2, 0, levels.xp_for_level(2)))
+
+  def test_complete_uncomplete_cycles_do_not_farm_level_ups(self):
+    user = User.objects.create_user(username='farmer', password='pw')
+    task = Task.objects.create(user=user, title='Loop', diff='trivial')
+    # One XP short of level 2, so every completion crosses the boundary
+    UserProfile.objects.filter(user=user).update(xp=levels.xp_for_level(1) - 1)
+    set_task_completion(user, task.id, True)
+    set_task_completion(user, task.id, False)
+    coins = UserProfile.objects.get(user=user).coins
+    level_logs = LevelLog.objects.filter(user=user).count()
+    for _ in range(5):
+      set_task_completion(user, task.id, True)
+      set_task_completion(user, task.id, False)
+    self.assertEqual(UserProfile.objects.get(user=user).coins, coins)
+    self.assertEqual(LevelLog.objects.filter(user=user).count(), level_logs)
+    self.assertEqual(DailyUserStats.objects.get(user=user).level_ups, level_logs)
+
+
+def legacy_reset_dailies(user):
+  """The original per-row api_reset_dailies body, kept as a reference"""
+  today = timezone.now().date()
+  yesterday = today - timedelta(days=1)
+  profile, _ = UserProfile.objects.get_or_create(user=user)
+  dailies = Task.objects.filter(user=user, task_type='daily').order_by('id')
+
+  for daily in dailies:
+    if daily.created_at.date() == today:
+      continue
+    was_completed_yesterday = False
+    if daily.last_completed:
+      if daily.last_completed.date() in (yesterday, today):
+        was_completed_yesterday = True
+    elif daily.completed:
+      if daily.completed_at:
+        if daily.completed_at.date() in (yesterday, today):
+          was_completed_yesterday = True
+      else:
+        was_completed_yesterday = True
+    if not was_completed_yesterday:
+      profile.lose_health(2 + {'trivial': 0, 'easy': 1, 'medium': 2, 'hard': 3}[daily.diff])
+      if profile.avatar_state != 'celebrating':
+        profile.avatar_state = 'hurt'
+      daily.streak = 0
+
+  yesterday_start = timezone.make_aware(datetime.combine(yesterday, datetime.min.time()))
+  yesterday_end = timezone.make_aware(datetime.combine(yesterday, datetime.max.time()))
+  overdue_tasks = Task.objects.filter(
+    user=user, task_type='scheduled', completed=False,
+    due__gte=yesterday_start, due__lte=yesterday_end,
+  ).order_by('id')
+  for task in overdue_tasks:
+    hp_loss = 2 + {'trivial': 0, 'easy': 1, 'medium': 2, 'hard': 3}[task.diff]
+    weeks_overdue = (timezone.now() - task.due).days // 7
+    if weeks_overdue > 0:
+      hp_loss = hp_loss * (2 * weeks_overdue)
+    profile.lose_health(hp_loss)
+    if profile.avatar_state not in ['celebrating', 'celebrate']:
+      profile.avatar_state = 'hurt'
+
+  for daily in dailies:
+    daily.completed = False
+    daily.completed_at = None
+    if not daily.last_completed:
+      daily.streak = 0
+    daily.save()
+
+  for habit in Habit.objects.filter(user=user):
+    habit.reset_counters()
+
+  max_streak = Task.objects.filter(user=user, task_type='daily').aggregate(Max('streak'))['streak__max'] or 0
+  if max_streak > profile.longest_daily_streak:
+    profile.longest_daily_streak = max_streak
+  profile.save()
+
+
+class DailyRolloverTests(TestCase):
+  """roll_over_dailies must leave the same state as the per-row implementation"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='roller', password='pw')
+    self.client.force_login(self.user)
+
+  def make_fixture(self, rng):
+    now = timezone.now()
+    moments = [None, now, now - timedelta(hours=20), now - timedelta(days=1), now - timedelta(days=3)]
+    diffs = ['trivial', 'easy', 'medium', 'hard']
+    for i in range(12):
+      task = Task.objects.create(
+        user=self.user,
+        title=f'Daily {i}',
+        task_type='daily',
+        diff=rng.choice(diffs),
+        completed=rng.random() < 0.5,
+        completed_at=rng.choice(moments),
+        last_completed=rng.choice(moments),
+        streak=rng.randint(0, 20),
+      )
+      Task.objects.filter(pk=task.pk).update(created_at=rng.choice([now, now - timedelta(days=10)]))
+    for i in range(4):
+      Task.objects.create(
+        user=self.user,
+        title=f'Scheduled {i}',
+        diff=rng.choice(diffs),
+        due=now - timedelta(days=1),
+        completed=rng.random() < 0.3,
+      )
+    habit = Habit.objects.create(user=self.user, title='Habit', reset_freq='daily', pos_count=3, neg_count=1)
+    Habit.objects.filter(pk=habit.pk).update(last_reset=now - timedelta(days=2))
+    UserProfile.objects.filter(user=self.user).update(
+      hp=rng.choice([3, 12, 50]), level=rng.randint(1, 5), coins=40, longest_daily_streak=5,
+    )
+
+  def snapshot(self):
+    profile = UserProfile.objects.filter(user=self.user).values(
+      'level', 'xp', 'max_xp', 'hp', 'coins', 'longest_daily_streak', 'avatar_state'
+    ).get()
+    tasks = list(Task.objects.filter(user=self.user).order_by('id').values_list(
+      'id', 'completed', 'completed_at', 'streak'
+    ))
+    habits = list(Habit.objects.filter(user=self.user).order_by('id').values_list('id', 'pos_count', 'neg_count'))
+    return profile, tasks, habits
+
+  def test_matches_per_row_implementation(self):
+    for seed in range(15):
+      with self.subTest(seed=seed):
+        with transaction.atomic():
+          self.make_fixture(random.Random(seed))
+          with transaction.atomic():
+            legacy_reset_dailies(self.user)
+            expected = self.snapshot()
+            transaction.set_rollback(True)
+          roll_over_dailies(self.user)
+          self.assertEqual(self.snapshot(), expected)
+          transaction.set_rollback(True)
+
+  def test_endpoint_write_count(self):
+    self.make_fixture(random.Random(1))
+    with CaptureQueriesContext(connection) as ctx:
+      response = self.client.post('/api/dailies/reset')
+    self.assertEqual(response.status_code, 200)
+    writes = [q for q in ctx.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+    self.assertLessEqual(len(writes), 6)
+
+
+class RolloverCommandTests(TestCase):
+  """rollover_day processes each user once; the API then has nothing left to do"""
+
+  def setUp(self):
+    self.users = [User.objects.create_user(username=f'night{i}', password='pw') for i in range(3)]
+    yesterday = timezone.now() - timedelta(days=1)
+    for user in self.users:
+      Task.objects.filter(user=user).update(created_at=yesterday - timedelta(days=1))
+
+  def test_command_sets_watermark_and_skips_processed_users(self):
+    out = StringIO()
+    call_command('rollover_day', '--batch-size', '2', stdout=out)
+    self.assertIn('Rolled over 3 users', out.getvalue())
+    today = timezone.now().date()
+    self.assertEqual(
+      UserProfile.objects.filter(user__in=self.users, rolled_over_through=today).count(), 3
+    )
+
+    out = StringIO()
+    call_command('rollover_day', stdout=out)
+    self.assertIn('Rolled over 0 users', out.getvalue())
+
+  def test_api_is_noop_after_command(self):
+    call_command('rollover_day', stdout=StringIO())
+    self.client.force_login(self.users[0])
+    hp = UserProfile.objects.get(user=self.users[0]).hp
+
+    with CaptureQueriesContext(connection) as ctx:
+      check = self.client.get('/api/dailies/check').json()
+      reset = self.client.post('/api/dailies/reset').json()
+    self.assertFalse(check['needs_check'])
+    self.assertEqual((reset['missed_dailies'], reset['overdue_tasks']), (0, 0))
+    self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT'))])
+    self.assertEqual(UserProfile.objects.get(user=self.users[0]).hp, hp)
+
+
+class CheckDailiesTests(TestCase):
+  """api_check_dailies finds pending items with range filters"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='checker', password='pw')
+    self.client.force_login(self.user)
+    Task.objects.filter(user=self.user).delete()
+    now = timezone.now()
+    old = now - timedelta(days=5)
+
+    def daily(title, **fields):
+      task = Task.objects.create(user=self.user, title=title, task_type='daily', **fields)
+      Task.objects.filter(pk=task.pk).update(created_at=fields.pop('created_at', old))
+      return task
+
+    self.done_yesterday = daily('Yesterday', last_completed=now - timedelta(days=1))
+    self.stale = daily('Stale', completed=True, completed_at=old, last_completed=old)
+    self.new = daily('New', created_at=now)
+    self.overdue = Task.objects.create(user=self.user, title='Overdue', due=now - timedelta(days=1))
+
+  def test_pending_items_and_stale_reset(self):
+    data = self.client.get('/api/dailies/check').json()
+    self.assertTrue(data['needs_check'])
+    self.assertEqual(
+      data['pending_dailies'],
+      [{'id': self.stale.id, 'title': 'Stale', 'completed': False, 'type': 'daily'}],
+    )
+    self.assertEqual([task['id'] for task in data['pending_tasks']], [self.overdue.id])
+    self.stale.refresh_from_db()
+    self.assertFalse(self.stale.completed)
+    self.assertIsNone(self.stale.completed_at)
+
+  def test_query_count(self):
+    # session, user, rollover watermark, stale UPDATE, two range SELECTs
+    with self.assertNumQueries(6):
+      self.client.get('/api/dailies/check')
+
+
+class QueryPlanTests(TestCase):
+  """Hot read endpoints must not fall back to full table scans (SQLite only)"""
+
+  ENDPOINTS = [
+    '/api/bootstrap/',
+    '/api/profile/',
+    '/api/habits/',
+    '/api/tasks/',
+    '/api/dailies/check',
+    '/api/recap/',
+    '/api/stats/slots/',
+    '/api/stats/value/?slots=all',
+    '/api/tags/',
+    '/api/shop/items/',
+    '/api/customization/owned/',
+    '/api/study/stats/?type=monthly',
+    '/api/study/stats/?type=weekly',
+    '/api/study/colors',
+  ]
+  # Tables that may be scanned: table -> reason
+  ALLOWED_SCANS = {}
+
+  def setUp(self):
+    if connection.vendor != 'sqlite':
+      self.skipTest('EXPLAIN QUERY PLAN is SQLite specific')
+    self.user = User.objects.create_user(username='planner', password='pw')
+    self.client.force_login(self.user)
+    habit = Habit.objects.filter(user=self.user).first()
+    for i in range(3):
+      HabitLog.objects.create(user=self.user, habit=habit, positive=True)
+      task = Task.objects.create(user=self.user, title=f'Daily {i}', task_type='daily')
+      TaskLog.objects.create(user=self.user, task=task)
+      StudySession.objects.create(user=self.user, subject='Math', active=False, duration_minutes=30)
+      LevelLog.objects.create(user=self.user, level=i + 2)
+    stat_types = ['hours_studied', 'tasks_completed', 'habits_completed', 'longest_streak', 'current_streak', 'coins_earned']
+    for slot_number, stat_type in enumerate(stat_types, start=1):
+      StatSlot.objects.update_or_create(user=self.user, slot_number=slot_number, defaults={'stat_type': stat_type})
+
+  def full_scans(self, sql):
+    with connection.cursor() as cursor:
+      cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+      details = [row[-1] for row in cursor.fetchall()]
+    return [
+      detail for detail in details
+      if detail.startswith('SCAN core_') and detail.split()[1] not in self.ALLOWED_SCANS
+    ]
+
+  def test_no_full_scans(self):
+    for url in self.ENDPOINTS:
+      with self.subTest(url=url):
+        with CaptureQueriesContext(connection) as ctx:
+          response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Captured SQL has its parameters inlined, so it can be explained as is
+        for query in ctx.captured_queries:
+          if query['sql'].startswith('SELECT'):
+            self.assertEqual(self.full_scans(query['sql']), [], query['sql'])
+
+
+class DailyUserStatsTests(TestCase):
+  """The daily rollup is kept current on writes and matches a rebuild from the logs"""
+
+  FIELDS = [
+    'date', 'tasks_completed', 'habits_positive', 'habits_negative', 'study_minutes',
+    'subject_minutes', 'xp_earned', 'coins_earned', 'level_ups',
+  ]
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='rollup', password='pw')
+    self.client.force_login(self.user)
+
+  def rows(self):
+    return list(DailyUserStats.objects.filter(user=self.user).order_by('date').values(*self.FIELDS))
+
+  def post(self, url, data=None):
+    return self.client.post(url, data or {}, content_type='application/json')
+
+  def test_incremental_rows_match_rebuild(self):
+    habit = Habit.objects.get(user=self.user)
+    Habit.objects.filter(pk=habit.pk).update(diff='hard')
+    self.post(f'/api/habits/{habit.id}/complete/', {'positive': True})
+    self.post(f'/api/habits/{habit.id}/complete/', {'positive': False})
+
+    kept = Task.objects.create(user=self.user, title='Kept', diff='medium')
+    undone = Task.objects.create(user=self.user, title='Undone', diff='hard')
+    # One level up from the next reward
+    UserProfile.objects.filter(user=self.user).update(xp=levels.xp_for_level(1) - 1)
+    self.post(f'/api/tasks/{kept.id}/complete/', {'completed': True})
+    self.post(f'/api/tasks/{undone.id}/complete/', {'completed': True})
+    self.post(f'/api/tasks/{undone.id}/complete/', {'completed': False})
+
+    self.post('/api/habits/study/start/', {'subject': 'Math', 'color': '#112233'})
+    StudySession.objects.filter(user=self.user, active=True).update(start_time=timezone.now() - timedelta(minutes=95))
+    self.post('/api/habits/study/stop/')
+
+    incremental = self.rows()
+    self.assertEqual(len(incremental), 1)
+    day = incremental[0]
+    self.assertEqual((day['tasks_completed'], day['habits_positive'], day['habits_negative']), (1, 1, 1))
+    self.assertEqual((day['study_minutes'], day['subject_minutes']), (95, {'Math': 95}))
+    self.assertEqual(day['level_ups'], 1)
+
+    call_command('rebuild_daily_stats', stdout=StringIO())
+    self.assertEqual(self.rows(), incremental)
+
+  def test_monthly_study_stats_read_rollup(self):
+    month_start = timezone.now().replace(day=1, hour=9, minute=0, second=0, microsecond=0)
+    for offset, subject, minutes in [(0, 'Math', 60), (0, 'Math', 30), (0, 'Art', 45), (1, 'Math', 120)]:
+      session = StudySession.objects.create(user=self.user, subject=subject, duration_minutes=minutes, active=False)
+      StudySession.objects.filter(pk=session.pk).update(start_time=month_start + timedelta(days=offset))
+    rebuild_daily_stats(self.user.id)
+
+    data = self.client.get('/api/study/stats/?type=monthly').json()
+    first, second = month_start.date().isoformat(), (month_start + timedelta(days=1)).date().isoformat()
+    self.assertEqual(data['by_day'], {first: {'Math': 1.5, 'Art': 0.75}, second: {'Math': 2.0}})
+    self.assertEqual(data['by_subject'], {'Math': 3.5, 'Art': 0.75})
+    self.assertEqual(data['total_hours'], 4.25)
+
+    self.client.post('/api/study/colors', {
+      'color_legend': {'Maths': '#112233', 'Art': '#445566'},
+      'subject_renames': {'Maths': 'Math'},
+    }, content_type='application/json')
+    data = self.client.get('/api/study/stats/?type=monthly').json()
+    self.assertEqual(data['by_subject'], {'Maths': 3.5, 'Art': 0.75})
+
+  def test_week_recap_reads_rollup(self):
+    today = timezone.now().date()
+    last_sunday = today - timedelta(days=today.weekday() + 1)
+    DailyUserStats.objects.create(
+      user=self.user, date=last_sunday, tasks_completed=3, habits_positive=2, habits_negative=1,
+      study_minutes=660, subject_minutes={'Math': 660}, level_ups=6,
+    )
+    DailyUserStats.objects.create(user=self.user, date=today, tasks_completed=9)
+
+    data = self.client.get('/api/recap/').json()
+    self.assertEqual((data['tasks_completed'], data['hours_studied']), (3, 11.0))
+    types = [item['type'] for item in data['items']]
+    self.assertIn('study', types)
+    self.assertIn('level_up', types)
+
+
+class WeeklyStudyStatsTests(TestCase):
+  """Weekly study stats: one pass over the sessions, one legend query"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='weekly', password='pw')
+    self.client.force_login(self.user)
+    now = timezone.now()
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=8, minute=0, second=0, microsecond=0)
+    for offset, subject, minutes, color in [(0, 'Math', 60, '#000001'), (2, 'Math', 30, None), (1, 'Art', 90, '#000002')]:
+      session = StudySession.objects.create(
+        user=self.user, subject=subject, duration_minutes=minutes, color=color, active=False
+      )
+      StudySession.objects.filter(pk=session.pk).update(start_time=week_start + timedelta(days=offset))
+    SubjectColor.objects.create(user=self.user, subject='Math', color='#ff0000', year=week_start.year, month=week_start.month)
+    self.week_start = week_start
+
+  def test_weekly_stats(self):
+    # session, user, sessions, legend
+    with self.assertNumQueries(4):
+      data = self.client.get('/api/study/stats/?type=weekly').json()
+    self.assertEqual(data['by_subject'], {'Math': 1.5, 'Art': 1.5})
+    self.assertEqual(data['color_legend'], {'Math': '#ff0000'})
+    first_day = data['by_day'][self.week_start.date().isoformat()]
+    self.assertEqual(first_day['subjects'], {'Math': 1.0})
+    self.assertEqual(first_day['sessions'][0]['color'], '#ff0000')
+    art_day = data['by_day'][(self.week_start + timedelta(days=1)).date().isoformat()]
+    self.assertEqual(art_day['sessions'][0]['color'], '#000002')
+    self.assertEqual(data['total_hours'], 3.0)
+
+
+class WeeklyRecapSnapshotTests(TestCase):
+  """Last week's recap is computed once and dropped only when that week changes"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='recap', password='pw')
+    self.client.force_login(self.user)
+    today = timezone.now().date()
+    self.last_sunday = today - timedelta(days=today.weekday() + 1)
+    DailyUserStats.objects.create(user=self.user, date=self.last_sunday, tasks_completed=2)
+
+  def test_snapshot_served_after_first_access(self):
+    first = self.client.get('/api/recap/').json()
+    self.assertEqual(first['tasks_completed'], 2)
+    # session, user, snapshot
+    with self.assertNumQueries(3):
+      self.assertEqual(self.client.get('/api/recap/').json(), first)
+
+  def test_invalidated_by_edits_to_that_week_only(self):
+    self.client.get('/api/recap/')
+    DailyUserStats.record(self.user, tasks_completed=1)
+    self.assertTrue(WeeklyRecap.objects.filter(user=self.user).exists())
+
+    last_week = timezone.now() - timedelta(days=timezone.now().weekday() + 1)
+    DailyUserStats.record(self.user, when=last_week, tasks_completed=-1)
+    self.assertFalse(WeeklyRecap.objects.filter(user=self.user).exists())
+    self.assertEqual(self.client.get('/api/recap/').json()['tasks_completed'], 1)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(TestCase):
+  """Read endpoints are served from the per-user cache until the user's data changes"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='cached', password='pw')
+    self.client.force_login(self.user)
+
+  def test_second_read_is_a_hit(self):
+    before = response_cache_stats()
+    first = self.client.get('/api/tags/')
+    self.assertEqual(first['X-Cache'], 'MISS')
+    # session + user only
+    with self.assertNumQueries(2):
+      second = self.client.get('/api/tags/')
+    self.assertEqual(second['X-Cache'], 'HIT')
+    self.assertEqual(second.json(), first.json())
+    after = response_cache_stats()
+    self.assertEqual(after['hits'] - before['hits'], 1)
+    self.assertEqual(after['misses'] - before['misses'], 1)
+
+  def test_mutations_invalidate(self):
+    self.client.get('/api/habits/')
+    self.client.post('/api/habits/create/', {'title': 'New habit'}, content_type='application/json')
+    response = self.client.get('/api/habits/')
+    self.assertEqual(response['X-Cache'], 'MISS')
+    self.assertIn('New habit', [habit['title'] for habit in response.json()['habits']])
+
+    # Signals cover writes made outside the views
+    Habit.objects.filter(user=self.user, title='New habit').get().delete()
+    response = self.client.get('/api/habits/')
+    self.assertNotIn('New habit', [habit['title'] for habit in response.json()['habits']])
+
+  def test_users_do_not_share_entries(self):
+    self.client.get('/api/profile/')
+    other = User.objects.create_user(username='other', password='pw')
+    self.client.force_login(other)
+    self.assertEqual(self.client.get('/api/profile/').json()['username'], 'other')
+
+  def test_tasks_are_not_cached(self):
+    self.client.get('/api/tasks/')
+    self.assertNotIn('X-Cache', self.client.get('/api/tasks/'))
+
+  def test_entries_expire_with_the_day(self):
+    self.client.get('/api/study/colors')
+    tomorrow = timezone.now() + timedelta(days=1)
+    with mock.patch('core.response_cache.timezone.now', return_value=tomorrow):
+      self.assertEqual(self.client.get('/api/study/colors')['X-Cache'], 'MISS')
+
+  @override_settings(RESPONSE_CACHE_ENABLED=False)
+  def test_disabled_cache_reads_through(self):
+    self.client.get('/api/profile/')
+    response = self.client.get('/api/profile/')
+    self.assertNotIn('X-Cache', response)
+    self.client.post('/api/habits/study/start/', {'subject': 'Math'}, content_type='application/json')
+    StudySession.objects.filter(user=self.user).update(active=False)
+    self.assertFalse(self.client.get('/api/habits/study/stop/').json()['active'])
+
+
+class StartStudySessionTests(TestCase):
+  """api_start_study_session reads the month's legend once and writes in one transaction"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='starter', password='pw')
+    self.client.force_login(self.user)
+    now = timezone.now()
+    last = (now.replace(day=1) - timedelta(days=1))
+    for i in range(10):
+      SubjectColor.objects.create(user=self.user, subject=f'S{i}', color=f'#0000{i:02d}', year=last.year, month=last.month)
+
+  def start(self, **data):
+    response = self.client.post('/api/habits/study/start/', data, content_type='application/json')
+    self.assertEqual(response.status_code, 200)
+    return response.json()
+
+  def test_carry_over_and_conflicts(self):
+    data = self.start(subject='Math', color='#000003', carry_over_colors=True)
+    self.assertTrue(data['subject_changed'])
+    self.assertEqual((data['subject'], data['color']), ('S3', '#000003'))
+    now = timezone.now()
+    self.assertEqual(SubjectColor.objects.filter(user=self.user, year=now.year, month=now.month).count(), 10)
+    self.assertEqual(UserProfile.objects.get(user=self.user).avatar_state, 'studying')
+
+    data = self.start(subject='S3', color='#abcdef')
+    self.assertEqual((data['subject'], data['color']), ('S3', '#abcdef'))
+    self.assertEqual(StudySession.objects.filter(user=self.user, active=True).count(), 1)
+
+  def test_query_budget(self):
+    with CaptureQueriesContext(connection) as ctx:
+      self.start(subject='Math', color='#123456', carry_over_colors=True)
+    queries = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+    # session, user, deactivate, first-session check, legend, last month,
+    # carry-over insert, subject insert, session insert, profile update
+    self.assertLessEqual(len(queries), 10)
+    self.assertFalse([sql for sql in queries if 'django_datetime_extract' in sql])
+
+
+class StopStudySessionTests(TestCase):
+  """Study rewards use the day's running total from the rollup"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='stopper', password='pw')
+    self.client.force_login(self.user)
+
+  def stop_session(self, started_minutes_ago):
+    session = StudySession.objects.create(user=self.user, subject='Math', color='#123456')
+    StudySession.objects.filter(pk=session.pk).update(
+      start_time=timezone.now() - timedelta(minutes=started_minutes_ago)
+    )
+    with CaptureQueriesContext(connection) as ctx:
+      data = self.client.post('/api/habits/study/stop/').json()
+    return data, len(ctx.captured_queries)
+
+  def test_rewards_use_running_total(self):
+    # 4h50 already studied today: this session crosses the 5 hour mark
+    DailyUserStats.record(self.user, subject_minutes={'History': 290})
+    data, _ = self.stop_session(20)
+    self.assertEqual(data['xp_earned'], 3)
+    self.assertEqual(data['coins_earned'], 1)
+    self.assertEqual(DailyUserStats.study_minutes_on(self.user), 310)
+
+  def test_query_count_does_not_grow_with_sessions(self):
+    _, first = self.stop_session(30)
+    for _ in range(20):
+      StudySession.objects.create(user=self.user, subject='Math', color='#123456', active=False, duration_minutes=5)
+    _, later = self.stop_session(30)
+    self.assertEqual(first, later)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ActiveSessionMarkerTests(TestCase):
+  """Page guards and status checks read the cached active-session marker"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='guarded', password='pw')
+    self.client.force_login(self.user)
+
+  def test_marker_follows_start_and_stop(self):
+    self.client.post('/api/habits/study/start/', {'subject': 'Math'}, content_type='application/json')
+    self.assertRedirects(self.client.get('/stats/'), '/', fetch_redirect_response=False)
+    # session + user; the marker comes from the cache
+    with self.assertNumQueries(2):
+      self.assertEqual(self.client.get('/shop/').status_code, 302)
+    with self.assertNumQueries(2):
+      status = self.client.get('/api/habits/study/stop/').json()
+    self.assertEqual(status['subject'], 'Math')
+
+    self.client.post('/api/habits/study/stop/')
+    self.assertFalse(self.client.get('/api/habits/study/stop/').json()['active'])
+    self.assertEqual(self.client.get('/stats/').status_code, 200)
+
+  def test_status_poll_keeps_response_cache(self):
+    self.client.get('/api/tags/')
+    self.client.get('/api/habits/study/stop/')
+    self.assertEqual(self.client.get('/api/tags/')['X-Cache'], 'HIT')
+
+
+class SubjectColorUpdateTests(TestCase):
+  """api_subject_colors POST writes the legend with set-based statements"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='painter', password='pw')
+    self.client.force_login(self.user)
+    now = timezone.now()
+    self.year, self.month = now.year, now.month
+
+  def post_legend(self, legend, renames=None):
+    with CaptureQueriesContext(connection) as ctx:
+      response = self.client.post('/api/study/colors', {
+        'color_legend': legend, 'subject_renames': renames or {},
+      }, content_type='application/json')
+    self.assertEqual(response.status_code, 200)
+    return len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']])
+
+  def legend(self):
+    return dict(SubjectColor.objects.filter(
+      user=self.user, year=self.year, month=self.month
+    ).values_list('subject', 'color'))
+
+  def test_upsert_rename_and_delete(self):
+    self.post_legend({'Math': '#000001', 'Art': '#000002', 'Gym': '#000003'})
+    StudySession.objects.create(user=self.user, subject='Math', active=False, duration_minutes=30)
+    StudySession.objects.create(user=self.user, subject='Art', active=False, duration_minutes=15)
+
+    # Swap two names and drop Gym in one request
+    self.post_legend({'Art': '#000001', 'Math': '#000004'}, {'Art': 'Math', 'Math': 'Art'})
+    self.assertEqual(self.legend(), {'Art': '#000001', 'Math': '#000004'})
+    self.assertEqual(
+      dict(StudySession.objects.filter(user=self.user).values_list('duration_minutes', 'subject')),
+      {30: 'Art', 15: 'Math'},
+    )
+
+  def test_query_count_does_not_grow_with_legend(self):
+    small = self.post_legend({f'S{i}': f'#0000{i:02d}' for i in range(3)}, {'T0': 'S0'})
+    large = self.post_legend({f'S{i}': f'#0000{i:02d}' for i in range(30)}, {f'T{i}': f'S{i}' for i in range(10)})
+    self.assertEqual(small, large)
+
+
+class CarryOverColorsTests(TestCase):
+  """api_carry_over_colors copies last month's legend with one INSERT"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='carrier', password='pw')
+    self.client.force_login(self.user)
+    now = timezone.now()
+    self.year, self.month = now.year, now.month
+    last = now.replace(day=1) - timedelta(days=1)
+    for i in range(20):
+      SubjectColor.objects.create(user=self.user, subject=f'S{i}', color=f'#0000{i:02d}', year=last.year, month=last.month)
+    SubjectColor.objects.create(user=self.user, subject='S0', color='#ffffff', year=self.year, month=self.month)
+
+  def test_carries_missing_subjects(self):
+    with CaptureQueriesContext(connection) as ctx:
+      data = self.client.post('/api/study/colors/carry-over').json()
+    self.assertEqual(data['carried_over_count'], 19)
+    self.assertEqual(data['color_legend']['S0'], '#ffffff')
+    self.assertEqual(data['color_legend'], SubjectColor.legend_for(self.user, self.year, self.month))
+    inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT') and '"core_subjectcolor"' in q['sql']]
+    self.assertEqual(len(inserts), 1)
+    # session, user, first-session check, two legends, insert
+    self.assertEqual(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]), 6)
+
+  def test_rejected_after_first_session(self):
+    StudySession.objects.create(user=self.user, subject='S1', active=False, duration_minutes=10)
+    response = self.client.post('/api/study/colors/carry-over')
+    self.assertEqual(response.status_code, 400)
+
+
+class TagRegistryTests(TestCase):
+  """Default tags come from the migration and the tag union is one query"""
+
+  def setUp(self):
+    self.user = User.objects.create_user(username='tagger', password='pw')
+    self.client.force_login(self.user)
+
+  def test_api_tags(self):
+    self.client.post('/api/habits/create/', {'title': 'Read', 'tags': ['Books', 'Study']}, content_type='application/json')
+    self.client.post('/api/tasks/create/', {'title': 'Draw', 'tags': ['Art']}, content_type='application/json')
+    self.assertEqual(Tag.objects.filter(name='Study').count(), 1)
+    # session, user, tag union
+    with self.assertNumQueries(3):
+      tags = self.client.get('/api/tags/').json()['tags']
+    self.assertEqual(tags, sorted(set(DEFAULT_TAGS) | {'Books', 'Art'}))
+
+  def test_tag_ids_for_creates_unknown_names_once(self):
+    first = tag_ids_for(['Work', 'Piano', 'Piano'])
+    self.assertEqual(first, [Tag.objects.get(name='Work').id, Tag.objects.get(name='Piano').id])
+    with self.assertNumQueries(1):
+      self.assertEqual(tag_ids_for(['Piano', 'Work']), first[::-1])
+
+  @override_settings(RESPONSE_CACHE_ENABLED=False)
+  def test_tag_ids_for_reads_only_the_named_tags(self):
+    work = Tag.objects.get_or_create(name='Work')[0]
+    with CaptureQueriesContext(connection) as ctx:
+      self.assertEqual(tag_ids_for(['Work']), [work.id])
+    self.assertEqual(len(ctx.captured_queries), 1)
+    self.assertIn('"core_tag"."name" IN', ctx.captured_queries[0]['sql'])
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class TagRegistryCacheTests(TransactionTestCase):
+  """Outside transactions the name -> id map is kept in memory until a tag changes"""
+
+  def tearDown(self):
+    invalidate_tag_registry()
+
+  def test_map_is_reused_until_a_tag_changes(self):
+    tag_ids()
+    with self.assertNumQueries(0):
+      tag_ids()
+    tag = Tag.objects.create(name='Chess')
+    self.assertEqual(tag_ids()['Chess'], tag.id)
+
+  def test_changed_map_is_not_reloaded_in_transactions(self):
+    # Creating a tag changes the registry version
+    tag = Tag.objects.create(name='Chess')
+    with transaction.atomic():
+      with CaptureQueriesContext(connection) as ctx:
+        self.assertEqual(tag_ids_for(['Chess']), [tag.id])
+    self.assertEqual(len(ctx.captured_queries), 1)
+    self.assertIn('"core_tag"."name" IN', ctx.captured_queries[0]['sql'])
@@ -11,6 +11,7 @@ urlpatterns = [
   path("shop/", views.shop_page, name="shop"),
 
   # API endpoints
+  path("api/bootstrap/", views.api_bootstrap, name="api_bootstrap"),
   path("api/profile/", views.api_user_profile, name="api_profile"),
   path("api/habits/", views.api_habits, name="api_habits"),
   path("api/tasks/", views.api_tasks, name="api_tasks"),
@@ -42,6 +42,10 @@ from .shop_stats_views import (
     api_subject_colors,
 )
 
+from .dashboard_views import (
+    api_bootstrap,
+)
+
 __all__ = [
     # Auth views
     'login_view',
@@ -80,5 +84,7 @@ __all__ = [
     'api_study_stats',
     'api_carry_over_colors',
     'api_subject_colors',
+    # Dashboard views
+    'api_bootstrap',
 ]
 
@@ -3,6 +3,8 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 
+from ..active_session import with_active_study_session
+
 def login_view(request):
   """Login view"""
   if request.user.is_authenticated:
@@ -50,24 +52,20 @@ def index(request):
   return render (request, 'index.html')
 
 @login_required
+@with_active_study_session
 def stats_page(request):
   """Monthly stat page - inaccessible during active study session"""
-  from ..models import StudySession
-  # Check if user has an active study session
-  active_session = StudySession.objects.filter(user=request.user, active=True).first()
-  if active_session:
+  if request.active_study_session:
     # Redirect to home page
     return redirect('index')
   
   return render(request, 'stats.html')
 
 @login_required
+@with_active_study_session
 def shop_page(request):
   """Shop page - inaccessible during active study session"""
-  from ..models import StudySession
-  # Check if user has an active study session
-  active_session = StudySession.objects.filter(user=request.user, active=True).first()
-  if active_session:
+  if request.active_study_session:
     return redirect('index')
   
   return render(request, 'shop.html')
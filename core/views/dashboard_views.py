@@ -0,0 +1,77 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from django.contrib.auth.decorators import login_required
+
+from ..models import (
+    UserProfile,
+    Habit,
+    Task,
+)
+from ..serializers import serialize_habits, serialize_tasks
+from ..rollover import reset_due_habits
+from ..active_session import active_study_session
+from .game_views import (
+    normalize_profile,
+    profile_data,
+    active_session_data,
+    pending_checks_data,
+)
+from .shop_stats_views import (
+    week_recap_data,
+    stat_slots_data,
+    stat_values,
+    tag_names_for,
+)
+
+BOOTSTRAP_SECTIONS = [
+  'profile',
+  'habits',
+  'tasks',
+  'tags',
+  'dailies',
+  'study_session',
+  'recap',
+  'stat_slots',
+]
+
+@login_required
+@require_http_methods(["GET"])
+def api_bootstrap(request):
+  """Everything the dashboard needs on load in a single response.
+
+  Optional ?include=profile,habits,... limits the sections that are built
+  (e.g. to skip the recap when the client has it cached).
+  """
+  include = request.GET.get('include', '').strip()
+  sections = set(include.split(',')) if include else set(BOOTSTRAP_SECTIONS)
+  user = request.user
+
+  # One profile load shared by the profile payload and the stat values
+  profile, _ = UserProfile.objects.get_or_create(user=user)
+  normalize_profile(profile)
+
+  data = {}
+  if 'profile' in sections:
+    data['profile'] = profile_data(user, profile)
+  if 'habits' in sections:
+    reset_due_habits(user)
+    data['habits'] = serialize_habits(Habit.objects.filter(user=user))
+  # Before the tasks: the check un-completes stale dailies
+  if 'dailies' in sections:
+    data['dailies'] = pending_checks_data(user)
+  if 'tasks' in sections:
+    data['tasks'] = serialize_tasks(Task.objects.filter(user=user))
+  if 'tags' in sections:
+    data['tags'] = tag_names_for(user)
+  if 'study_session' in sections:
+    data['study_session'] = active_session_data(active_study_session(user.id))
+  if 'recap' in sections:
+    data['recap'] = week_recap_data(user)
+  if 'stat_slots' in sections:
+    slots = stat_slots_data(user)
+    data['stat_slots'] = {
+      'slots': slots,
+      'values': stat_values(user, profile, [t for t in dict.fromkeys(slots.values()) if t]),
+    }
+
+  return JsonResponse(data)
@@ -3,10 +3,10 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.db.models import Max, Q
-from datetime import datetime, timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from datetime import datetime, timedelta, timezone as dt_timezone
 import json
-import random
 
 from ..models import (
     UserProfile,
@@ -14,18 +14,42 @@ from ..models import (
     Task,
     StudySession,
     SubjectColor,
-    Tag,
-    HabitLog,
-    TaskLog,
+    DailyUserStats,
+    previous_month,
 )
-
-# API Endpoints
-@login_required
-@require_http_methods(["GET", "POST"])
-def api_user_profile(request):
-  """Get user profile data"""
-  profile, _ = UserProfile.objects.get_or_create(user=request.user)
-  # Keep progress consistent and carry XP overflow into next levels.
+from ..serializers import serialize_habits, serialize_tasks
+from ..rollover import (
+  reset_due_habits,
+  invalidate_habit_reset,
+  roll_over_dailies,
+  rolled_over_today,
+  reset_stale_dailies,
+  pending_dailies_q,
+  overdue_tasks_q,
+)
+from ..counters import adjust_counters
+from ..rewards import complete_habit, set_task_completion, locked_profile, reward_transaction, save_progress
+from ..response_cache import cached_per_user, invalidates_user_cache
+from ..active_session import with_active_study_session, remember_active_session
+from ..tags import tag_ids_for
+from .. import levels
+
+# Profile columns api_user_profile may change; coins and the all-time
+# counters are only written with F-expressions
+PROFILE_EDIT_FIELDS = [
+  'avatar_state',
+  'avatar_background_color',
+  'avatar_floor_color',
+  'avatar_character',
+  'avatar_clothes',
+  'avatar_shirt',
+  'avatar_pants',
+  'avatar_socks',
+  'avatar_shoes',
+]
+
+def normalize_profile(profile):
+  """Keep progress consistent and carry XP overflow into next levels"""
   changed_fields = set()
   if profile.level < 1:
     profile.level = 1
@@ -34,22 +58,53 @@ def api_user_profile(request):
     profile.xp = 0
     changed_fields.add('xp')
 
+  level, xp = levels.normalize(profile.level, profile.xp)
+  if (level, xp) != (profile.level, profile.xp):
+    profile.level, profile.xp = level, xp
+    changed_fields.update({'xp', 'level'})
+    if profile.level > profile.highest_level_ever:
+      profile.highest_level_ever = profile.level
+      changed_fields.add('highest_level_ever')
+
   expected_max_xp = profile.calculate_xp_for_lvl()
   if profile.max_xp != expected_max_xp:
     profile.max_xp = expected_max_xp
     changed_fields.add('max_xp')
 
-  while profile.max_xp > 0 and profile.xp >= profile.max_xp:
-    profile.xp -= profile.max_xp
-    profile.level += 1
-    profile.max_xp = profile.calculate_xp_for_lvl()
-    if profile.level > profile.highest_level_ever:
-      profile.highest_level_ever = profile.level
-      changed_fields.add('highest_level_ever')
-    changed_fields.update({'xp', 'level', 'max_xp'})
-
   if changed_fields:
     profile.save(update_fields=list(changed_fields))
+
+def profile_data(user, profile):
+  """Profile payload shared by api_user_profile and api_bootstrap"""
+  return {
+    'user_id': user.id,
+    'username': user.username,
+    'level': profile.level,
+    'xp': profile.xp,
+    'max_xp': profile.max_xp,
+    'hp': profile.hp,
+    'max_hp': profile.max_hp,
+    'coins': profile.coins,
+    'avatar': profile.avatar,
+    'avatar_state': profile.avatar_state,
+    'avatar_background_color': getattr(profile, 'avatar_background_color', None) or '#d8b9b9',
+    'avatar_floor_color': getattr(profile, 'avatar_floor_color', None) or '#d8aeae',
+    'avatar_character': getattr(profile, 'avatar_character', None) or 'default_girl',
+    'avatar_clothes': getattr(profile, 'avatar_clothes', None) or 'default',
+    'avatar_shirt': getattr(profile, 'avatar_shirt', None) or 'default',
+    'avatar_pants': getattr(profile, 'avatar_pants', None) or 'default',
+    'avatar_socks': getattr(profile, 'avatar_socks', None) or 'default',
+    'avatar_shoes': getattr(profile, 'avatar_shoes', None) or 'default',
+  }
+
+# API Endpoints
+@login_required
+@require_http_methods(["GET", "POST"])
+@cached_per_user
+def api_user_profile(request):
+  """Get user profile data"""
+  profile, _ = UserProfile.objects.get_or_create(user=request.user)
+  normalize_profile(profile)
   
   if request.method == 'POST':
     data = json.loads(request.body) if request.body else {}
@@ -57,8 +112,9 @@ def api_user_profile(request):
       profile.avatar_state = data['avatar_state']
     if 'avatar_background_color' in data:
       profile.avatar_background_color = data['avatar_background_color']
-      if profile.coins >= 50:
-        profile.coins -= 50
+      # Charged in SQL so a reward committed since the read above is kept
+      UserProfile.objects.filter(user=request.user, coins__gte=50).update(coins=F('coins') - 50)
+      profile.refresh_from_db(fields=['coins'])
     if 'avatar_floor_color' in data:
       profile.avatar_floor_color = data['avatar_floor_color']
     if 'avatar_character' in data:
@@ -73,37 +129,26 @@ def api_user_profile(request):
       profile.avatar_socks = data['avatar_socks']
     if 'avatar_shoes' in data:
       profile.avatar_shoes = data['avatar_shoes']
-    profile.save()
+    profile.save(update_fields=PROFILE_EDIT_FIELDS)
   
-  return JsonResponse({
-    'user_id': request.user.id,
-    'username': request.user.username,
-    'level': profile.level,
-    'xp': profile.xp,
-    'max_xp': profile.max_xp,
-    'hp': profile.hp,
-    'max_hp': profile.max_hp,
-    'coins': profile.coins,
-    'avatar': profile.avatar,
-    'avatar_state': profile.avatar_state,
-    'avatar_background_color': getattr(profile, 'avatar_background_color', None) or '#d8b9b9',
-    'avatar_floor_color': getattr(profile, 'avatar_floor_color', None) or '#d8aeae',
-    'avatar_character': getattr(profile, 'avatar_character', None) or 'default_girl',
-    'avatar_clothes': getattr(profile, 'avatar_clothes', None) or 'default',
-    'avatar_shirt': getattr(profile, 'avatar_shirt', None) or 'default',
-    'avatar_pants': getattr(profile, 'avatar_pants', None) or 'default',
-    'avatar_socks': getattr(profile, 'avatar_socks', None) or 'default',
-    'avatar_shoes': getattr(profile, 'avatar_shoes', None) or 'default',
-    })
+  return JsonResponse(profile_data(request.user, profile))
 
 @login_required
 @require_http_methods(["GET"])
 def api_habits(request):
   """Get user habits"""
+  # Reset counters that are due based on reset_freq (no writes until then);
+  # a reset invalidates the cached list
+  reset_due_habits(request.user)
+  return habits_response(request)
+
+@cached_per_user
+def habits_response(request):
+  """Filtered habit list of api_habits"""
   filter_type = request.GET.get('filter', 'all')
   search_query = request.GET.get('search', '').strip()
   tag_filter = request.GET.get('tag', '').strip()
-  
+
   habits = Habit.objects.filter(user=request.user)
 
   # Apply search filter
@@ -115,36 +160,18 @@ def api_habits(request):
     habits = habits.filter(tags__name=tag_filter).distinct()
 
   if filter_type == 'weak':
-    habits = [h for h in habits if h.weak()]
+    habits = habits.weak()
   elif filter_type == 'strong':
-    habits = [h for h in habits if h.strong()]
-
-  habits_data = []
-  for habit in habits:
-    # Reset counters if needed based on reset_freq
-    habit.reset_counters()
-    
-    habits_data.append({
-      'id': habit.id,
-      'title': habit.title,
-      'details': habit.details,
-      'tags': [tag.name for tag in habit.tags.all()],
-      'diff': habit.diff,
-      'allow_pos': habit.allow_pos,
-      'allow_neg': habit.allow_neg,
-      'reset_freq': habit.reset_freq,
-      'pos_count': habit.pos_count,
-      'neg_count': habit.neg_count,
-      'color': habit.get_color(),
-      'strong': habit.strong(),
-    })
+    habits = habits.strong()
+
+  habits_data = serialize_habits(habits)
 
   return JsonResponse({'habits': habits_data})
 
 @login_required
 @require_http_methods(["GET"])
 def api_tasks(request):
-  """Get user tasks"""
+  """Get user tasks (not cached: overdue state and colors change with the clock)"""
   filter_type = request.GET.get('filter', 'all')
   search_query = request.GET.get('search', '').strip()
   tag_filter = request.GET.get('tag', '').strip()
@@ -164,28 +191,14 @@ def api_tasks(request):
   elif filter_type == 'dailies':
     tasks = tasks.filter(task_type='daily')
 
-  tasks_data = []
-  for task in tasks:
-    tasks_data.append({
-    'id': task.id,
-    'title': task.title,
-    'details': task.details,
-    'tags': [tag.name for tag in task.tags.all()],
-    'diff': task.diff,
-    'task_type': task.task_type,
-    'due': task.due,
-    'completed': task.completed,
-    'completed_at': task.completed_at.isoformat() if task.completed_at else None,
-    'streak': task.streak,
-    'color': task.get_color(),
-    'overdue': task.overdue(), 
-    })
+  tasks_data = serialize_tasks(tasks)
 
   return JsonResponse({'tasks': tasks_data})
 
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@invalidates_user_cache
 def api_create_habit(request):
   """Create a new habit"""
   data = json.loads(request.body)
@@ -199,17 +212,17 @@ def api_create_habit(request):
     allow_neg=data.get('allow_neg', data.get('allow_negative', True)),
     reset_freq=data.get('reset_freq', 'never'),
   )
+  invalidate_habit_reset(request.user)
 
   tag_names = data.get('tags', [])
-  for tag_name in tag_names:
-    tag, _ = Tag.objects.get_or_create(name=tag_name)
-    habit.tags.add(tag)
+  habit.tags.add(*tag_ids_for(tag_names))
 
   return JsonResponse({'id': habit.id, 'success': True})
 
 @login_required
 @csrf_exempt
 @require_http_methods(["PUT"])
+@invalidates_user_cache
 def api_update_habit(request, habit_id):
   """Update an existing habit"""
   try:
@@ -234,13 +247,12 @@ def api_update_habit(request, habit_id):
     if 'reset_freq' in data:
       habit.reset_freq = data.get('reset_freq')
     habit.save()
+    if 'reset_freq' in data:
+      invalidate_habit_reset(request.user)
 
     # Update tags
     tag_names = data.get('tags', [])
-    habit.tags.clear()
-    for tag_name in tag_names:
-      tag, _ = Tag.objects.get_or_create(name=tag_name)
-      habit.tags.add(tag)
+    habit.tags.set(tag_ids_for(tag_names))
 
     return JsonResponse({'id': habit.id, 'success': True})
   except Habit.DoesNotExist:
@@ -249,6 +261,7 @@ def api_update_habit(request, habit_id):
 @login_required
 @csrf_exempt
 @require_http_methods(["DELETE"])
+@invalidates_user_cache
 def api_delete_habit(request, habit_id):
   """Delete an existing habit"""
   try:
@@ -261,6 +274,7 @@ def api_delete_habit(request, habit_id):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@invalidates_user_cache
 def api_create_task(request):
   """Create a new task"""
   data = json.loads(request.body)
@@ -282,15 +296,14 @@ def api_create_task(request):
   )
 
   tag_names = data.get('tags', [])
-  for tag_name in tag_names:
-    tag, _ = Tag.objects.get_or_create(name=tag_name)
-    task.tags.add(tag)
+  task.tags.add(*tag_ids_for(tag_names))
 
   return JsonResponse({'id': task.id, 'success': True})
 
 @login_required
 @csrf_exempt
 @require_http_methods(["PUT"])
+@invalidates_user_cache
 def api_update_task(request, task_id):
   """Update an existing task"""
   try:
@@ -316,10 +329,7 @@ def api_update_task(request, task_id):
 
     # Update tags
     tag_names = data.get('tags', [])
-    task.tags.clear()
-    for tag_name in tag_names:
-      tag, _ = Tag.objects.get_or_create(name=tag_name)
-      task.tags.add(tag)
+    task.tags.set(tag_ids_for(tag_names))
 
     return JsonResponse({'id': task.id, 'success': True})
   except Task.DoesNotExist:
@@ -328,6 +338,7 @@ def api_update_task(request, task_id):
 @login_required
 @csrf_exempt
 @require_http_methods(["DELETE"])
+@invalidates_user_cache
 def api_delete_task(request, task_id):
   """Delete an existing task"""
   try:
@@ -337,9 +348,27 @@ def api_delete_task(request, task_id):
   except Task.DoesNotExist:
     return JsonResponse({'error': 'Task not found'}, status=404)
 
+def month_bounds(year, month):
+  """Half-open [start, end) datetimes of a month, usable with the start_time indexes"""
+  start = datetime(year, month, 1, tzinfo=dt_timezone.utc)
+  end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+  return start, end
+
+def is_first_session_of_month(user, year, month):
+  """Whether the user has no finished session in the month yet"""
+  month_start, month_end = month_bounds(year, month)
+  return not StudySession.objects.filter(
+    user=user,
+    start_time__gte=month_start,
+    start_time__lt=month_end,
+    active=False
+  ).exists()
+
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@invalidates_user_cache
+@transaction.atomic
 def api_start_study_session(request):
   """Start a study session with color conflict handling"""
   data = json.loads(request.body)
@@ -350,143 +379,104 @@ def api_start_study_session(request):
   now = timezone.now()
   year = now.year
   month = now.month
-
   StudySession.objects.filter(user=request.user, active=True).update(active=False)
 
-  first_session_this_month = not StudySession.objects.filter(
-    user=request.user,
-    start_time__year=year,
-    start_time__month=month,
-    active=False
-  ).exists()
+  first_session_this_month = is_first_session_of_month(request.user, year, month)
+
+  # This month's legend, read once for the carry-over, conflict and color checks
+  legend = SubjectColor.legend_for(request.user, year, month)
 
   # If first session and user wants to carry over colors, copy last month's colors
-  # Check if colors already exist for this month (might have been carried over already)
-  current_month_colors_exist = SubjectColor.objects.filter(
-    user=request.user,
-    year=year,
-    month=month
-  ).exists()
-  
-  if first_session_this_month and carry_over_colors is True and not current_month_colors_exist:
-    last_month = month - 1
-    last_year = year
-    if last_month == 0:
-      last_month = 12
-      last_year = year - 1
-    
-    last_month_colors = SubjectColor.objects.filter(
-      user=request.user,
-      year=last_year,
-      month=last_month
-    )
-
-    for old_color in last_month_colors:
-      SubjectColor.objects.get_or_create(
-        user=request.user,
-        subject=old_color.subject,
-        year=year,
-        month=month,
-        defaults={'color': old_color.color}
-      )
+  # unless this month already has colors (might have been carried over already)
+  if first_session_this_month and carry_over_colors is True and not legend:
+    previous = SubjectColor.legend_for(request.user, *previous_month(year, month))
+    legend, _ = SubjectColor.carry_over(request.user, year, month, legend, previous)
 
   # Check for color conflicts
-  existing_color = SubjectColor.objects.filter(
-    user=request.user,
-    color=color,
-    year=year,
-    month=month
-  ).exclude(subject=subject).first()
-
   subject_changed = False
-  if existing_color:
-    # Color is taken, change subject to the one using this color
-    subject = existing_color.subject
-    subject_changed = True
+  for other_subject, other_color in legend.items():
+    if other_color == color and other_subject != subject:
+      # Color is taken, change subject to the one using this color
+      subject = other_subject
+      subject_changed = True
+      break
 
-  # Get or create color assignment for this subject
   # Always ensure the color is set, even if the subject already exists
-  subject_color_obj, created = SubjectColor.objects.get_or_create(
-    user=request.user,
-    subject=subject,
-    year=year,
-    month=month,
-    defaults={'color': color}
-  )
-
-  # Always update the color to ensure it's current (unless subject was changed due to conflict)
-  if not subject_changed:
-    if subject_color_obj.color != color:
-      subject_color_obj.color = color
-      subject_color_obj.save()
+  # (unless subject was changed due to conflict)
+  if subject not in legend:
+    SubjectColor.objects.create(user=request.user, subject=subject, year=year, month=month, color=color)
+    legend[subject] = color
+  elif not subject_changed and legend[subject] != color:
+    SubjectColor.objects.filter(user=request.user, subject=subject, year=year, month=month).update(color=color)
+    legend[subject] = color
 
   session = StudySession.objects.create(
     user=request.user,
     subject=subject,
-    color=subject_color_obj.color,
+    color=legend[subject],
   )
+  remember_active_session(session)
 
-  profile, _ = UserProfile.objects.get_or_create(user=request.user)
-  profile.avatar_state = 'studying'
-  profile.save()
+  # Only the avatar state changes; written without loading the profile
+  UserProfile.objects.filter(user=request.user).update(avatar_state='studying')
 
   return JsonResponse({
     'id': session.id,
     'success': True,
     'subject': subject,
     'subject_changed': subject_changed,
-    'color': subject_color_obj.color,
+    'color': legend[subject],
   })
 
+def active_session_data(marker):
+  """Active study session status payload from an active-session marker (or None)"""
+  response_data = {
+    'has_active_session': marker is not None,
+    'active': marker is not None,
+  }
+  if marker:
+    response_data['session_id'] = marker['id']
+    response_data['subject'] = marker['subject']
+    response_data['color'] = marker['color'] or '#3b82f6'
+    response_data['start_time'] = marker['start_time'].isoformat()
+  return response_data
+
 @login_required
 @csrf_exempt
 @require_http_methods(["POST", "GET"])
+@invalidates_user_cache
+@with_active_study_session
 def api_stop_study_session(request):
   """Stop active study session or check if one exists"""
-  session = StudySession.objects.filter(user=request.user, active=True).first()
-  
   # If GET request, just check and return status
   if request.method == 'GET':
-    response_data = {
-      'has_active_session': session is not None,
-      'active': session is not None,
-    }
-    if session:
-      response_data['session_id'] = session.id
-      response_data['subject'] = session.subject
-      response_data['color'] = session.color or '#3b82f6'
-      response_data['start_time'] = session.start_time.isoformat()
-    return JsonResponse(response_data)
-
+    return JsonResponse(active_session_data(request.active_study_session))
+  return stop_study_session(request)
+
+@reward_transaction
+def stop_study_session(request):
+  """Stop the active session and apply its rewards in one transaction"""
+  # Locked like the task in set_task_completion, so concurrent stops credit it once
+  session = StudySession.objects.select_for_update().filter(user=request.user, active=True).first()
   if session:
     duration = session.stop()
 
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    profile = locked_profile(request.user)
     profile.avatar_state = 'idle'
     xp_earned = 0
     level_up = False
     coins_earned = 0
     hours = 0
 
+    # Minutes go into the rollup first; the day's total is then read back
+    # from the row record() locked, so each daily hour block pays out once
+    DailyUserStats.record(request.user, when=session.start_time, subject_minutes={session.subject: duration})
+
     if duration:
       hours = duration / 60.0
-      profile.all_time_hours_studied += hours
 
-      # Calculate XP rewards for study sessions
-      today = timezone.now().date()
-      today_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-      today_end = timezone.make_aware(datetime.combine(today, datetime.max.time()))
-
-      today_sessions = StudySession.objects.filter(
-        user=request.user,
-        start_time__gte=today_start,
-        start_time__lte=today_end,
-        active=False
-      )
-
-      total_hours_today = sum(
-        (s.duration_minutes or 0) / 60.0 for s in today_sessions
-      )
+      # Running total of the session's day, including this session
+      total_hours_today = DailyUserStats.study_minutes_on(request.user, session.start_time) / 60.0
 
       xp_per_hour = 10 if total_hours_today >= 5.0 else 5
       
@@ -515,7 +505,10 @@ def api_stop_study_session(request):
         if profile.avatar_state != 'celebrating':
           profile.avatar_state = 'celebrating'
 
-    profile.save()
+    save_progress(profile)
+    adjust_counters(request.user, hours_studied=hours)
+    StudySession.objects.filter(pk=session.pk).update(xp_earned=xp_earned, coins_earned=coins_earned)
+    DailyUserStats.record(request.user, when=session.start_time, xp_earned=xp_earned, coins_earned=coins_earned)
 
     return JsonResponse({
       'duration_minutes': duration,
@@ -531,449 +524,77 @@ def api_stop_study_session(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@invalidates_user_cache
 def api_complete_habit(request, habit_id):
   """Complete a habit (positive/negative)"""
   data = json.loads(request.body)
   is_positive = data.get('positive', True)
 
   try:
-    habit = Habit.objects.get(id=habit_id, user=request.user)
-
-    if is_positive and habit.allow_pos:
-      habit.incr_pos()
-      HabitLog.objects.create(habit=habit, positive=True)
-
-      profile, _ = UserProfile.objects.get_or_create(user=request.user)
-      
-      # Base XP : 3-5
-      base_min = 3
-      base_max = 5
-
-      # Add diff bonus : +2xp per diff
-      diff_bonus = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[habit.diff]
-      xp = random.randint(base_min + diff_bonus, base_max + diff_bonus)
-
-      level_up = profile.add_xp(xp)
-      if level_up:
-        profile.avatar_state = 'celebrating'
-      elif profile.avatar_state == 'hurt':
-        profile.avatar_state = 'idle'
-      
-      # Coins : easy = 1-2, medium = 2-4, hard = 4-6
-      coins = 0
-      if habit.diff == 'easy':
-        coins = random.randint(1,2)
-      elif habit.diff == 'medium':
-        coins = random.randint(2,4)
-      elif habit.diff == 'hard':
-        coins = random.randint(4,6)
-      
-      if coins > 0:
-        profile.add_coins(coins)
-        if profile.avatar_state != 'celebrating':
-          profile.avatar_state = 'celebrating'
-      
-      if xp > 0 and not level_up:
-        if profile.avatar_state != 'celebrating':
-          profile.avatar_state = 'celebrating'
-      profile.all_time_habits_completed += 1
-      profile.save()
-
-    elif not is_positive and habit.allow_neg:
-      habit.incr_neg()
-      HabitLog.objects.create(habit=habit, positive=False)
-
-      profile, _ = UserProfile.objects.get_or_create(user=request.user)
-      
-      # Negative habits : same value as XP gain
-      base_min = 3
-      base_max = 5
-      diff_penalty = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[habit.diff]
-      hp_loss = random.randint(base_min + diff_penalty, base_max + diff_penalty)
-      profile.lose_health(hp_loss)
-      profile.avatar_state = 'hurt'
-
-      profile.save()
-
-    return JsonResponse({'success': True})
+    return JsonResponse(complete_habit(request.user, habit_id, is_positive))
   except Habit.DoesNotExist:
     return JsonResponse({'error': 'Habit not found'}, status=404)
   
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@invalidates_user_cache
 def api_complete_task(request, task_id):
   """Complete/uncomplete a task"""
-  try:
-    task = Task.objects.get(id=task_id, user=request.user)
+  data = json.loads(request.body) if request.body else {}
+  mark_completed = data.get('completed', True)
 
-    import json
-    data = json.loads(request.body) if request.body else {}
-    mark_completed = data.get('completed', True)
-
-    #If uncompleting
-    if not mark_completed and task.completed:
-      profile, _ = UserProfile.objects.get_or_create(user=request.user)
-
-      #Find the most recent TaskLog for task
-      try:
-        task_log = TaskLog.objects.filter(task=task).order_by('-created_at').first()
-        if task_log:
-          xp_deduct = task_log.xp_earned
-          coins_deduct = task_log.coins_earned
-
-          # Deduct XP
-          current_xp = profile.xp
-          current_level = profile.level
-
-          # Remove XP
-          profile.xp = max(0, profile.xp - xp_deduct)
-
-          #Check for level-down
-          if profile.xp < 0:
-            levels_down = 0
-            temp_xp = abs(profile.xp)
-            temp_level = current_level
-
-            while temp_xp > 0 and temp_level > 1:
-              xp_needed = ((temp_level - 2) + (temp_level - 1)) * 20 if temp_level > 1 else 20
-              if temp_xp >= xp_needed:
-                temp_xp -= xp_needed
-                temp_level -= 1
-                levels_down += 1
-              else:
-                break
-            
-            profile.level = max(1, profile.level - levels_down)
-            if profile.level < current_level:
-              xp_needed = ((profile.level - 1) + profile.level) * 20 if profile.level > 1 else 20
-              profile.xp = max(0, xp_needed - temp_xp)
-              profile.max_xp = ((profile.level - 1) + profile.level) * 20 if profile.level > 1 else 20
-            else:
-              profile.xp = 0
-
-          #Remove coins
-          profile.coins = max(0, profile.coins - coins_deduct)
-
-          # Decrement all_time_tasks_completed
-          profile.all_time_tasks_completed = max(0, profile.all_time_tasks_completed - 1)
-
-          # Reverse streak if incremented
-          if task.task_type == 'daily' and task.last_completed:
-            from datetime import date
-            today = date.today()
-            last_completed_date = task.last_completed.date() if hasattr(task.last_completed, 'date') else task.last_completed
-            if last_completed_date == today and task.streak > 0:
-              task.streak = max(0, task.streak - 1)
-
-          #Update longest streak if needed
-          if task.task_type == 'daily' and task.streak < profile.longest_daily_streak:
-            max_streak = Task.objects.filter(user=request.user, task_type='daily').aggregate(Max('streak'))['streak__max'] or 0
-            profile.longest_daily_streak = max_streak
-
-          if profile.avatar_state == 'celebrating':
-            profile.avatar_state = 'idle'
-
-          profile.save()
-
-          #Delete task log entry
-          task_log.delete()
-
-      except Exception as e:
-        pass
-
-      task.completed = False
-      task.completed_at = None
-
-      if task.task_type == 'scheduled' and task.due and task.due < timezone.now():
-        hp_loss = 2
-        diff_penalty = {'trivial': 0, 'easy': 1, 'medium': 2, 'hard': 3}[task.diff]
-        hp_loss += diff_penalty
-
-        days_overdue = (timezone.now() - task.due).days
-        weeks_overdue = days_overdue // 7
-        if weeks_overdue > 0:
-          hp_loss = hp_loss * (2 * weeks_overdue)
-
-        profile.lose_health(hp_loss)
-        profile.avatar_state = 'hurt'
-        profile.save()
-
-      task.save()
-      return JsonResponse({
-        'success': True,
-        'level_up': False,
-        'xp_earned': - xp_deduct if 'xp_deduct' in locals() else 0,
-        'coins_earned': -coins_deduct if 'coins_deduct' in locals() else 0,
-      })
-    
-    if mark_completed and not task.completed:
-      task.complete()
-
-      profile, _ = UserProfile.objects.get_or_create(user=request.user)
-      
-      xp = 0
-      coins = 0
-      
-      if task.task_type == 'daily':
-        # Daily rewards scale with streak
-        base_min = 5
-        base_max = 7
-        
-        # Add diff bonus : +2xp per diff
-        diff_bonus = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[task.diff]
-        
-        # Weekly streak bonus: +5xp per week
-        weeks_streak = task.streak // 7
-        weekly_bonus = weeks_streak * 5
-        
-        xp = random.randint(base_min + diff_bonus, base_max + diff_bonus) + weekly_bonus
-        level_up = profile.add_xp(xp)
-        
-        # Daily coins: easy = 1-3, medium = 3-5, hard = 5-7
-        if task.diff == 'easy':
-          coins = random.randint(1, 3)
-        elif task.diff == 'medium':
-          coins = random.randint(3, 5)
-        elif task.diff == 'hard':
-          coins = random.randint(5, 7)
-        
-        # Weekly streak bonus: +5 coins per week
-        coins += weeks_streak * 5
-        
-        if coins > 0:
-          profile.add_coins(coins)
-      else:
-        # Regular task rewards
-        base_min = 5
-        base_max = 10
-
-        diff_bonus = {'trivial': 0, 'easy': 2, 'medium': 4, 'hard': 6}[task.diff]
-        xp = random.randint(base_min + diff_bonus, base_max + diff_bonus)
-        level_up = profile.add_xp(xp)
-        
-        if task.diff == 'medium':
-          coins = random.randint(1,3)
-        elif task.diff == 'hard':
-          coins = random.randint(3,5)
-        
-        if coins > 0:
-          profile.add_coins(coins)
-
-      if level_up:
-        profile.avatar_state = 'celebrating'
-      elif xp > 0 and not level_up:
-        if profile.avatar_state != 'celebrating':
-          profile.avatar_state = 'celebrating'
-      elif profile.avatar_state == 'hurt':
-        profile.avatar_state = 'idle'
-      
-      profile.all_time_tasks_completed += 1
-
-      # Update longest streak
-      if task.task_type == 'daily':
-        max_streak = Task.objects.filter(user=request.user, task_type='daily').aggregate(
-          max_streak=Max('streak')
-        )['max_streak'] or 0
-        if max_streak > profile.longest_daily_streak:
-          profile.longest_daily_streak = max_streak
-      profile.save()
-
-      TaskLog.objects.create(task=task, xp_earned=xp, coins_earned=coins)
-      
-      return JsonResponse({
-        'success': True,
-        'level_up': level_up,
-        'xp_earned': xp,
-        'coins_earned': coins,
-      })
-    
-    return JsonResponse({
-      'success': True,
-      'level_up': False,
-      'xp_earned': 0,
-      'coins_earned': 0,
-    })
+  try:
+    return JsonResponse(set_task_completion(request.user, task_id, mark_completed))
   except Task.DoesNotExist:
     return JsonResponse({'error': 'Task not found'}, status=404)
   
-@login_required
-@require_http_methods(["GET"])
-def api_check_dailies(request):
-  """Check if there are pending dailies/tasks that need to be reviewed"""
-  today = timezone.now().date()
-  yesterday = today - timedelta(days=1)
-  
-  # Automatically reset dailies at the start of each day
-  all_dailies = Task.objects.filter(user=request.user, task_type='daily')
-  for daily in all_dailies:
-    # Skip dailies created today
-    if daily.created_at.date() >= today:
-      continue
-    
-    # Check if this daily was completed yesterday or before
-    needs_reset = False
-    if daily.last_completed:
-      last_completed_date = daily.last_completed.date() if hasattr(daily.last_completed, 'date') else daily.last_completed
-      # If completed yesterday or before, it needs to be reset for today
-      if last_completed_date < today:
-        needs_reset = True
-    elif daily.completed:
-      # If marked as completed but has no last_completed date, reset it
-      needs_reset = True
-    
-    # Reset if needed
-    if needs_reset and daily.completed:
-      daily.completed = False
-      daily.completed_at = None
-      daily.save()
-  
-  pending_dailies = []
-
-  for daily in all_dailies:
-    # Skip dailies created today
-    if daily.created_at.date() >= today:
-      continue
-    
-    # Check if daily was completed yesterday
-    was_completed_yesterday = False
-    if daily.last_completed:
-      last_completed_date = daily.last_completed.date() if hasattr(daily.last_completed, 'date') else daily.last_completed
-      if last_completed_date == yesterday:
-        was_completed_yesterday = True
-    
-    # Skip if completed yesterday (user already handled it)
-    if was_completed_yesterday:
-      continue
-    
-    # Include daily if it wasn't completed yesterday
-    pending_dailies.append({
-      'id': daily.id,
-      'title': daily.title,
-      'completed': daily.completed,
-      'type': 'daily',
-    })
-    
-  yesterday_start = timezone.make_aware(datetime.combine(yesterday, datetime.min.time()))
-  yesterday_end = timezone.make_aware(datetime.combine(yesterday, datetime.max.time()))
+def pending_checks_data(user):
+  """Reset stale dailies and collect yesterday's pending dailies/tasks"""
+  # Already rolled over today (e.g. by the nightly rollover_day command)
+  if rolled_over_today(user):
+    return {'pending_dailies': [], 'pending_tasks': [], 'needs_check': False}
 
-  pending_tasks = Task.objects.filter(
-    user=request.user,
-    task_type='scheduled',
-    completed=False,
-    due__gte=yesterday_start,
-    due__lte=yesterday_end,
-  )
+  now = timezone.now()
 
-  pending_tasks_data = []
-  for task in pending_tasks:
-    pending_tasks_data.append({
-      'id': task.id,
-      'title': task.title,
-      'completed': task.completed,
-      'type': 'task'
-    })
+  # Automatically reset dailies at the start of each day
+  reset_stale_dailies(user, now)
+
+  tasks = Task.objects.filter(user=user).order_by('id')
+  pending_dailies = [
+    {**daily, 'type': 'daily'}
+    for daily in tasks.filter(pending_dailies_q(now)).values('id', 'title', 'completed')
+  ]
+  pending_tasks_data = [
+    {**task, 'type': 'task'}
+    for task in tasks.filter(overdue_tasks_q(now)).values('id', 'title', 'completed')
+  ]
 
   # Check if modal needs to be shown
   needs_check = len(pending_dailies) > 0 or len(pending_tasks_data) > 0
 
-  return JsonResponse({
+  return {
     'pending_dailies': pending_dailies,
     'pending_tasks': pending_tasks_data,
     'needs_check': needs_check,
-  })
+  }
+
+@login_required
+@require_http_methods(["GET"])
+def api_check_dailies(request):
+  """Check if there are pending dailies/tasks that need to be reviewed"""
+  return JsonResponse(pending_checks_data(request.user))
 
 @login_required
 @require_http_methods(["POST"])
+@invalidates_user_cache
 def api_reset_dailies(request):
   """Reset dailies for new day; calculate penalties/rewards"""
-  today = timezone.now().date()
-  yesterday = today - timedelta(days=1)
-
-  profile, _ = UserProfile.objects.get_or_create(user=request.user)
-
-  dailies = Task.objects.filter(user=request.user, task_type='daily')
-
-  for daily in dailies:
-    # Skip dailies created today
-    if daily.created_at.date() == today:
-      continue
-
-    was_completed_yesterday = False
-
-    # Check if daily was completed yesterday or today
-    if daily.last_completed:
-      last_completed_date = daily.last_completed.date() if hasattr(daily.last_completed, 'date') else daily.last_completed
-      if last_completed_date == yesterday or last_completed_date == today:
-        was_completed_yesterday = True
-    elif daily.completed:
-      # If daily is marked as completed
-      if daily.completed_at:
-        completed_at_date = daily.completed_at.date() if hasattr(daily.completed_at, 'date') else daily.completed_at
-        if completed_at_date == yesterday or completed_at_date == today:
-          was_completed_yesterday = True
-      else:
-        was_completed_yesterday = True
-
-    if not was_completed_yesterday:
-      hp_loss = 2
-      diff_penalty = {'trivial': 0, 'easy': 1, 'medium': 2, 'hard': 3}[daily.diff]
-      hp_loss += diff_penalty
-      profile.lose_health(hp_loss)
-      if profile.avatar_state != 'celebrating':
-        profile.avatar_state = 'hurt'
-
-      # Reset streak if daily was not completed
-      daily.streak = 0
-
-  yesterday_start = timezone.make_aware(datetime.combine(yesterday, datetime.min.time()))
-  yesterday_end = timezone.make_aware(datetime.combine(yesterday, datetime.max.time()))
-
-  overdue_tasks = Task.objects.filter(
-    user = request.user,
-    task_type = 'scheduled',
-    completed = False,
-    due__gte = yesterday_start,
-    due__lte = yesterday_end,
-    )
-  
-  for task in overdue_tasks:
-    hp_loss = 2
-    diff_penalty = {'trivial': 0, 'easy': 1, 'medium': 2, 'hard': 3}[task.diff]
-    hp_loss += diff_penalty
-
-    days_overdue = (timezone.now() - task.due).days
-    weeks_overdue = days_overdue // 7
-    if weeks_overdue > 0:
-      hp_loss = hp_loss * (2 * weeks_overdue)
-
-    profile.lose_health(hp_loss)
-    if profile.avatar_state not in ['celebrating', 'celebrate']:
-      profile.avatar_state = 'hurt'
-
-  for daily in dailies:
-    daily.completed = False
-    daily.completed_at = None
-
-    # Reset streak for dailies that were never completed
-    if not daily.last_completed:
-      daily.streak = 0
-
-    daily.save()
-
-  habits = Habit.objects.filter(user=request.user)
-  for habit in habits:
-    habit.reset_counters()
-
-  max_streak = Task.objects.filter(user=request.user, task_type='daily').aggregate(Max('streak'))['streak__max'] or 0
-  if max_streak > profile.longest_daily_streak:
-    profile.longest_daily_streak = max_streak
-
-  profile.save()
+  missed_dailies, overdue_tasks = roll_over_dailies(request.user)
 
   return JsonResponse({
     'success': True,
-    'missed_dailies': dailies.count(),
-    'overdue_tasks': overdue_tasks.count(),
+    'missed_dailies': missed_dailies,
+    'overdue_tasks': overdue_tasks,
   })
 
@@ -2,9 +2,11 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Max, Sum, Q
-from django.db.models.functions import TruncDate
+from django.db import transaction
+from django.db.models import Case, F, Max, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from datetime import datetime, timedelta
 import json
 import logging
@@ -15,58 +17,57 @@ from ..models import (
     Task,
     StudySession,
     SubjectColor,
-    Tag,
-    HabitLog,
-    TaskLog,
-    LevelLog,
+    DailyUserStats,
+    WeeklyRecap,
     StatSlot,
     ShopItem,
     UserPurchase,
+    previous_month,
 )
-from ..constants import BACKGROUND_COLORS
+from ..constants import BACKGROUND_COLORS, DEFAULT_TAGS
+from ..response_cache import cached_per_user, invalidates_user_cache
+from ..tags import user_tag_names
+from .game_views import month_bounds, is_first_session_of_month
 
-@login_required
-@require_http_methods(["GET"])
-def api_last_week_recap(request):
-  """Generate last week recap with standout stats algorithm"""
-  now = timezone.now()
-  today = now.date()
-  
-  # Calculate last week (Monday to Sunday)
-  days_since_monday = today.weekday()
-  if days_since_monday == 0:
-    last_week_end_date = today - timedelta(days=1)
-  else:
-    # Last week ended on the most recent Sunday
-    last_week_end_date = today - timedelta(days=days_since_monday)
-  
+def week_recap_data(user):
+  """Last week recap, computed once per ISO week and served from a snapshot"""
+  today = timezone.now().date()
+
+  # Calculate last week (Monday to Sunday); it ended on the most recent Sunday
+  last_week_end_date = today - timedelta(days=today.weekday() + 1)
   last_week_start_date = last_week_end_date - timedelta(days=6)
-  
+  iso_year, iso_week, _ = last_week_start_date.isocalendar()
+
+  snapshot = WeeklyRecap.objects.filter(
+    user=user, iso_year=iso_year, iso_week=iso_week
+  ).values_list('data', flat=True).first()
+  if snapshot is not None:
+    return snapshot
+
+  data = compute_week_recap(user, last_week_start_date, last_week_end_date)
+  WeeklyRecap.objects.bulk_create(
+    [WeeklyRecap(user=user, iso_year=iso_year, iso_week=iso_week, data=data)],
+    ignore_conflicts=True,
+  )
+  return data
+
+def compute_week_recap(user, last_week_start_date, last_week_end_date):
+  """Week recap with standout stats algorithm"""
   prev_week_start = timezone.make_aware(datetime.combine(last_week_start_date, datetime.min.time()))
   prev_week_end = timezone.make_aware(datetime.combine(last_week_end_date, datetime.max.time()))
 
-  habits_completed = HabitLog.objects.filter(
-    habit__user=request.user,
-    created_at__gte=prev_week_start,
-    created_at__lte=prev_week_end
-  ).count()
-
-  tasks_completed = TaskLog.objects.filter(
-    task__user=request.user,
-    created_at__gte=prev_week_start,
-    created_at__lte=prev_week_end
-  ).count()
-
-  study_sessions = StudySession.objects.filter(
-    user=request.user,
-    start_time__gte=prev_week_start,
-    start_time__lte=prev_week_end,
-    active=False
-  )
-  total_study_hours = sum(s.duration_minutes or 0 for s in study_sessions) / 60
+  # At most 7 rollup rows instead of scanning the week's logs
+  week_days = list(DailyUserStats.objects.filter(
+    user=user,
+    date__gte=last_week_start_date,
+    date__lte=last_week_end_date,
+  ))
+  habits_completed = sum(day.habits_positive + day.habits_negative for day in week_days)
+  tasks_completed = sum(day.tasks_completed for day in week_days)
+  total_study_hours = sum(day.study_minutes for day in week_days) / 60
 
   dailies_during_week = Task.objects.filter(
-    user=request.user,
+    user=user,
     task_type='daily',
     created_at__lte=prev_week_end
   )
@@ -79,7 +80,7 @@ def api_last_week_recap(request):
 
   # Highest streak in dailies
   highest_streak_task = Task.objects.filter(
-    user=request.user,
+    user=user,
     task_type='daily',
     streak__gt=0
   ).order_by('-streak').first()
@@ -94,37 +95,36 @@ def api_last_week_recap(request):
 
   # Study session highlights
   # Check for subject with >10 hours total in the week
-  subject_hours = study_sessions.values('subject').annotate(
-    total_minutes=Sum('duration_minutes')
-  ).filter(total_minutes__gte=600)  # 10 hours = 600 minutes
-  
-  if subject_hours.exists():
-    top_subject = subject_hours.order_by('-total_minutes').first()
-    total_hours = top_subject['total_minutes'] / 60
+  subject_minutes = {}
+  for day in week_days:
+    for subject, minutes in day.subject_minutes.items():
+      subject_minutes[subject] = subject_minutes.get(subject, 0) + minutes
+  top_subject = max(subject_minutes.items(), key=lambda item: item[1], default=None)
+
+  if top_subject and top_subject[1] >= 600:  # 10 hours = 600 minutes
+    subject, total_minutes = top_subject
+    total_hours = total_minutes / 60
     standout_items.append({
       'type': 'study',
-      'title': top_subject['subject'],
+      'title': subject,
       'description': f"{total_hours:.1f} hours total",
       'icon': 'clock',
-      'score': int(top_subject['total_minutes'])
+      'score': int(total_minutes)
     })
   else:
     # Check for single day study session >2.5 hours
-    # Group by subject and date, then sum duration for each day
-    daily_study = study_sessions.annotate(
-      study_date=TruncDate('start_time')
-    ).values('subject', 'study_date').annotate(
-      daily_minutes=Sum('duration_minutes')
-    ).filter(daily_minutes__gte=150)  # 2.5 hours = 150 minutes
-    
-    if daily_study.exists():
-      # Get the day with the most minutes for a single subject
-      best_day = daily_study.order_by('-daily_minutes').first()
-      daily_minutes_value = best_day['daily_minutes']
+    # Get the day with the most minutes for a single subject
+    best_day = max(
+      ((subject, minutes) for day in week_days for subject, minutes in day.subject_minutes.items()),
+      key=lambda item: item[1],
+      default=None,
+    )
+    if best_day and best_day[1] >= 150:  # 2.5 hours = 150 minutes
+      subject, daily_minutes_value = best_day
       hours = daily_minutes_value / 60
       standout_items.append({
         'type': 'study',
-        'title': best_day['subject'],
+        'title': subject,
         'description': f"{hours:.1f} hours in one day",
         'icon': 'clock',
         'score': int(daily_minutes_value)
@@ -141,11 +141,7 @@ def api_last_week_recap(request):
     })
 
   # Level up highlight (>5 level ups in the week)
-  level_ups_count = LevelLog.objects.filter(
-    user=request.user,
-    created_at__gte=prev_week_start,
-    created_at__lte=prev_week_end
-  ).count()
+  level_ups_count = sum(day.level_ups for day in week_days)
   
   if level_ups_count > 5:
     standout_items.append({
@@ -180,7 +176,7 @@ def api_last_week_recap(request):
   best_habit = None
   best_score = 0
   
-  all_habits = Habit.objects.filter(user=request.user)
+  all_habits = Habit.objects.filter(user=user)
   for habit in all_habits:
     # If only positive is allowed, use highest pos_count
     if not habit.allow_neg and habit.allow_pos:
@@ -208,26 +204,34 @@ def api_last_week_recap(request):
   else:
     recap_text = "No standout stats last week. Let's aim higher this week!"
 
-  return JsonResponse({
+  return {
     'recap': recap_text,
     'hours_studied': round(total_study_hours, 1),
     'tasks_completed': tasks_completed,
     'missed_dailies': missed_dailies,
     'items': standout_items,
     'best_habit_title': best_habit_title,
-  })
+  }
+
+@login_required
+@require_http_methods(["GET"])
+def api_last_week_recap(request):
+  """Generate last week recap with standout stats algorithm"""
+  return JsonResponse(week_recap_data(request.user))
+
+def stat_slots_data(user):
+  """Map of slot number -> configured stat type"""
+  slots_data = {}
+  for slot in StatSlot.objects.filter(user=user):
+    slots_data[slot.slot_number] = slot.stat_type
+  return slots_data
 
 @login_required
 @require_http_methods(["GET", "POST"])
 def api_stat_slots(request):
   """Get or update user stat slots"""
   if request.method == "GET":
-    slots = StatSlot.objects.filter(user=request.user)
-    slots_data = {}
-    for slot in slots:
-      slots_data[slot.slot_number] = slot.stat_type
-
-    return JsonResponse({'slots': slots_data})
+    return JsonResponse({'slots': stat_slots_data(request.user)})
   
   else:
     data = json.loads(request.body)
@@ -243,94 +247,118 @@ def api_stat_slots(request):
 
     return JsonResponse({'success': True})
 
+def _stat_aggregates(user):
+  """Scalar aggregates the stat types are built from: name -> (queryset, user path, aggregate)"""
+  return {
+    'max_streak': (Task.objects.filter(user=user, task_type='daily'), 'user', Max('streak')),
+  }
+
+STAT_AGGREGATE_DEPENDENCIES = {
+  'current_streak': ['max_streak'],
+  'longest_streak': ['max_streak'],
+}
+
+def stat_values(user, profile, stat_types):
+  """Compute several stat types at once.
+
+  All-time counters are read straight from the profile (kept current by
+  core.counters); any aggregate the remaining stats need is evaluated as a
+  scalar subquery of a single SELECT, and profile corrections are written
+  with one save.
+  """
+  needed = {name for stat_type in stat_types for name in STAT_AGGREGATE_DEPENDENCIES.get(stat_type, [])}
+  totals = {}
+  if needed:
+    aggregates = _stat_aggregates(user)
+    expressions = {}
+    for name in needed:
+      queryset, user_path, aggregate = aggregates[name]
+      expressions[name] = Coalesce(
+        Subquery(queryset.order_by().values(user_path).annotate(total=aggregate).values('total')[:1]),
+        0,
+      )
+    totals = User.objects.filter(pk=user.pk).values(**expressions).first() or {name: 0 for name in needed}
+
+  values = {}
+  changed_fields = set()
+  for stat_type in stat_types:
+    if stat_type == 'hours_studied':
+      values[stat_type] = round(profile.all_time_hours_studied, 1)
+
+    elif stat_type == 'tasks_completed':
+      values[stat_type] = profile.all_time_tasks_completed
+
+    elif stat_type == 'habits_completed':
+      values[stat_type] = profile.all_time_habits_completed
+
+    elif stat_type == 'current_streak':
+      values[stat_type] = totals['max_streak']
+
+    elif stat_type == 'longest_streak':
+      max_streak = totals['max_streak']
+      # Update profile
+      if max_streak > profile.longest_daily_streak:
+        profile.longest_daily_streak = max_streak
+        changed_fields.add('longest_daily_streak')
+      values[stat_type] = max(profile.longest_daily_streak, max_streak)
+
+    elif stat_type == 'coins_earned':
+      # Keep all-time earned at least current balance to handle manual/admin adjustments.
+      corrected_earned = max(profile.all_time_coins_earned, profile.coins)
+      if corrected_earned != profile.all_time_coins_earned:
+        profile.all_time_coins_earned = corrected_earned
+        changed_fields.add('all_time_coins_earned')
+      values[stat_type] = corrected_earned
+
+    elif stat_type == 'level':
+      values[stat_type] = profile.highest_level_ever
+
+    else:
+      values[stat_type] = 0
+
+  if changed_fields:
+    profile.save(update_fields=list(changed_fields))
+  return values
+
+def stat_value(user, profile, stat_type):
+  """Compute the value for a specific stat type"""
+  return stat_values(user, profile, [stat_type])[stat_type]
+
 @login_required
 @require_http_methods(["GET"])
 def api_stat_value(request):
-  """Get value for specific stat type"""
-  stat_type = request.GET.get('type')
+  """Get value for one or more stat types.
+
+  ?type=hours_studied returns {'value': ...}. Several types (?type=a&type=b
+  or ?type=a,b) or ?slots=all (every configured slot) return
+  {'values': {stat_type: value}} computed in one pass.
+  """
+  stat_types = [t for value in request.GET.getlist('type') for t in value.split(',') if t]
+  batched = len(stat_types) > 1 or request.GET.get('slots') == 'all'
+  if request.GET.get('slots') == 'all':
+    stat_types += [t for t in stat_slots_data(request.user).values() if t]
+  stat_types = list(dict.fromkeys(stat_types))
+
   profile, _ = UserProfile.objects.get_or_create(user=request.user)
+  if not batched:
+    stat_type = stat_types[0] if stat_types else None
+    return JsonResponse({'value': stat_value(request.user, profile, stat_type)})
+  return JsonResponse({'values': stat_values(request.user, profile, stat_types)})
 
-  if stat_type == 'hours_studied':
-    total_minutes = StudySession.objects.filter(
-      user=request.user,
-      active=False
-    ).aggregate(total=Sum('duration_minutes'))['total'] or 0
-    total_hours = round(total_minutes / 60.0, 1)
-    if round(profile.all_time_hours_studied, 1) != total_hours:
-      profile.all_time_hours_studied = total_minutes / 60.0
-      profile.save(update_fields=['all_time_hours_studied'])
-    return JsonResponse({'value': total_hours})
-  
-  elif stat_type == 'tasks_completed':
-    tasks_completed = TaskLog.objects.filter(task__user=request.user).count()
-    if profile.all_time_tasks_completed != tasks_completed:
-      profile.all_time_tasks_completed = tasks_completed
-      profile.save(update_fields=['all_time_tasks_completed'])
-    return JsonResponse({'value': tasks_completed})
-  
-  elif stat_type == 'habits_completed':
-    habits_completed = HabitLog.objects.filter(
-      habit__user=request.user,
-      positive=True
-    ).count()
-    if profile.all_time_habits_completed != habits_completed:
-      profile.all_time_habits_completed = habits_completed
-      profile.save(update_fields=['all_time_habits_completed'])
-    return JsonResponse({'value': habits_completed})
-  
-  elif stat_type == 'current_streak':
-    max_streak = Task.objects.filter(user=request.user, task_type='daily').aggregate(
-      max_streak=Max('streak')
-    )['max_streak'] or 0
-    return JsonResponse({'value': max_streak})
-  
-  elif stat_type == 'longest_streak':
-    max_streak = Task.objects.filter(user=request.user, task_type='daily').aggregate(
-      max_streak=Max('streak')
-    )['max_streak'] or 0
-    # Update profile
-    if max_streak > profile.longest_daily_streak:
-      profile.longest_daily_streak = max_streak
-      profile.save()
-    return JsonResponse({'value': max(profile.longest_daily_streak, max_streak)})
-  
-  elif stat_type == 'coins_earned':
-    # Keep all-time earned at least current balance to handle manual/admin adjustments.
-    corrected_earned = max(profile.all_time_coins_earned, profile.coins)
-    if corrected_earned != profile.all_time_coins_earned:
-      profile.all_time_coins_earned = corrected_earned
-      profile.save(update_fields=['all_time_coins_earned'])
-    return JsonResponse({'value': corrected_earned})
-  
-  elif stat_type == 'level':
-    return JsonResponse({'value': profile.highest_level_ever})
-  
-  return JsonResponse({'value': 0})
+def tag_names_for(user):
+  """Default tags plus every tag used by the user's habits and tasks"""
+  return sorted(set(DEFAULT_TAGS) | user_tag_names(user))
 
 @login_required
 @require_http_methods(["GET"])
+@cached_per_user
 def api_tags(request):
-  """Get all available tags and ensure default tags by user exist"""
-  default_tags = ["Work", "Health", "Creativity", "Study", "Exercise", "Hobby", "Chores"]
-
-  for tag_name in default_tags:
-    Tag.objects.get_or_create(name=tag_name)
-
-  user_habit_tags = Tag.objects.filter(habit__user=request.user).distinct()
-  user_task_tags = Tag.objects.filter(task__user=request.user).distinct()
-  user_tags = (user_habit_tags | user_task_tags).distinct()
-
-  default_tag_names = set(default_tags)
-
-  user_tag_names = set([tag.name for tag in user_tags])
-
-  all_tag_names = list(default_tag_names | user_tag_names)
-  all_tag_names.sort()
-
-  return JsonResponse({'tags': all_tag_names})
+  """Get all available tags"""
+  return JsonResponse({'tags': tag_names_for(request.user)})
 
 @login_required
 @require_http_methods(["GET"])
+@cached_per_user
 def api_shop_items(request):
   """Get shop items"""
   # Get user's purchased items
@@ -417,6 +445,7 @@ def api_shop_items(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@invalidates_user_cache
 def api_purchase_item(request):
   """Purchase item from shop"""
   data = json.loads(request.body)
@@ -461,7 +490,7 @@ def api_purchase_item(request):
         # Store as JSON string
         profile.purchased_backgrounds = json.dumps(purchased_backgrounds)
       
-      profile.save()
+      profile.save(update_fields=['coins', 'purchased_backgrounds'])
       
       return JsonResponse({
         'success': True, 
@@ -474,7 +503,7 @@ def api_purchase_item(request):
 
     if profile.coins >= item.price:
       profile.coins -= item.price
-      profile.save()
+      profile.save(update_fields=['coins'])
 
       UserPurchase.objects.get_or_create(user=request.user, item=item)
 
@@ -492,6 +521,7 @@ def api_purchase_item(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@invalidates_user_cache
 def api_create_reward(request):
   """Create a new user-defined reward"""
   logger = logging.getLogger(__name__)
@@ -534,6 +564,7 @@ def api_create_reward(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["PUT"])
+@invalidates_user_cache
 def api_update_reward(request, reward_id):
   """Update an existing user-defined reward"""
   try:
@@ -566,6 +597,7 @@ def api_update_reward(request, reward_id):
 @login_required
 @csrf_exempt
 @require_http_methods(["DELETE"])
+@invalidates_user_cache
 def api_delete_reward(request, reward_id):
   """Delete a user-defined reward"""
   try:
@@ -582,6 +614,7 @@ def api_delete_reward(request, reward_id):
 
 @login_required
 @require_http_methods(["GET"])
+@cached_per_user
 def api_owned_customization(request):
   """Get user's owned customization items"""
   profile, _ = UserProfile.objects.get_or_create(user=request.user)
@@ -726,12 +759,12 @@ def api_study_stats(request):
     else:
       end_of_month = target_date.replace(month=target_date.month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
 
-    sessions = StudySession.objects.filter(
+    # One rollup row per day with study time instead of every session
+    month_days = DailyUserStats.objects.filter(
       user=request.user,
-      start_time__gte=start_of_month,
-      start_time__lt=end_of_month,
-      active=False
-    )
+      date__gte=start_of_month.date(),
+      date__lt=end_of_month.date(),
+    ).exclude(subject_minutes={}).order_by('date').values_list('date', 'subject_minutes')
 
     year = target_date.year
     month = target_date.month
@@ -752,22 +785,12 @@ def api_study_stats(request):
     for subject in color_legend.keys():
       stats_by_subject[subject] = 0
 
-    for session in sessions:
-      day = session.start_time.date()
-      day_str = day.isoformat()
-      subject = session.subject
-      duration_hours = (session.duration_minutes or 0) / 60.0
-      total_hours += duration_hours
-
-      if day_str not in stats_by_day:
-        stats_by_day[day_str] = {}
-      if subject not in stats_by_day[day_str]:
-        stats_by_day[day_str][subject] = 0
-      stats_by_day[day_str][subject] += duration_hours
-
-      if subject not in stats_by_subject:
-        stats_by_subject[subject] = 0
-      stats_by_subject[subject] += duration_hours
+    for day, subject_minutes in month_days:
+      day_hours = {subject: minutes / 60.0 for subject, minutes in subject_minutes.items()}
+      stats_by_day[day.isoformat()] = day_hours
+      for subject, duration_hours in day_hours.items():
+        total_hours += duration_hours
+        stats_by_subject[subject] = stats_by_subject.get(subject, 0) + duration_hours
 
     return JsonResponse({
       'type': 'monthly',
@@ -793,57 +816,17 @@ def api_study_stats(request):
       start_time__gte=start_of_week,
       start_time__lt=end_of_week,
       active=False
-    )
+    ).order_by('start_time').values_list('subject', 'start_time', 'duration_minutes', 'color')
 
     stats_by_day = {}
-    stats_by_subject = {}
+    hours_by_subject = {}
     total_hours = 0
-    subjects_in_week = set()
+    week_sessions = []
 
-    # First pass: collect all subjects that appear in this week's sessions
-    for session in sessions:
-      subjects_in_week.add(session.subject)
-
-    # Get color legend only for subjects that appear in this week
-    # Use the month that contains the start of the week
-    week_year = start_of_week.year
-    week_month = start_of_week.month
-    color_legend = {}
-    
-    # Get colors for subjects that appear in this week
-    subject_colors = SubjectColor.objects.filter(
-      user=request.user,
-      year=week_year,
-      month=week_month,
-      subject__in=subjects_in_week
-    )
-    for sc in subject_colors:
-      color_legend[sc.subject] = sc.color
-    
-    # Also check if week spans into next month and get colors from there too
-    if end_of_week.month != week_month or end_of_week.year != week_year:
-      next_month_year = end_of_week.year
-      next_month_month = end_of_week.month
-      next_month_colors = SubjectColor.objects.filter(
-        user=request.user,
-        year=next_month_year,
-        month=next_month_month,
-        subject__in=subjects_in_week
-      )
-      for sc in next_month_colors:
-        # Only add if not already in color_legend (prioritize start of week month)
-        if sc.subject not in color_legend:
-          color_legend[sc.subject] = sc.color
-
-    # Initialize all subjects with 0 hours
-    for subject in color_legend.keys():
-      stats_by_subject[subject] = 0
-
-    for session in sessions:
-      day = session.start_time.date()
-      day_str = day.isoformat()
-      subject = session.subject
-      duration_hours = (session.duration_minutes or 0) / 60.0
+    # Single pass over the needed columns; colors are filled in once the legend is known
+    for subject, start_time, duration_minutes, color in sessions.iterator():
+      day_str = start_time.date().isoformat()
+      duration_hours = (duration_minutes or 0) / 60.0
       total_hours += duration_hours
 
       if day_str not in stats_by_day:
@@ -851,22 +834,44 @@ def api_study_stats(request):
           'subjects': {},
           'sessions': []
         }
-      
-      if subject not in stats_by_day[day_str]['subjects']:
-        stats_by_day[day_str]['subjects'][subject] = 0
-      stats_by_day[day_str]['subjects'][subject] += duration_hours
+      day_subjects = stats_by_day[day_str]['subjects']
+      day_subjects[subject] = day_subjects.get(subject, 0) + duration_hours
 
-      stats_by_day[day_str]['sessions'].append({
+      session_data = {
         'subject': subject,
-        'start_time': session.start_time.isoformat(),
-        'duration_minutes': session.duration_minutes or 0,
-        # Always prefer current legend mapping so bars match legend after recoloring.
-        'color': color_legend.get(subject) or session.color or '#3b82f6',
-      })
+        'start_time': start_time.isoformat(),
+        'duration_minutes': duration_minutes or 0,
+        'color': color,
+      }
+      stats_by_day[day_str]['sessions'].append(session_data)
+      week_sessions.append(session_data)
+
+      hours_by_subject[subject] = hours_by_subject.get(subject, 0) + duration_hours
+
+    # Color legend for the subjects in this week, from the month containing the
+    # start of the week and (if the week spans two months) the next month, in one query
+    week_year = start_of_week.year
+    week_month = start_of_week.month
+    months = Q(year=week_year, month=week_month)
+    if end_of_week.month != week_month or end_of_week.year != week_year:
+      months |= Q(year=end_of_week.year, month=end_of_week.month)
+    color_legend = {}
+    legend_rows = SubjectColor.objects.filter(
+      months,
+      user=request.user,
+      subject__in=hours_by_subject.keys(),
+    ).values_list('subject', 'color', 'year', 'month')
+    # Prioritize the month of the start of the week
+    for subject, color, year, month in sorted(legend_rows, key=lambda row: (row[2], row[3]) == (week_year, week_month)):
+      color_legend[subject] = color
 
-      if subject not in stats_by_subject:
-        stats_by_subject[subject] = 0
-      stats_by_subject[subject] += duration_hours
+    for session_data in week_sessions:
+      # Always prefer current legend mapping so bars match legend after recoloring.
+      session_data['color'] = color_legend.get(session_data['subject']) or session_data['color'] or '#3b82f6'
+
+    # Subjects with a legend entry first, as before
+    stats_by_subject = {subject: 0 for subject in color_legend}
+    stats_by_subject.update(hours_by_subject)
 
     return JsonResponse({
       'type': 'weekly',
@@ -881,6 +886,8 @@ def api_study_stats(request):
 @login_required
 @csrf_exempt
 @require_http_methods(['POST'])
+@invalidates_user_cache
+@transaction.atomic
 def api_carry_over_colors(request):
   """Carry over colors from last month to current month"""
   try:
@@ -889,54 +896,22 @@ def api_carry_over_colors(request):
     month = now.month
     
     # Check if this is the first session of the month
-    first_session_this_month = not StudySession.objects.filter(
-      user=request.user,
-      start_time__year=year,
-      start_time__month=month,
-      active=False
-    ).exists()
-    
-    if not first_session_this_month:
+    if not is_first_session_of_month(request.user, year, month):
       return JsonResponse({'error': 'Not the first session of the month'}, status=400)
-    
-    # Calculate last month
-    last_month = month - 1
-    last_year = year
-    if last_month == 0:
-      last_month = 12
-      last_year = year - 1
-    
+
     # Get last month's colors
-    last_month_colors = SubjectColor.objects.filter(
-      user=request.user,
-      year=last_year,
-      month=last_month
-    )
-    
-    if not last_month_colors.exists():
+    previous = SubjectColor.legend_for(request.user, *previous_month(year, month))
+    if not previous:
       return JsonResponse({'error': 'No colors to carry over from last month'}, status=400)
-    
-    # Copy colors to current month
-    carried_over_count = 0
-    for old_color in last_month_colors:
-      obj, created = SubjectColor.objects.get_or_create(
-        user=request.user,
-        subject=old_color.subject,
-        year=year,
-        month=month,
-        defaults={'color': old_color.color}
-      )
-      if created:
-        carried_over_count += 1
-    
+
+    # Copy colors to current month; subjects already set this month are kept
+    legend = SubjectColor.legend_for(request.user, year, month)
+    color_legend, carried_over_count = SubjectColor.carry_over(request.user, year, month, legend, previous)
+
     return JsonResponse({
       'success': True,
       'carried_over_count': carried_over_count,
-      'color_legend': {sc.subject: sc.color for sc in SubjectColor.objects.filter(
-        user=request.user,
-        year=year,
-        month=month
-      )}
+      'color_legend': color_legend,
     })
   except Exception as e:
     import traceback
@@ -946,6 +921,7 @@ def api_carry_over_colors(request):
 @login_required
 @csrf_exempt
 @require_http_methods(['GET', 'POST'])
+@cached_per_user
 def api_subject_colors(request):
   """Get or update subject color legend for current month"""
   try:
@@ -958,29 +934,10 @@ def api_subject_colors(request):
       get_last_month = request.GET.get('last_month', 'false').lower() == 'true'
       
       if get_last_month:
-        last_month = month - 1
-        last_year = year
-        if last_month == 0:
-          last_month = 12
-          last_year = year - 1
-        
-        subject_colors = SubjectColor.objects.filter(
-          user=request.user,
-          year=last_year,
-          month=last_month
-        )
+        color_legend = SubjectColor.legend_for(request.user, *previous_month(year, month))
       else:
-        subject_colors = SubjectColor.objects.filter(
-          user=request.user,
-          year=year,
-          month=month
-        )
-      
-      color_legend = {}
-      used_colors = set()
-      for sc in subject_colors:
-        color_legend[sc.subject] = sc.color
-        used_colors.add(sc.color)
+        color_legend = SubjectColor.legend_for(request.user, year, month)
+      used_colors = set(color_legend.values())
 
       return JsonResponse({
         'color_legend': color_legend,
@@ -991,43 +948,43 @@ def api_subject_colors(request):
       data = json.loads(request.body)
       color_legend = data.get('color_legend', {})
       subject_renames = data.get('subject_renames', {})  # Maps new_name -> old_name
-
-      # Handle subject renames first
-      for new_name, old_name in subject_renames.items():
-        if new_name != old_name:
-          # Update all StudySession records for this month
+      # old_name -> new_name; renames apply simultaneously
+      renames = {old_name: new_name for new_name, old_name in subject_renames.items() if new_name != old_name}
+      month_start, month_end = month_bounds(year, month)
+
+      with transaction.atomic():
+        # Handle subject renames first with one UPDATE; the legend rows are
+        # rewritten below, which also lets two subjects swap names
+        if renames:
+          renamed = Case(
+            *[When(subject=old_name, then=Value(new_name)) for old_name, new_name in renames.items()],
+            default=F('subject'),
+          )
           StudySession.objects.filter(
             user=request.user,
-            subject=old_name,
-            start_time__year=year,
-            start_time__month=month
-          ).update(subject=new_name)
-          
-          # Update SubjectColor
-          SubjectColor.objects.filter(
-            user=request.user,
-            subject=old_name,
-            year=year,
-            month=month
-          ).update(subject=new_name)
-      
-      # Update or create all subjects with their colors
-      new_subjects = set(color_legend.keys())
-      for subject, color in color_legend.items():
-        SubjectColor.objects.update_or_create(
+            subject__in=list(renames),
+            start_time__gte=month_start,
+            start_time__lt=month_end
+          ).update(subject=renamed)
+          DailyUserStats.rename_subjects(request.user, renames, month_start.date(), month_end.date())
+
+        # Upsert all subjects with their colors
+        SubjectColor.objects.bulk_create(
+          [
+            SubjectColor(user=request.user, subject=subject, year=year, month=month, color=color)
+            for subject, color in color_legend.items()
+          ],
+          update_conflicts=True,
+          unique_fields=['user', 'subject', 'year', 'month'],
+          update_fields=['color'],
+        )
+
+        # Delete subjects that are no longer in the legend
+        SubjectColor.objects.filter(
           user=request.user,
-          subject=subject,
           year=year,
-          month=month,
-          defaults={'color': color}
-        )
-      
-      # Delete subjects that are no longer in the legend
-      SubjectColor.objects.filter(
-        user=request.user,
-        year=year,
-        month=month
-      ).exclude(subject__in=new_subjects).delete()
+          month=month
+        ).exclude(subject__in=list(color_legend)).delete()
 
       return JsonResponse({'success': True})
   except Exception as e:
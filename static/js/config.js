@@ -41,21 +41,38 @@ let isInitialPageLoad = true;
 let quickCreateMode = null;
 
 // Initialize on page load
+// Load every dashboard section with one /api/bootstrap/ request
+async function loadDashboard() {
+  let data;
+  try {
+    const response = await fetch(`${API_BASE}/api/bootstrap/`);
+    if (!response.ok) {
+      throw new Error('Failed to fetch dashboard');
+    }
+    data = await response.json();
+  } catch (error) {
+    console.error('Error loading dashboard, loading sections one by one:', error);
+    data = {};
+  }
+
+  await loadUserProfile(data.profile);
+  loadTags(data.tags && { tags: data.tags });
+  loadHabits(data.habits);
+  loadTasks(data.tasks);
+  loadRecap(data.recap);
+  checkDailies(data.dailies);
+  loadStatSlots(data.stat_slots);
+  await checkActiveStudySession(data.study_session);
+}
+
 document.addEventListener('DOMContentLoaded', () => {
-  loadUserProfile();
-  loadTags();
-  loadHabits();
-  loadTasks();
-  loadRecap();
-  checkDailies();
-  loadStatSlots();
   setupEventListeners();
   updateHabitFilters();
   initializeColorPicker();
   loadSubjectColors();
   setupStudySubjectAutoColor();
 
-  checkActiveStudySession().then(() => {
+  loadDashboard().then(() => {
     // Update stats link after checking active session
     updateStudyStatsLink();
   });
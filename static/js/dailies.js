@@ -1,7 +1,7 @@
 // Daily Tasks Check Management
 
 // check dailies
-async function checkDailies() {
+async function checkDailies(prefetched = null) {
   try {
     const today = new Date().toDateString();
     const modalDismissed = localStorage.getItem('pendingItemsModalDismissed');
@@ -12,10 +12,9 @@ async function checkDailies() {
       return;
     }
     
-    const response = await fetch(`${API_BASE}/api/dailies/check`, {
+    const data = prefetched || await (await fetch(`${API_BASE}/api/dailies/check`, {
       method: 'GET',
-    });
-    const data = await response.json();
+    })).json();
 
     if (data.needs_check && (data.pending_dailies.length > 0 || data.pending_tasks.length > 0)) {
       // Filter to only show unchecked items
@@ -1,8 +1,14 @@
 // Habit Management
 
 // Load habits
-async function loadHabits() {
+async function loadHabits(prefetched = null) {
   try {
+    if (prefetched) {
+      // Unfiltered list from the bootstrap payload
+      habits = prefetched;
+      renderHabits();
+      return;
+    }
     let url = `${API_BASE}/api/habits/?filter=${habitFilter}`;
     if (searchQuery) {
       url += `&search=${encodeURIComponent(searchQuery)}`;
@@ -770,19 +770,18 @@ async function updateStudyStatsLink() {
   }
 }
 
-// check active study session
-async function checkActiveStudySession() {
+// check active study session (prefetched: the bootstrap payload)
+async function checkActiveStudySession(prefetched = null) {
   try {
-    // Always check for active session
-    const response = await fetch(`${API_BASE}/api/habits/study/stop/`, {
+    const response = prefetched ? null : await fetch(`${API_BASE}/api/habits/study/stop/`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
       },
     });
     
-    if (response.ok) {
-      const data = await response.json();
+    if (prefetched || response.ok) {
+      const data = prefetched || await response.json();
       if (data.active || data.has_active_session) {
         // Restore active session state
         activeStudySession = {
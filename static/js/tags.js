@@ -1,10 +1,9 @@
 // Tag management
 
-// Load tags
-async function loadTags() {
+// Load tags (or use the bootstrap payload)
+async function loadTags(prefetched = null) {
   try {
-    const response = await fetch(`${API_BASE}/api/tags/`);
-    const data = await response.json();
+    const data = prefetched || await (await fetch(`${API_BASE}/api/tags/`)).json();
     const seen = new Set();
     allTags = data.tags.filter(tag => {
       const normalized = tag.toLowerCase().trim();
@@ -1,8 +1,14 @@
 // Task Management
 
 // load tasks
-async function loadTasks() {
+async function loadTasks(prefetched = null) {
   try {
+    if (prefetched) {
+      // Unfiltered list from the bootstrap payload
+      tasks = prefetched;
+      renderTasks();
+      return;
+    }
     let url = `${API_BASE}/api/tasks/?filter=${taskFilter}`;
     if (searchQuery) {
       url += `&search=${encodeURIComponent(searchQuery)}`;
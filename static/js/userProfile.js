@@ -1,10 +1,9 @@
 // User Profile & Avatar Management
 
-// Load user profile
-async function loadUserProfile() {
+// Load user profile (or use the bootstrap payload)
+async function loadUserProfile(prefetched = null) {
   try {
-    const response = await fetch(`${API_BASE}/api/profile/`);
-    userProfile = await response.json();
+    userProfile = prefetched || await (await fetch(`${API_BASE}/api/profile/`)).json();
     updateUserProfile(isInitialPageLoad);
     isInitialPageLoad = false;
   } catch (error) {
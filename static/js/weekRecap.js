@@ -1,11 +1,11 @@
 // Week Recap & Stats Management
 
-// load recap
-async function loadRecap() {
+// load recap (prefetched: the bootstrap payload)
+async function loadRecap(prefetched = null) {
 
   if (!userProfile || !userProfile.user_id) {
     // Wait a bit for userProfile to load, then retry
-    setTimeout(loadRecap, 100);
+    setTimeout(() => loadRecap(prefetched), 100);
     return;
   }
   
@@ -54,11 +54,14 @@ async function loadRecap() {
   
   // Load new recap
   try {
-    const response = await fetch(`${API_BASE}/api/recap/`);
-    if (!response.ok) {
-      throw new Error('Failed to fetch recap');
+    let data = prefetched;
+    if (!data) {
+      const response = await fetch(`${API_BASE}/api/recap/`);
+      if (!response.ok) {
+        throw new Error('Failed to fetch recap');
+      }
+      data = await response.json();
     }
-    const data = await response.json();
     updateRecap(data);
     
     // Cache the recap for this week
@@ -187,11 +190,17 @@ function updateRecap(data) {
 }
 
 // load stat slots
-async function loadStatSlots() {
+async function loadStatSlots(prefetched = null) {
   try {
-    const response = await fetch(`${API_BASE}/api/stats/slots/`);
-    const data = await response.json();
+    const data = prefetched || await (await fetch(`${API_BASE}/api/stats/slots/`)).json();
     const slots = data.slots;
+
+    // All slot values in one request (the bootstrap payload already has them)
+    let values = data.values || {};
+    if (!prefetched && Object.values(slots).some(statType => statType)) {
+      const valuesResponse = await fetch(`${API_BASE}/api/stats/value/?slots=all`);
+      values = (await valuesResponse.json()).values || {};
+    }
     
     for (let slotNum = 1; slotNum <= 2; slotNum++) {
       const slot = document.getElementById(`statSlot${slotNum}`);
@@ -200,8 +209,7 @@ async function loadStatSlots() {
       const statType = slots[slotNum];
       if (statType) {
         try {
-          const valueResponse = await fetch(`${API_BASE}/api/stats/value/?type=${statType}`);
-          const valueData = await valueResponse.json();
+          const valueData = { value: values[statType] };
 
           const valueEl = slot.querySelector('.stat-value');
           const labelEl = slot.querySelector('.stat-label');
@@ -3,6 +3,7 @@ Django settings for tracktivity project.
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -66,9 +67,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds to wait for the write lock; reward paths take it at
+            # BEGIN (core.rewards.reward_transaction)
+            'timeout': 20,
+        },
+        # File-backed test database so concurrency tests get real SQLite
+        # locking; named per process so concurrent test runs stay apart
+        'TEST': {
+            'NAME': Path(tempfile.gettempdir()) / f'tracktivity_test_{os.getpid()}.sqlite3',
+        },
+    }
+}
+
+# Cache backend for the per-user response cache; set CACHE_BACKEND to e.g.
+# django.core.cache.backends.filebased.FileBasedCache or
+# django.core.cache.backends.memcached.PyMemcacheCache in production
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'tracktivity'),
     }
 }
 
+# Cache generation tokens, the active study session marker and the tag
+# registry version must be shared by every worker; per-process LocMem would
+# miss other workers' invalidations, so it is only trusted in DEBUG (tests
+# that need the cache turn it on with override_settings)
+RESPONSE_CACHE_ENABLED = (
+    CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+    or DEBUG
+)
+
+# Seconds a cached read response may live
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {